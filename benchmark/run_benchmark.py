@@ -0,0 +1,123 @@
+import click
+import json
+import mongomock
+import resource
+import time
+from benchmark.scene_generator import SceneGenerator
+from datetime import timedelta
+from dao import Dao
+from instrumentation import InstrumentedMongoClient
+from model import *
+from pymongo import MongoClient
+import rankings
+
+DEFAULT_REGION_NAME = 'bench'
+
+class Benchmark(object):
+    def __init__(self, mongo_client):
+        self.mongo_client = InstrumentedMongoClient(mongo_client)
+        self.results = {}
+
+    def run(self, name, func, *args, **kwargs):
+        self.mongo_client.stats.reset()
+
+        start = time.time()
+        result = func(*args, **kwargs)
+        wall_time = time.time() - start
+
+        self.results[name] = self.mongo_client.stats.get_json_dict()
+        self.results[name]['wall_time'] = wall_time
+        # high water mark of the whole process so far, in kilobytes on linux
+        self.results[name]['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        return result
+
+def import_tournaments(dao, scene_generator, num_tournaments, date):
+    for i in xrange(num_tournaments):
+        scraper = scene_generator.generate_scraper(date + timedelta(days=i))
+        player_map = dao.get_player_id_map_from_player_aliases(scraper.get_players())
+        dao.insert_tournament(Tournament.from_scraper('synthetic', scraper, player_map, dao.region_id))
+
+def get_endpoints(dao):
+    region_id = dao.region_id
+    tournament = dao.get_all_tournaments(regions=[region_id])[-1]
+
+    # the top two ranked players have the most history
+    ranking = dao.get_latest_ranking().ranking
+    player_id = ranking[0].player
+    opponent_id = ranking[1].player
+
+    return [
+        ('get_regions', '/regions'),
+        ('get_players', '/%s/players' % region_id),
+        ('get_player', '/%s/players/%s' % (region_id, player_id)),
+        ('get_tournaments', '/%s/tournaments' % region_id),
+        ('get_tournament', '/%s/tournaments/%s' % (region_id, tournament.id)),
+        ('get_rankings', '/%s/rankings' % region_id),
+        ('get_matches', '/%s/matches/%s' % (region_id, player_id)),
+        ('get_matches_head_to_head', '/%s/matches/%s?opponent=%s' % (region_id, player_id, opponent_id)),
+    ]
+
+@click.command()
+@click.option('--players', '-p', help='Number of players in the region', default=200)
+@click.option('--tournaments-per-week', '-t', help='Tournaments per week', default=2)
+@click.option('--bracket-size', '-b', help='Entrants per tournament', default=32)
+@click.option('--years', '-y', help='Years of tournament history', default=2.0)
+@click.option('--seed', '-s', help='Random seed for the synthetic region', default=0)
+@click.option('--region', '-r', help='Id of the synthetic region, must not exist yet', default=DEFAULT_REGION_NAME)
+@click.option('--mongo-url', '-m', help='Benchmark against a scratch mongod instead of mongomock')
+@click.option('--skip-endpoints', help="Don't benchmark the API endpoints", is_flag=True)
+@click.option('--output', '-o', help='Write the JSON report to this file instead of stdout')
+def run_benchmark(players, tournaments_per_week, bracket_size, years, seed, region, mongo_url, skip_endpoints, output):
+    # the server always reads the default database, so the synthetic region lives there too
+    if mongo_url:
+        mongo_client = MongoClient(host=mongo_url)
+        if region in [r.id for r in Dao.get_all_regions(mongo_client)]:
+            raise click.UsageError('Region %s already exists, pick another --region' % region)
+    else:
+        mongo_client = mongomock.MongoClient()
+
+    benchmark = Benchmark(mongo_client)
+    scene_generator = SceneGenerator(
+            num_players=players,
+            tournaments_per_week=tournaments_per_week,
+            bracket_size=bracket_size,
+            years=years,
+            seed=seed)
+
+    dao = benchmark.run('generate_scene', scene_generator.generate, benchmark.mongo_client, region)
+
+    now = scene_generator.start_date + timedelta(days=int(365 * years))
+    progress = rankings.RankingProgress()
+    benchmark.run('generate_ranking', rankings.generate_ranking, dao, now=now, progress=progress)
+    benchmark.results['generate_ranking']['phases'] = progress.get_json_dict()['phases']
+
+    if not skip_endpoints:
+        # server reads its config on import, so only pull it in when the endpoints are benchmarked
+        import server
+        server.mongo_client = benchmark.mongo_client
+        app = server.app.test_client()
+
+        for name, url in get_endpoints(dao):
+            response = benchmark.run(name, app.get, url)
+            benchmark.results[name]['response_bytes'] = len(response.data)
+
+    benchmark.run('import_tournaments', import_tournaments, dao, scene_generator, 10, now)
+
+    all_players = dao.get_all_players()
+    benchmark.run('merge_players', dao.merge_players, source=all_players[-1], target=all_players[0])
+
+    report = {}
+    report['scene'] = scene_generator.get_json_dict()
+    report['backend'] = 'mongod' if mongo_url else 'mongomock'
+    report['results'] = benchmark.results
+
+    report_json = json.dumps(report, indent=4, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(report_json)
+    else:
+        click.echo(report_json)
+
+if __name__ == '__main__':
+    run_benchmark()
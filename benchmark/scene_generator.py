@@ -0,0 +1,138 @@
+from dao import Dao, DATABASE_NAME
+from model import *
+from datetime import datetime, timedelta
+import math
+import random
+
+DEFAULT_START_DATE = datetime(2012, 1, 7)
+SKILL_SCALE = 4.0
+
+class SyntheticScraper(object):
+    '''Quacks like TioScraper/ChallongeScraper so synthetic brackets go through Tournament.from_scraper.'''
+    def __init__(self, name, date, matches):
+        '''
+        :param name: string
+        :param date: datetime
+        :param matches: list of MatchResults that use player aliases
+        '''
+        self.name = name
+        self.date = date
+        self.matches = matches
+
+    def get_raw(self):
+        return '\n'.join(str(m) for m in self.matches)
+
+    def get_name(self):
+        return self.name
+
+    def get_date(self):
+        return self.date
+
+    def get_matches(self):
+        return [MatchResult(winner=m.winner, loser=m.loser) for m in self.matches]
+
+    def get_players(self):
+        players = set()
+        for match in self.matches:
+            players.add(match.winner)
+            players.add(match.loser)
+
+        return list(players)
+
+class SceneGenerator(object):
+    def __init__(self, num_players=200, tournaments_per_week=2, bracket_size=32, years=2, seed=0,
+                 start_date=DEFAULT_START_DATE):
+        self.num_players = num_players
+        self.tournaments_per_week = tournaments_per_week
+        self.bracket_size = min(bracket_size, num_players)
+        self.years = years
+        self.start_date = start_date
+
+        self.random = random.Random(seed)
+        self.aliases = ['player%d' % i for i in xrange(num_players)]
+        self.skills = dict((alias, self.random.gauss(0, SKILL_SCALE)) for alias in self.aliases)
+        self.num_generated = 0
+
+    def get_num_tournaments(self):
+        return int(self.years * 52 * self.tournaments_per_week)
+
+    def _play(self, player_1, player_2):
+        '''Returns (winner, loser), the stronger player wins more often.'''
+        p_player_1_wins = 1.0 / (1.0 + math.exp(self.skills[player_2] - self.skills[player_1]))
+        if self.random.random() < p_player_1_wins:
+            return player_1, player_2
+        else:
+            return player_2, player_1
+
+    def _play_round(self, players, matches):
+        '''Pairs off players, returns (advancing players, eliminated players).'''
+        advancing = []
+        eliminated = []
+
+        for i in xrange(0, len(players) - 1, 2):
+            winner, loser = self._play(players[i], players[i + 1])
+            matches.append(MatchResult(winner=winner, loser=loser))
+            advancing.append(winner)
+            eliminated.append(loser)
+
+        # odd player out gets a bye
+        if len(players) % 2 == 1:
+            advancing.append(players[-1])
+
+        return advancing, eliminated
+
+    def generate_matches(self, entrants):
+        '''Approximates a double elimination bracket: a winners bracket, a losers bracket and grand finals.'''
+        matches = []
+        winners = list(entrants)
+        losers = []
+
+        while len(winners) > 1:
+            winners, eliminated = self._play_round(winners, matches)
+            losers.extend(eliminated)
+
+        while len(losers) > 1:
+            losers, eliminated = self._play_round(losers, matches)
+
+        if winners and losers:
+            winner, loser = self._play(winners[0], losers[0])
+            matches.append(MatchResult(winner=winner, loser=loser))
+
+        return matches
+
+    def generate_scraper(self, date):
+        entrants = self.random.sample(self.aliases, self.bracket_size)
+        name = 'synthetic tournament %d' % self.num_generated
+        self.num_generated += 1
+
+        return SyntheticScraper(name, date, self.generate_matches(entrants))
+
+    def generate_scrapers(self):
+        days_between_tournaments = 7.0 / self.tournaments_per_week
+        for i in xrange(self.get_num_tournaments()):
+            yield self.generate_scraper(self.start_date + timedelta(days=i * days_between_tournaments))
+
+    def generate(self, mongo_client, region_id, database_name=DATABASE_NAME):
+        '''Inserts the region, its players and its tournament history. Returns the region's Dao.'''
+        Dao.insert_region(Region(region_id, region_id), mongo_client, database_name=database_name)
+        dao = Dao(region_id, mongo_client, database_name=database_name)
+
+        player_alias_to_player_id_map = {}
+        for alias in self.aliases:
+            player_alias_to_player_id_map[alias] = dao.insert_player(Player.create_with_default_values(alias, region_id))
+
+        for scraper in self.generate_scrapers():
+            dao.insert_tournament(Tournament.from_scraper('synthetic', scraper, player_alias_to_player_id_map, region_id))
+
+        return dao
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        json_dict['num_players'] = self.num_players
+        json_dict['tournaments_per_week'] = self.tournaments_per_week
+        json_dict['bracket_size'] = self.bracket_size
+        json_dict['years'] = self.years
+        json_dict['num_tournaments'] = self.get_num_tournaments()
+
+        return json_dict
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from dao import Dao, DATABASE_NAME
+import threading
+import time
+
+class RegionVersions(object):
+    '''A process's copy of every region's data version (see Dao.bump_region_versions). They're all read again,
+    in one query, at most every check_seconds, so a write made by any process is seen within about check_seconds.'''
+    def __init__(self, check_seconds, database_name=DATABASE_NAME):
+        self.check_seconds = check_seconds
+        self.database_name = database_name
+        self.lock = threading.Lock()
+        self.versions = {}
+        self.checked = None
+
+    def expire(self):
+        '''Makes the next get_version read the versions again.'''
+        with self.lock:
+            self.checked = None
+
+    def get_version(self, mongo_client, region_id, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            if self.checked is None or now - self.checked >= self.check_seconds:
+                self.versions = Dao.get_region_versions(mongo_client, database_name=self.database_name)
+                self.checked = now
+
+            return self.versions.get(region_id, 0)
+
+class RegionCache(object):
+    '''Caches values built from a region's data, keyed by region and key. A value is built again once its
+    region's version has moved. Holds at most max_entries values, the least recently used go first.'''
+    def __init__(self, region_versions, max_entries=None):
+        self.region_versions = region_versions
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, mongo_client, region_id, key, build, now=None):
+        '''Returns the cached value, or calls build() to make it.'''
+        # read before the data, so a write made while building moves the version past the value's
+        version = self.region_versions.get_version(mongo_client, region_id, now=now)
+
+        with self.lock:
+            entry = self.entries.pop((region_id, key), None)
+            if entry is not None and entry[0] == version:
+                self.entries[(region_id, key)] = entry
+                return entry[1]
+
+        value = build()
+
+        with self.lock:
+            self.entries[(region_id, key)] = (version, value)
+            if self.max_entries is not None and len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return value
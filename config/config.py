@@ -2,6 +2,11 @@ from ConfigParser import ConfigParser
 
 DEFAULT_CONFIG_PATH = 'config/config.ini'
 
+# pymongo's own default
+DEFAULT_MAX_POOL_SIZE = 100
+
+DEFAULT_CACHE_CHECK_SECONDS = 5
+
 class Config(object):
     def __init__(self, config_file_path=DEFAULT_CONFIG_PATH):
         self.config = ConfigParser()
@@ -26,6 +31,44 @@ class Config(object):
     def get_db_password(self):
         return self.config.get('database', 'password')
 
+    def get_db_max_pool_size(self):
+        '''Most connections each process keeps open to mongo.'''
+        if not self.config.has_option('database', 'max_pool_size'):
+            return DEFAULT_MAX_POOL_SIZE
+
+        return self.config.getint('database', 'max_pool_size')
+
+    def get_db_timeouts_ms(self):
+        '''Returns a dict of the connect_timeout_ms, socket_timeout_ms and wait_queue_timeout_ms options that
+        are set. Unset ones are left to pymongo's defaults.'''
+        timeouts = {}
+        for option in ('connect_timeout_ms', 'socket_timeout_ms', 'wait_queue_timeout_ms'):
+            if self.config.has_option('database', option):
+                timeouts[option] = self.config.getint('database', option)
+
+        return timeouts
+
+    def get_snapshots_enabled(self):
+        '''Whether GET requests are served from in-memory region snapshots, see snapshot.py.'''
+        if not self.config.has_option('snapshots', 'enabled'):
+            return False
+
+        return self.config.getboolean('snapshots', 'enabled')
+
+    def get_cache_check_seconds(self):
+        '''How often a worker checks whether the regions it has cached (snapshots or responses) have changed.'''
+        if not self.config.has_option('cache', 'check_seconds'):
+            return DEFAULT_CACHE_CHECK_SECONDS
+
+        return self.config.getfloat('cache', 'check_seconds')
+
+    def get_response_cache_enabled(self):
+        '''Whether the responses of region scoped GET requests are cached, see server.get_cached_response.'''
+        if not self.config.has_option('cache', 'responses'):
+            return False
+
+        return self.config.getboolean('cache', 'responses')
+
     def get_challonge_api_key(self):
         return self.config.get('challonge', 'api_key')
 
@@ -1,8 +1,17 @@
 from pymongo import MongoClient, DESCENDING
 from bson.objectid import ObjectId
-from datetime import datetime, timedelta
+from bson.binary import Binary
+from bson.son import SON
+from datetime import datetime
 from model import *
+from replay import ColumnarReplay
+import copy
+import inspect
+import json
+import os
+import threading
 import trueskill
+import zlib
 
 DEFAULT_RATING = TrueskillRating()
 DATABASE_NAME = 'garpr'
@@ -11,6 +20,17 @@ TOURNAMENTS_COLLECTION_NAME = 'tournaments'
 RANKINGS_COLLECTION_NAME = 'rankings'
 REGIONS_COLLECTION_NAME = 'regions'
 USERS_COLLECTION_NAME = 'users'
+RAW_FILES_COLLECTION_NAME = 'raw_files'
+RATING_DELTAS_COLLECTION_NAME = 'rating_deltas'
+RATING_HISTORIES_COLLECTION_NAME = 'rating_histories'
+DIRTY_REGIONS_COLLECTION_NAME = 'dirty_regions'
+RATING_CHECKPOINTS_COLLECTION_NAME = 'rating_checkpoints'
+REGION_VERSIONS_COLLECTION_NAME = 'region_versions'
+
+RAW_COMPRESSION_LEVEL = 9
+
+# how many tournament documents the cursor fetches per round trip when streaming
+TOURNAMENT_BATCH_SIZE = 100
 
 class RegionNotFoundException(Exception):
     pass
@@ -24,23 +44,163 @@ class InvalidNameException(Exception):
 class UpdateTournamentException(Exception):
     pass
 
+def compress_raw(raw):
+    '''Returns a raw_files document for a tio xml string or a challonge dict of api responses.'''
+    if isinstance(raw, dict):
+        format = 'json'
+        data = json.dumps(raw)
+    else:
+        format = 'text'
+        data = raw.encode('utf-8') if isinstance(raw, unicode) else raw
+
+    return {
+        'format': format,
+        'encoding': 'zlib',
+        'data': Binary(zlib.compress(data, RAW_COMPRESSION_LEVEL))
+    }
+
+def decompress_raw(json_dict):
+    data = zlib.decompress(json_dict['data']).decode('utf-8')
+
+    if json_dict['format'] == 'json':
+        return json.loads(data)
+    else:
+        return data
+
+def has_bulk_api(collection):
+    '''pymongo collections have the bulk api, mongomock's don't: looking it up there gives back a sub collection
+    rather than a method.'''
+    return inspect.ismethod(getattr(collection, 'initialize_unordered_bulk_op', None))
+
+def replace_documents(collection, json_dicts):
+    '''Replaces each document with the one with the same _id, in a single bulk write if the collection has the
+    bulk api, otherwise one update per document.'''
+    if not json_dicts:
+        return
+
+    if not has_bulk_api(collection):
+        for json_dict in json_dicts:
+            collection.update({'_id': json_dict['_id']}, json_dict)
+        return
+
+    bulk = collection.initialize_unordered_bulk_op()
+    for json_dict in json_dicts:
+        bulk.find({'_id': json_dict['_id']}).replace_one(json_dict)
+    return bulk.execute()
+
+def apply_update(json_dict, update):
+    '''Applies the $set, $addToSet and $pull operators of update to json_dict the same way mongo does, so the
+    document after an update can be worked out from the one before it.'''
+    for field, value in update.get('$set', {}).iteritems():
+        json_dict[field] = value
+
+    for field, value in update.get('$addToSet', {}).iteritems():
+        values = json_dict.setdefault(field, [])
+        if not value in values:
+            values.append(value)
+
+    for field, value in update.get('$pull', {}).iteritems():
+        json_dict[field] = [v for v in json_dict.get(field, []) if v != value]
+
+    return json_dict
+
+def get_regions(json_dicts):
+    '''Returns the ids of every region the player or tournament documents are in.'''
+    regions = set()
+    for json_dict in json_dicts:
+        regions.update(json_dict.get('regions', []))
+
+    return list(regions)
+
+class LazyMongoClient(object):
+    '''Stands in for a MongoClient, which is made by calling factory the first time it's used in each process.
+    pymongo's connection pool can't be shared across a fork, so a client made at import time, before the WSGI
+    server forks its workers, would hand the same sockets to every worker.'''
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.pid = None
+        self.mongo_client = None
+
+    def get_mongo_client(self):
+        pid = os.getpid()
+        if self.pid != pid:
+            with self.lock:
+                if self.pid != pid:
+                    self.mongo_client = self.factory()
+                    self.pid = pid
+
+        return self.mongo_client
+
+    def __getitem__(self, database_name):
+        return self.get_mongo_client()[database_name]
+
+    def __getattr__(self, name):
+        return getattr(self.get_mongo_client(), name)
+
+class DaoSession(object):
+    '''An identity map and unit of work shared by the Daos of one request. Each player and tournament is
+    loaded at most once and the same object is handed out every time after that. Player updates are held
+    until flush, which writes them all in one bulk write.'''
+    def __init__(self, mongo_client, database_name=DATABASE_NAME):
+        self.mongo_client = mongo_client
+        self.database_name = database_name
+        self.players_col = mongo_client[database_name][PLAYERS_COLLECTION_NAME]
+        self.players = {}
+        self.tournaments = {}
+        self.pending_players = {}
+
+    def flush(self):
+        '''Writes every pending player update, returns the number of players written.'''
+        players = self.pending_players.values()
+        self.pending_players = {}
+        if not players:
+            return 0
+
+        # the old documents tell which regions the players were in before
+        json_dicts = [p.get_json_dict() for p in players]
+        old_json_dicts = list(self.players_col.find({'_id': {'$in': [p.id for p in players]}}, {'regions': 1}))
+        replace_documents(self.players_col, json_dicts)
+        Dao.bump_region_versions(self.mongo_client, get_regions(json_dicts + old_json_dicts),
+                                 database_name=self.database_name)
+
+        return len(players)
+
 #TODO create RegionSpecificDao object
 class Dao(object):
-    def __init__(self, region_id, mongo_client, database_name=DATABASE_NAME):
+    def __init__(self, region_id, mongo_client, database_name=DATABASE_NAME, session=None):
         self.mongo_client = mongo_client
         self.region_id = region_id
+        self.database_name = database_name
+        self.session = session
 
-        if not region_id in [r.id for r in Dao.get_all_regions(self.mongo_client, database_name=database_name)]:
+        regions = dict((r.id, r) for r in Dao.get_all_regions(self.mongo_client, database_name=database_name))
+        if not region_id in regions:
             raise RegionNotFoundException("%s is not a valid region id!" % region_id)
 
+        # a composite region is ranked from its members' tournaments and players
+        self.region_ids = regions[region_id].members or [region_id]
+
         self.players_col = mongo_client[database_name][PLAYERS_COLLECTION_NAME]
         self.tournaments_col = mongo_client[database_name][TOURNAMENTS_COLLECTION_NAME]
         self.rankings_col = mongo_client[database_name][RANKINGS_COLLECTION_NAME]
         self.users_col = mongo_client[database_name][USERS_COLLECTION_NAME]
+        self.raw_files_col = mongo_client[database_name][RAW_FILES_COLLECTION_NAME]
+        self.rating_deltas_col = mongo_client[database_name][RATING_DELTAS_COLLECTION_NAME]
+        self.rating_histories_col = mongo_client[database_name][RATING_HISTORIES_COLLECTION_NAME]
+        self.dirty_regions_col = mongo_client[database_name][DIRTY_REGIONS_COLLECTION_NAME]
+        self.rating_checkpoints_col = mongo_client[database_name][RATING_CHECKPOINTS_COLLECTION_NAME]
+
+        # pymongo caches this, so it only reaches the server the first time
+        self.tournaments_col.ensure_index([('regions', 1), ('date', 1)])
+        self.rating_histories_col.ensure_index([('region', 1), ('player', 1), ('date', 1)])
 
     @classmethod
     def insert_region(cls, region, mongo_client, database_name=DATABASE_NAME):
-        return mongo_client[database_name][REGIONS_COLLECTION_NAME].insert(region.get_json_dict())
+        id = mongo_client[database_name][REGIONS_COLLECTION_NAME].insert(region.get_json_dict())
+        cls.bump_region_versions(mongo_client, [region.id], database_name=database_name)
+
+        return id
 
     # sorted by display name
     @classmethod
@@ -48,20 +208,119 @@ class Dao(object):
         regions = [Region.from_json(r) for r in mongo_client[database_name][REGIONS_COLLECTION_NAME].find()]
         return sorted(regions, key=lambda r: r.display_name)
 
+    @classmethod
+    def _add_composite_regions(cls, mongo_client, regions, database_name=DATABASE_NAME):
+        '''Returns the set of regions plus every composite region with one of them as a member. Composite regions
+        are ranked from their members' tournaments, so they go stale with them.'''
+        regions = set(regions)
+        regions.update(r['_id'] for r in mongo_client[database_name][REGIONS_COLLECTION_NAME].find(
+            {'members': {'$in': list(regions)}}, {'_id': 1}))
+
+        return regions
+
+    @classmethod
+    def bump_region_versions(cls, mongo_client, regions, database_name=DATABASE_NAME):
+        '''Increments the data version of regions (a list of region ids) and the composite regions they're in.
+        Anything cached from a region is stale once its version moves, see cache.py.
+
+        Every write to data a response is built from bumps the versions of the regions it touches, after the
+        write. Caches read the version before the data, so whatever they hold is never newer than its version
+        and a write can't be missed.'''
+        if not regions:
+            return
+
+        region_versions_col = mongo_client[database_name][REGION_VERSIONS_COLLECTION_NAME]
+        for region in cls._add_composite_regions(mongo_client, regions, database_name=database_name):
+            region_versions_col.update({'_id': region}, {'$inc': {'version': 1}}, upsert=True)
+
+    @classmethod
+    def get_region_versions(cls, mongo_client, database_name=DATABASE_NAME):
+        '''Returns a map from region id to data version, for every region that has been bumped.'''
+        return dict((v['_id'], v['version']) for v in mongo_client[database_name][REGION_VERSIONS_COLLECTION_NAME].find())
+
+    @classmethod
+    def get_region_version(cls, mongo_client, region_id, database_name=DATABASE_NAME):
+        '''Returns the region's data version, 0 if it has never been bumped.'''
+        json_dict = mongo_client[database_name][REGION_VERSIONS_COLLECTION_NAME].find_one({'_id': region_id})
+        return json_dict['version'] if json_dict else 0
+
+    @classmethod
+    def mark_regions_dirty(cls, mongo_client, regions, since=None, database_name=DATABASE_NAME):
+        '''Records that the rankings of regions (a list of region ids) are stale. since is the earliest
+        tournament date affected, marks keep the earliest date they've been given. Pass since=None if the
+        ratings are unaffected and only the ranking list needs rebuilding.'''
+        dirty_regions_col = mongo_client[database_name][DIRTY_REGIONS_COLLECTION_NAME]
+        now = datetime.now()
+
+        # the edits behind the mark can change which players and tournaments are in the regions
+        cls.bump_region_versions(mongo_client, regions, database_name=database_name)
+
+        for region in cls._add_composite_regions(mongo_client, regions, database_name=database_name):
+            dirty_regions_col.update({'_id': region}, {'$set': {'updated': now}}, upsert=True)
+
+            # only ever move since earlier, so concurrent marks can't lose the earliest date
+            if since:
+                dirty_regions_col.update(
+                        {'_id': region, '$or': [{'since': {'$exists': False}}, {'since': {'$gt': since}}]},
+                        {'$set': {'since': since}})
+
+    @classmethod
+    def get_dirty_regions(cls, mongo_client, database_name=DATABASE_NAME):
+        return [DirtyRegion.from_json(d) for d in mongo_client[database_name][DIRTY_REGIONS_COLLECTION_NAME].find()]
+
+    def clear_dirty(self, dirty_region):
+        '''Clears the mark for this region, unless it was marked again after dirty_region was read.'''
+        return self.dirty_regions_col.remove({'_id': self.region_id, 'updated': dirty_region.updated})
+
+    def _load_player(self, json_dict):
+        '''Returns the session's copy of the player if it has one, so changes made earlier in the request
+        are kept. Otherwise builds the player and adds it to the session.'''
+        if json_dict is None or self.session is None:
+            return Player.from_json(json_dict)
+
+        player = self.session.players.get(json_dict['_id'])
+        if player is None:
+            player = Player.from_json(json_dict)
+            self.session.players[player.id] = player
+
+        return player
+
+    def _autoflush(self):
+        '''Queries that match on anything but _id must see the pending player updates.'''
+        if self.session is not None and self.session.pending_players:
+            self.session.flush()
+
     def get_player_by_id(self, id):
         '''id must be an ObjectId'''
-        return Player.from_json(self.players_col.find_one({'_id': id}))
+        if self.session is not None and id in self.session.players:
+            return self.session.players[id]
+
+        return self._load_player(self.players_col.find_one({'_id': id}))
+
+    def get_players_by_ids(self, ids):
+        '''ids must be a list of ObjectIds. Fetches all the players in a single query.'''
+        players = []
+        if self.session is not None:
+            players = [self.session.players[id] for id in ids if id in self.session.players]
+            ids = [id for id in ids if not id in self.session.players]
+
+        if ids:
+            players.extend(self._load_player(p) for p in self.players_col.find({'_id': {'$in': ids}}))
+
+        return players
 
     def get_player_by_alias(self, alias):
         '''Converts alias to lowercase'''
-        return Player.from_json(self.players_col.find_one({
+        self._autoflush()
+        return self._load_player(self.players_col.find_one({
             'aliases': {'$in': [alias.lower()]}, 
-            'regions': {'$in': [self.region_id]}
+            'regions': {'$in': self.region_ids}
         }))
 
     def get_players_by_alias_from_all_regions(self, alias):
         '''Converts alias to lowercase'''
-        return [Player.from_json(p) for p in self.players_col.find({'aliases': {'$in': [alias.lower()]}})]
+        self._autoflush()
+        return [self._load_player(p) for p in self.players_col.find({'aliases': {'$in': [alias.lower()]}})]
 
     def get_player_id_map_from_player_aliases(self, aliases):
         '''Given a list of player aliases, returns a map that maps player aliases -> player ids for the current
@@ -80,23 +339,104 @@ class Dao(object):
 
     def get_all_players(self, all_regions=False):
         '''Sorts by name in lexographical order.'''
+        self._autoflush()
         if all_regions:
-            return [Player.from_json(p) for p in self.players_col.find().sort([('name', 1)])]
+            return [self._load_player(p) for p in self.players_col.find().sort([('name', 1)])]
         else:
-            return [Player.from_json(p) for p in self.players_col.find({'regions': {'$in': [self.region_id]}}).sort([('name', 1)])]
+            return [self._load_player(p) for p in self.players_col.find({'regions': {'$in': self.region_ids}}).sort([('name', 1)])]
+
+    def get_players_in_regions(self, regions):
+        '''Returns the players in any of regions (a list of region ids).'''
+        self._autoflush()
+        return [self._load_player(p) for p in self.players_col.find({'regions': {'$in': regions}})]
+
+    def get_players_page(self, limit, after=None):
+        '''Returns up to limit players in the region (in any of its members for a composite region), sorted by
+        name and then id. after is the (name, id) of
+        the last player on the previous page, the page starts right after it.'''
+        self._autoflush()
+        query_list = [{'regions': {'$in': self.region_ids}}]
+
+        if after:
+            name, id = after
+            query_list.append({'$or': [{'name': {'$gt': name}}, {'name': name, '_id': {'$gt': id}}]})
+
+        players = self.players_col.find({'$and': query_list}).sort([('name', 1), ('_id', 1)]).limit(limit)
+        return [self._load_player(p) for p in players]
+
+    def _bump_versions(self, regions):
+        Dao.bump_region_versions(self.mongo_client, regions, database_name=self.database_name)
 
     def insert_player(self, player):
-        return self.players_col.insert(player.get_json_dict())
+        id = self.players_col.insert(player.get_json_dict())
+        self._bump_versions(player.regions)
+
+        return id
 
     def delete_player(self, player):
-        return self.players_col.remove({'_id': player.id})
+        if self.session is not None:
+            self.session.players.pop(player.id, None)
+            self.session.pending_players.pop(player.id, None)
+
+        result = self.players_col.remove({'_id': player.id})
+        self._bump_versions(player.regions)
+
+        return result
 
     def update_player(self, player):
-        return self.players_col.update({'_id': player.id}, player.get_json_dict())
+        '''With a session the write is held until the session is flushed.'''
+        if self.session is not None:
+            self.session.players[player.id] = player
+            self.session.pending_players[player.id] = player
+            return
+
+        # the old document tells which regions the player was in before
+        old_json_dict = self.players_col.find_and_modify(
+                query={'_id': player.id}, update=player.get_json_dict(), fields={'regions': 1})
+        self._bump_versions(get_regions([player.get_json_dict()] + ([old_json_dict] if old_json_dict else [])))
 
-    # TODO bulk update
     def update_players(self, players):
-        pass
+        '''Writes all the players in one bulk write.'''
+        if self.session is not None:
+            for player in players:
+                self.update_player(player)
+            return
+
+        json_dicts = [p.get_json_dict() for p in players]
+        result = replace_documents(self.players_col, json_dicts)
+        self._bump_versions(get_regions(json_dicts))
+
+        return result
+
+    def _modify_player(self, id, update):
+        '''Applies update to the player in a single find_and_modify. Returns (json_dict, changed), the player's
+        document after the update (None if there's no such player) and whether the update changed it.'''
+        # a pending replacement of the player would undo the update once it's flushed
+        self._autoflush()
+
+        old_json_dict = self.players_col.find_and_modify(query={'_id': id}, update=update)
+        if old_json_dict is None:
+            return None, False
+
+        json_dict = apply_update(copy.deepcopy(old_json_dict), update)
+        if self.session is not None:
+            self.session.players.pop(id, None)
+
+        changed = json_dict != old_json_dict
+        if changed:
+            self._bump_versions(get_regions([old_json_dict, json_dict]))
+
+        return json_dict, changed
+
+    def add_region_to_player(self, id, region):
+        '''Returns (player, changed), changed is False if the player was already in the region.'''
+        json_dict, changed = self._modify_player(id, {'$addToSet': {'regions': region}})
+        return self._load_player(json_dict), changed
+
+    def remove_region_from_player(self, id, region):
+        '''Returns (player, changed), changed is False if the player wasn't in the region.'''
+        json_dict, changed = self._modify_player(id, {'$pull': {'regions': region}})
+        return self._load_player(json_dict), changed
 
     def add_alias_to_player(self, player, alias):
         lowercase_alias = alias.lower()
@@ -104,9 +444,12 @@ class Dao(object):
         if lowercase_alias in player.aliases:
             raise DuplicateAliasException('%s is already an alias for %s!' % (alias, player.name))
 
-        player.aliases.append(lowercase_alias)
+        json_dict, changed = self._modify_player(player.id, {'$addToSet': {'aliases': lowercase_alias}})
+        if json_dict is not None and not changed:
+            # someone else added it since player was read
+            raise DuplicateAliasException('%s is already an alias for %s!' % (alias, player.name))
 
-        return self.update_player(player)
+        player.aliases.append(lowercase_alias)
 
     def update_player_name(self, player, name):
         # ensure this name is already an alias
@@ -115,17 +458,121 @@ class Dao(object):
                     'Player %s does not have %s as an alias already, cannot change name.' 
                     % (player, name))
 
+        self._modify_player(player.id, {'$set': {'name': name}})
         player.name = name
-        return self.update_player(player)
+
+    @classmethod
+    def offload_raw_payloads(cls, mongo_client, database_name=DATABASE_NAME):
+        '''Moves inline raw fields from the tournaments collection into the compressed raw_files collection.
+        Returns the number of tournaments migrated.'''
+        tournaments_col = mongo_client[database_name][TOURNAMENTS_COLLECTION_NAME]
+        raw_files_col = mongo_client[database_name][RAW_FILES_COLLECTION_NAME]
+
+        count = 0
+        for tournament_id in [t['_id'] for t in tournaments_col.find({'raw': {'$exists': True}}, {'_id': 1})]:
+            raw = tournaments_col.find_one({'_id': tournament_id}, {'raw': 1})['raw']
+            raw_id = raw_files_col.insert(compress_raw(raw))
+            tournaments_col.update({'_id': tournament_id}, {'$set': {'raw_id': raw_id}, '$unset': {'raw': ''}})
+            count += 1
+
+        return count
+
+    def get_raw_by_id(self, id):
+        '''id must be an ObjectId'''
+        raw_file = self.raw_files_col.find_one({'_id': id})
+        if raw_file is None:
+            return None
+
+        return decompress_raw(raw_file)
+
+    def _save_raw(self, tournament):
+        raw_file = compress_raw(tournament.raw)
+
+        if tournament.raw_id:
+            raw_file['_id'] = tournament.raw_id
+            self.raw_files_col.save(raw_file)
+        else:
+            tournament.raw_id = self.raw_files_col.insert(raw_file)
+
+    def _get_tournament_json_dict_without_raw(self, tournament):
+        json_dict = tournament.get_json_dict()
+        del json_dict['raw']
+        return json_dict
 
     def insert_tournament(self, tournament):
-        return self.tournaments_col.insert(tournament.get_json_dict())
+        '''The raw payload is stored compressed in its own collection and referenced by raw_id.'''
+        if tournament.raw:
+            self._save_raw(tournament)
+
+        json_dict = self._get_tournament_json_dict_without_raw(tournament)
+        if not tournament.raw:
+            # there's nothing to compress, an empty raw is stored inline like an unmigrated tournament's
+            json_dict['raw'] = ''
+
+        id = self.tournaments_col.insert(json_dict)
+        self._bump_tournament_versions([json_dict])
+
+        return id
+
+    def _bump_tournament_versions(self, json_dicts):
+        '''Bumps the regions the tournaments are in, and their players' regions, since a region snapshot holds
+        every tournament its players played in.'''
+        player_ids = set()
+        for json_dict in json_dicts:
+            player_ids.update(json_dict.get('players', []))
+
+        players = self.players_col.find({'_id': {'$in': list(player_ids)}}, {'regions': 1})
+        self._bump_versions(get_regions(json_dicts + list(players)))
 
     def update_tournament(self, tournament):
         if len(tournament.raw) == 0:
             raise UpdateTournamentException("Can't update a tournament with an empty 'raw' field because it will be overwritten!")
 
-        return self.tournaments_col.update({'_id': tournament.id}, tournament.get_json_dict())
+        self._save_raw(tournament)
+
+        # the old document tells which regions and players the tournament had before
+        json_dict = self._get_tournament_json_dict_without_raw(tournament)
+        old_json_dict = self.tournaments_col.find_and_modify(
+                query={'_id': tournament.id}, update=json_dict, fields={'regions': 1, 'players': 1})
+        self._bump_tournament_versions([json_dict] + ([old_json_dict] if old_json_dict else []))
+
+    def _modify_tournament(self, id, update):
+        '''Like _modify_player, but for tournaments. The raw payload isn't read or written.'''
+        old_json_dict = self.tournaments_col.find_and_modify(query={'_id': id}, update=update, fields={'raw': 0})
+        if old_json_dict is None:
+            return None, False
+
+        # tournaments that haven't been migrated still store raw inline
+        old_json_dict.pop('raw', None)
+        json_dict = apply_update(copy.deepcopy(old_json_dict), update)
+        changed = json_dict != old_json_dict
+
+        if changed:
+            self._bump_tournament_versions([old_json_dict, json_dict])
+
+        # manually add an empty raw field, the session's copy already has the real one
+        json_dict['raw'] = ''
+        tournament = Tournament.from_json(json_dict)
+        if self.session is not None and id in self.session.tournaments:
+            tournament.raw = self.session.tournaments[id].raw
+            self.session.tournaments[id] = tournament
+
+        return tournament, changed
+
+    def add_region_to_tournament(self, id, region):
+        '''Returns (tournament, changed), changed is False if the tournament was already in the region. The
+        tournament's raw field is empty unless it was already loaded in this session.'''
+        return self._modify_tournament(id, {'$addToSet': {'regions': region}})
+
+    def remove_region_from_tournament(self, id, region):
+        '''Returns (tournament, changed), changed is False if the tournament wasn't in the region. The
+        tournament's raw field is empty unless it was already loaded in this session.'''
+        return self._modify_tournament(id, {'$pull': {'regions': region}})
+
+    def update_tournament_fields(self, tournament, fields):
+        '''Writes only the given fields of tournament, so the raw payload isn't sent again.'''
+        json_dict = tournament.get_json_dict()
+        return self._modify_tournament(tournament.id, {'$set': dict((f, json_dict[f]) for f in fields)})
 
     def get_all_tournament_ids(self, players=None, regions=None):
         '''players is a list of Players'''
@@ -142,10 +589,16 @@ class Dao(object):
         if query_list:
             query_dict['$and'] = query_list
 
-        return [t['_id'] for t in self.tournaments_col.find(query_dict, {'_id': 1}).sort([('date', 1)])]
+        return [t['_id'] for t in self.tournaments_col.find(query_dict, {'_id': 1}).sort([('date', 1), ('_id', 1)])]
 
     def get_all_tournaments(self, players=None, regions=None):
         '''players is a list of Players'''
+        return list(self.iter_all_tournaments(players=players, regions=regions))
+
+    def iter_all_tournaments(self, players=None, regions=None, starting_at=None, batch_size=TOURNAMENT_BATCH_SIZE):
+        '''Like get_all_tournaments, but yields the Tournaments one at a time in date order as the cursor
+        returns them, so only batch_size documents are held in memory instead of the whole history.
+        starting_at is a (date, id), tournaments before it in (date, id) order are skipped.'''
         query_dict = {}
         query_list = []
 
@@ -161,20 +614,189 @@ class Dao(object):
         if regions:
             query_list.append({'regions': {'$in': regions}})
 
+        if starting_at:
+            date, id = starting_at
+            query_list.append({'$or': [{'date': {'$gt': date}}, {'date': date, '_id': {'$gte': id}}]})
+
         if query_list:
             query_dict['$and'] = query_list
 
-        tournaments = [t for t in self.tournaments_col.find(query_dict, fields_dict).sort([('date', 1)])]
-
-        # manually add an empty raw field
-        for tournament in tournaments:
+        tournaments = self.tournaments_col.find(query_dict, fields_dict).sort([('date', 1), ('_id', 1)])
+        for tournament in tournaments.batch_size(batch_size):
+            # manually add an empty raw field
             tournament['raw'] = ''
+            yield Tournament.from_json(tournament)
+
+    def get_tournament_summaries(self, regions=None, limit=None, before=None, before_id=None):
+        '''Returns TournamentSummaries in date order, only pulling the fields needed to list tournaments.
+        before is a datetime, only tournaments strictly before it are returned. If before_id is also given,
+        tournaments on the before date with a smaller id are returned too, so (before, before_id) can be the
+        oldest tournament of the previous page. If limit is given, returns the latest limit tournaments
+        (still in date order).'''
+        query_list = []
+
+        fields_dict = {
+                'name': 1,
+                'date': 1,
+                'regions': 1
+        }
+
+        if regions:
+            query_list.append({'regions': {'$in': regions}})
+
+        if before and before_id:
+            query_list.append({'$or': [{'date': {'$lt': before}}, {'date': before, '_id': {'$lt': before_id}}]})
+        elif before:
+            query_list.append({'date': {'$lt': before}})
+
+        query_dict = {'$and': query_list} if query_list else {}
+
+        if limit:
+            summaries = self.tournaments_col.find(query_dict, fields_dict).sort([('date', -1), ('_id', -1)]).limit(limit)
+            return [TournamentSummary.from_json(t) for t in reversed(list(summaries))]
+        else:
+            summaries = self.tournaments_col.find(query_dict, fields_dict).sort([('date', 1), ('_id', 1)])
+            return [TournamentSummary.from_json(t) for t in summaries]
+
+    def get_head_to_head_matches(self, player, opponent, starting_at=None):
+        '''Returns a list of (TournamentSummary, MatchResult) for every set between player and opponent (both
+        Players), in date order. The sets are picked out by an aggregation so only they come back from the
+        server. starting_at is a (date, id), like in iter_all_tournaments.'''
+        query_list = [{'players': {'$all': [player.id, opponent.id]}}]
+
+        if starting_at:
+            date, id = starting_at
+            query_list.append({'$or': [{'date': {'$gt': date}}, {'date': date, '_id': {'$gte': id}}]})
+
+        pipeline = [
+            {'$match': {'$and': query_list}},
+            {'$sort': SON([('date', 1), ('_id', 1)])},
+            {'$project': {'name': 1, 'date': 1, 'regions': 1, 'matches': 1}},
+            {'$unwind': '$matches'},
+            {'$match': {'$or': [
+                {'matches.winner': player.id, 'matches.loser': opponent.id},
+                {'matches.winner': opponent.id, 'matches.loser': player.id}]}}
+        ]
+
+        try:
+            documents = self.tournaments_col.aggregate(pipeline)['result']
+        except NotImplementedError:
+            # mongomock doesn't support $unwind, so do the same thing client side
+            return self._get_head_to_head_matches_by_scan(player, opponent, starting_at)
+
+        return [(TournamentSummary.from_json(d), MatchResult.from_json(d['matches'])) for d in documents]
+
+    def _get_head_to_head_matches_by_scan(self, player, opponent, starting_at):
+        head_to_head_matches = []
+        for tournament in self.iter_all_tournaments(players=[player, opponent], starting_at=starting_at):
+            summary = TournamentSummary(tournament.name, tournament.date, tournament.regions, id=tournament.id)
+            for match in tournament.matches:
+                if match.contains_players(player.id, opponent.id):
+                    head_to_head_matches.append((summary, match))
+
+        return head_to_head_matches
+
+    @classmethod
+    def _get_replay_query(cls, region_ids, starting_after=None, start=None, end=None):
+        query_list = [{'regions': {'$in': region_ids}}]
+
+        if starting_after:
+            date, id = starting_after
+            query_list.append({'$or': [{'date': {'$gt': date}}, {'date': date, '_id': {'$gt': id}}]})
+
+        # bounded on both the index's fields, so a season only reads its own tournaments
+        if start:
+            query_list.append({'date': {'$gte': start}})
+
+        if end:
+            query_list.append({'date': {'$lt': end}})
+
+        return {'$and': query_list}
+
+    @classmethod
+    def get_columnar_replays(cls, mongo_client, region_ids, starting_after=None, start=None, end=None,
+                             batch_size=TOURNAMENT_BATCH_SIZE, database_name=DATABASE_NAME):
+        '''Loads the tournaments of every region in region_ids with a single scan of the tournaments collection,
+        in (date, id) order. Returns a map from region id to ColumnarReplay, each tournament is added to the
+        replay of every region it belongs to. starting_after, start and end work as in get_columnar_replay.'''
+        region_id_to_replay_map = dict((region_id, ColumnarReplay()) for region_id in region_ids)
+
+        fields_dict = {
+                'name': 1,
+                'date': 1,
+                'players': 1,
+                'matches': 1,
+                'regions': 1
+        }
+
+        tournaments = mongo_client[database_name][TOURNAMENTS_COLLECTION_NAME].find(
+                cls._get_replay_query(region_ids, starting_after=starting_after, start=start, end=end),
+                fields_dict).sort([('date', 1), ('_id', 1)])
+        for json_dict in tournaments.batch_size(batch_size):
+            for region_id in json_dict['regions']:
+                if region_id in region_id_to_replay_map:
+                    region_id_to_replay_map[region_id].add_tournament(json_dict)
+
+        return region_id_to_replay_map
+
+    def get_columnar_replay(self, starting_after=None, start=None, end=None, batch_size=TOURNAMENT_BATCH_SIZE):
+        '''Loads the region's tournaments in (date, id) order as a ColumnarReplay. Only the fields needed to
+        replay ratings are pulled, and documents are consumed as they stream in. starting_after is a
+        (date, id), only tournaments after it are loaded. start and end limit the replay to tournaments
+        on or after start and before end.
+
+        A composite region's replay is the merge of its members' replays.'''
+        if self.region_ids != [self.region_id]:
+            return ColumnarReplay.merge(Dao.get_columnar_replays(
+                self.mongo_client, self.region_ids, starting_after=starting_after, start=start, end=end,
+                batch_size=batch_size, database_name=self.database_name).values())
+
+        fields_dict = {
+                'name': 1,
+                'date': 1,
+                'players': 1,
+                'matches': 1
+        }
+
+        tournaments = self.tournaments_col.find(
+                Dao._get_replay_query(self.region_ids, starting_after=starting_after, start=start, end=end),
+                fields_dict).sort([('date', 1), ('_id', 1)])
+        return ColumnarReplay.from_tournaments(tournaments.batch_size(batch_size))
+
+    def iter_snapshot_tournaments(self, player_ids, batch_size=TOURNAMENT_BATCH_SIZE):
+        '''Returns a cursor over the region's tournaments and every tournament one of player_ids played in, in
+        (date, id) order and without raw. See snapshot.py.'''
+        query_dict = {'$or': [{'regions': {'$in': self.region_ids}}, {'players': {'$in': player_ids}}]}
+
+        fields_dict = {
+                'type': 1,
+                'name': 1,
+                'date': 1,
+                'players': 1,
+                'matches': 1,
+                'regions': 1
+        }
 
-        return [Tournament.from_json(t) for t in tournaments]
+        return self.tournaments_col.find(query_dict, fields_dict).sort([('date', 1), ('_id', 1)]).batch_size(batch_size)
 
     def get_tournament_by_id(self, id):
         '''id must be an ObjectId'''
-        return Tournament.from_json(self.tournaments_col.find_one({'_id': id}))
+        if self.session is not None and id in self.session.tournaments:
+            return self.session.tournaments[id]
+
+        tournament = self.tournaments_col.find_one({'_id': id})
+
+        # tournaments that haven't been migrated still store raw inline
+        if tournament is not None and 'raw_id' in tournament:
+            tournament['raw'] = self.get_raw_by_id(tournament['raw_id'])
+        elif tournament is not None and not 'raw' in tournament:
+            tournament['raw'] = ''
+
+        tournament = Tournament.from_json(tournament)
+        if tournament is not None and self.session is not None:
+            self.session.tournaments[id] = tournament
+
+        return tournament
 
     # TODO reduce db calls for this
     def merge_players(self, source=None, target=None):
@@ -187,18 +809,148 @@ class Dao(object):
         target.merge_with_player(source)
         self.update_player(target)
 
-        for tournament_id in self.get_all_tournament_ids():
-            tournament = self.get_tournament_by_id(tournament_id)
+        # only the source's tournaments are read, without raw, and only their players and matches are written
+        dirty_regions = set()
+        since = None
+        for tournament in list(self.iter_all_tournaments(players=[source])):
+            dirty_regions.update(tournament.regions)
+            since = tournament.date if since is None else min(since, tournament.date)
+
             tournament.replace_player(player_to_remove=source, player_to_add=target)
-            self.update_tournament(tournament)
+            self.update_tournament_fields(tournament, ['players', 'matches'])
 
         self.delete_player(source)
 
+        # the merged player's sets now count towards the target's rating
+        if dirty_regions:
+            Dao.mark_regions_dirty(self.mongo_client, list(dirty_regions), since=since, database_name=self.database_name)
+
     def insert_ranking(self, ranking):
-        return self.rankings_col.insert(ranking.get_json_dict())
+        id = self.rankings_col.insert(ranking.get_json_dict())
+        self._bump_versions([ranking.region])
+
+        return id
 
     def get_latest_ranking(self):
-        return Ranking.from_json(self.rankings_col.find({'region': self.region_id}).sort('time', DESCENDING)[0])
+        # season rankings are only returned by get_season_ranking
+        return Ranking.from_json(self.rankings_col.find(
+            {'region': self.region_id, 'start': {'$exists': False}}).sort('time', DESCENDING)[0])
+
+    def get_season_ranking(self, start, end):
+        '''Returns the latest ranking generated for the season from start to end, or None.'''
+        rankings = list(self.rankings_col.find(
+            {'region': self.region_id, 'start': start, 'end': end}).sort('time', DESCENDING).limit(1))
+        return Ranking.from_json(rankings[0]) if rankings else None
+
+    def get_seasons(self):
+        '''Returns the (start, end) of every season the region has a ranking for, latest start first.'''
+        seasons = []
+        for json_dict in self.rankings_col.find({'region': self.region_id, 'start': {'$exists': True}},
+                                                {'start': 1, 'end': 1}).sort([('start', DESCENDING), ('end', DESCENDING)]):
+            season = (json_dict['start'], json_dict['end'])
+            if not season in seasons:
+                seasons.append(season)
+
+        return seasons
+
+    def insert_rating_deltas(self, rating_deltas):
+        if rating_deltas:
+            ids = self.rating_deltas_col.insert([d.get_json_dict() for d in rating_deltas])
+            self._bump_versions([self.region_id])
+
+            return ids
+
+    def delete_rating_deltas(self, after=None):
+        '''after is a (date, tournament id), if given only the deltas of later tournaments are deleted.'''
+        query_list = [{'region': self.region_id}]
+
+        if after:
+            date, tournament_id = after
+            query_list.append({'$or': [{'date': {'$gt': date}}, {'date': date, 'tournament': {'$gt': tournament_id}}]})
+
+        result = self.rating_deltas_col.remove({'$and': query_list})
+        self._bump_versions([self.region_id])
+
+        return result
+
+    def get_rating_deltas(self, end=None):
+        '''Returns the rating deltas for this region in replay order, only those of tournaments before end if
+        it's given.'''
+        query_dict = {'region': self.region_id}
+
+        if end:
+            query_dict['date'] = {'$lt': end}
+
+        return [RatingDelta.from_json(d) for d in self.rating_deltas_col.find(query_dict).sort([('date', 1), ('_id', 1)])]
+
+    def insert_rating_histories(self, rating_histories):
+        '''Each entry of each history is stored as its own document, so a resumed replay only has to replace the
+        entries after its checkpoint, see delete_rating_histories.'''
+        json_dicts = []
+        for rating_history in rating_histories:
+            for entry in rating_history.history:
+                json_dict = entry.get_json_dict()
+                json_dict['region'] = rating_history.region
+                json_dict['player'] = rating_history.player
+                json_dicts.append(json_dict)
+
+        if json_dicts:
+            ids = self.rating_histories_col.insert(json_dicts)
+            self._bump_versions([self.region_id])
+
+            return ids
+
+    def delete_rating_histories(self, after=None):
+        '''after is a (date, tournament id), if given only the entries of later tournaments are deleted.'''
+        query_list = [{'region': self.region_id}]
+
+        if after:
+            date, tournament_id = after
+            query_list.append({'$or': [{'date': {'$gt': date}}, {'date': date, 'tournament': {'$gt': tournament_id}}]})
+
+        result = self.rating_histories_col.remove({'$and': query_list})
+        self._bump_versions([self.region_id])
+
+        return result
+
+    def _get_rating_histories(self, query_dict):
+        player_id_to_history_map = {}
+        for json_dict in self.rating_histories_col.find(query_dict).sort([('date', 1), ('tournament', 1)]):
+            player_id_to_history_map.setdefault(json_dict['player'], []).append(RatingHistoryEntry.from_json(json_dict))
+
+        return [RatingHistory(self.region_id, player_id, history)
+                for player_id, history in player_id_to_history_map.iteritems()]
+
+    def get_rating_histories(self):
+        return self._get_rating_histories({'region': self.region_id})
+
+    def get_rating_history(self, player_id):
+        '''player_id must be an ObjectId. Returns None if the player has no rating history in this region.'''
+        rating_histories = self._get_rating_histories({'region': self.region_id, 'player': player_id})
+        return rating_histories[0] if rating_histories else None
+
+    def insert_rating_checkpoints(self, rating_checkpoints):
+        if rating_checkpoints:
+            return self.rating_checkpoints_col.insert([c.get_json_dict() for c in rating_checkpoints])
+
+    def delete_rating_checkpoints(self, after_index=None):
+        '''If after_index is given, only the checkpoints taken after that many tournaments are deleted.'''
+        query_dict = {'region': self.region_id}
+
+        if after_index is not None:
+            query_dict['index'] = {'$gt': after_index}
+
+        return self.rating_checkpoints_col.remove(query_dict)
+
+    def get_latest_rating_checkpoint(self, before=None):
+        '''Returns the latest checkpoint whose last tournament is strictly before the before date, or None.'''
+        query_dict = {'region': self.region_id}
+
+        if before:
+            query_dict['date'] = {'$lt': before}
+
+        checkpoints = list(self.rating_checkpoints_col.find(query_dict).sort([('index', DESCENDING)]).limit(1))
+        return RatingCheckpoint.from_json(checkpoints[0]) if checkpoints else None
 
     def insert_user(self, user):
         return self.users_col.insert(user.get_json_dict())
@@ -215,8 +967,9 @@ class Dao(object):
     def get_all_users(self):
         return [User.from_json(u) for u in self.users_col.find()]
 
-    # TODO this is untested
-    def is_inactive(self, player, now):
+    def get_inactivity_limits(self):
+        '''Returns (day_limit, num_tourneys): a player is inactive if they attended fewer than num_tourneys
+        tournaments in the last day_limit days.'''
         day_limit = 45
         num_tourneys = 1
 
@@ -225,8 +978,4 @@ class Dao(object):
             day_limit = 90
             num_tourneys = 3
 
-        qualifying_tournaments = [x for x in self.get_all_tournaments(players=[player], regions=[self.region_id]) if x.date >= (now - timedelta(days=day_limit))]
-        if len(qualifying_tournaments) >= num_tourneys:
-            return False
-        return True
-
+        return day_limit, num_tourneys
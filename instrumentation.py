@@ -0,0 +1,213 @@
+from bson import BSON
+import inspect
+import threading
+
+class QueryStats(object):
+    def __init__(self, count_bytes=True):
+        '''Counting bytes means encoding every returned document again, pass count_bytes=False to only
+        count documents.'''
+        self.count_bytes = count_bytes
+        self.reset()
+
+    def reset(self):
+        self.queries = 0
+        self.documents = 0
+        self.bytes = 0
+        self.writes = 0
+
+    def add_document(self, document):
+        self.documents += 1
+        if self.count_bytes:
+            self.bytes += len(BSON.encode(document))
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        json_dict['queries'] = self.queries
+        json_dict['documents'] = self.documents
+        json_dict['bytes'] = self.bytes
+        json_dict['writes'] = self.writes
+
+        return json_dict
+
+class ThreadLocalQueryStats(threading.local, QueryStats):
+    '''QueryStats with separate counters per thread, so concurrent requests don't count each other's queries.'''
+    pass
+
+class RequestMetrics(object):
+    '''Process-wide totals of request timing and query stats, keyed by endpoint.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, wall_time, stats):
+        with self.lock:
+            metrics = self.endpoints.get(endpoint)
+            if metrics is None:
+                metrics = {
+                    'requests': 0,
+                    'wall_time': 0.0,
+                    'max_wall_time': 0.0,
+                    'queries': 0,
+                    'max_queries': 0,
+                    'documents': 0,
+                    'bytes': 0,
+                    'writes': 0
+                }
+                self.endpoints[endpoint] = metrics
+
+            metrics['requests'] += 1
+            metrics['wall_time'] += wall_time
+            metrics['max_wall_time'] = max(metrics['max_wall_time'], wall_time)
+            metrics['queries'] += stats.queries
+            metrics['max_queries'] = max(metrics['max_queries'], stats.queries)
+            metrics['documents'] += stats.documents
+            metrics['bytes'] += stats.bytes
+            metrics['writes'] += stats.writes
+
+    def get_json_dict(self):
+        with self.lock:
+            json_dict = {}
+
+            for endpoint, metrics in self.endpoints.iteritems():
+                json_dict[endpoint] = dict(metrics)
+                json_dict[endpoint]['mean_wall_time'] = metrics['wall_time'] / metrics['requests']
+                json_dict[endpoint]['mean_queries'] = float(metrics['queries']) / metrics['requests']
+
+            return json_dict
+
+class InstrumentedMongoClient(object):
+    '''Wraps a MongoClient (or mongomock client) and counts every query, returned document and write
+    that goes through it. Anything that isn't a database lookup is passed through to the wrapped client.'''
+    def __init__(self, mongo_client, stats=None):
+        self.mongo_client = mongo_client
+        self.stats = stats if stats is not None else QueryStats()
+
+    def __getitem__(self, database_name):
+        return InstrumentedDatabase(self.mongo_client[database_name], self.stats)
+
+    def __getattr__(self, name):
+        return getattr(self.mongo_client, name)
+
+class InstrumentedDatabase(object):
+    def __init__(self, database, stats):
+        self.database = database
+        self.stats = stats
+
+    def __getitem__(self, collection_name):
+        return InstrumentedCollection(self.database[collection_name], self.stats)
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+class InstrumentedCollection(object):
+    def __init__(self, collection, stats):
+        self.collection = collection
+        self.stats = stats
+
+    def find(self, *args, **kwargs):
+        self.stats.queries += 1
+        return InstrumentedCursor(self.collection.find(*args, **kwargs), self.stats)
+
+    def find_one(self, *args, **kwargs):
+        self.stats.queries += 1
+        document = self.collection.find_one(*args, **kwargs)
+        if document is not None:
+            self.stats.add_document(document)
+
+        return document
+
+    def find_and_modify(self, *args, **kwargs):
+        self.stats.queries += 1
+        self.stats.writes += 1
+        document = self.collection.find_and_modify(*args, **kwargs)
+        if document is not None:
+            self.stats.add_document(document)
+
+        return document
+
+    def aggregate(self, *args, **kwargs):
+        self.stats.queries += 1
+        return self.collection.aggregate(*args, **kwargs)
+
+    def insert(self, *args, **kwargs):
+        self.stats.writes += 1
+        return self.collection.insert(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self.stats.writes += 1
+        return self.collection.update(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.stats.writes += 1
+        return self.collection.save(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        self.stats.writes += 1
+        return self.collection.remove(*args, **kwargs)
+
+    @property
+    def initialize_unordered_bulk_op(self):
+        '''The wrapped collection's bulk api, counting each bulk write. Whatever a collection without one
+        (mongomock) gives back is passed through as it is.'''
+        initialize_unordered_bulk_op = self.collection.initialize_unordered_bulk_op
+        if not inspect.ismethod(initialize_unordered_bulk_op):
+            return initialize_unordered_bulk_op
+
+        return self._initialize_unordered_bulk_op
+
+    def _initialize_unordered_bulk_op(self):
+        return InstrumentedBulkOperation(self.collection.initialize_unordered_bulk_op(), self.stats)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+class InstrumentedBulkOperation(object):
+    def __init__(self, bulk, stats):
+        self.bulk = bulk
+        self.stats = stats
+
+    def execute(self, *args, **kwargs):
+        self.stats.writes += 1
+        return self.bulk.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.bulk, name)
+
+class InstrumentedCursor(object):
+    def __init__(self, cursor, stats):
+        self.cursor = cursor
+        self.stats = stats
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, *args, **kwargs):
+        self.cursor = self.cursor.limit(*args, **kwargs)
+        return self
+
+    def skip(self, *args, **kwargs):
+        self.cursor = self.cursor.skip(*args, **kwargs)
+        return self
+
+    def batch_size(self, *args, **kwargs):
+        self.cursor = self.cursor.batch_size(*args, **kwargs)
+        return self
+
+    def count(self, *args, **kwargs):
+        self.stats.queries += 1
+        return self.cursor.count(*args, **kwargs)
+
+    def __getitem__(self, index):
+        document = self.cursor[index]
+        self.stats.add_document(document)
+        return document
+
+    def __iter__(self):
+        for document in self.cursor:
+            self.stats.add_document(document)
+            yield document
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
@@ -3,6 +3,9 @@ import json
 import trueskill
 
 class TrueskillRating(object):
+    # there can be hundreds of thousands of these in a replay, so skip the per instance __dict__
+    __slots__ = ('trueskill_rating',)
+
     def __init__(self, trueskill_rating=None):
         if trueskill_rating:
             self.trueskill_rating = trueskill_rating
@@ -35,6 +38,8 @@ class TrueskillRating(object):
         return cls(trueskill.Rating(mu=json_dict['mu'], sigma=json_dict['sigma']))
 
 class MatchResult(object):
+    __slots__ = ('winner', 'loser')
+
     def __init__(self, winner=None, loser=None):
         '''
         :param winner: ObjectId
@@ -162,7 +167,7 @@ class Player(object):
                 id=json_dict['_id'] if '_id' in json_dict else None)
 
 class Tournament(object):
-    def __init__(self, type, raw, date, name, players, matches, regions, id=None):
+    def __init__(self, type, raw, date, name, players, matches, regions, id=None, raw_id=None):
         '''
         :param type: string, either "tio" or "challonge"
         :param raw: for tio, this is an xml string. for challonge its a dict from string --> string
@@ -172,10 +177,12 @@ class Tournament(object):
         :param matches:  list of MatchResults
         :param regions: list of string
         :param id: ObjectID, autogenerated by mongo during insert
+        :param raw_id: ObjectID of the compressed raw payload, set by the dao when raw is stored separately
         '''
         self.id = id
         self.type = type
         self.raw = raw
+        self.raw_id = raw_id
         self.date = date
         self.name = name
         self.matches = matches
@@ -211,6 +218,9 @@ class Tournament(object):
         if self.id:
             json_dict['_id'] = self.id
 
+        if self.raw_id:
+            json_dict['raw_id'] = self.raw_id
+
         json_dict['type'] = self.type
         json_dict['raw'] = self.raw
         json_dict['date'] = self.date
@@ -234,7 +244,8 @@ class Tournament(object):
                 json_dict['players'], 
                 [MatchResult.from_json(m) for m in json_dict['matches']], 
                 json_dict['regions'],
-                id=json_dict['_id'] if '_id' in json_dict else None)
+                id=json_dict['_id'] if '_id' in json_dict else None,
+                raw_id=json_dict['raw_id'] if 'raw_id' in json_dict else None)
 
     # player_alias_to_player_id_map is a map from player alias (string) -> player id (ObjectId)
     @classmethod
@@ -266,20 +277,71 @@ class Tournament(object):
                 matches,
                 regions)
 
+class TournamentSummary(object):
+    '''Just enough of a Tournament to list it, without its matches, players or raw payload.'''
+    def __init__(self, name, date, regions, id=None):
+        '''
+        :param name: string
+        :param date: datetime
+        :param regions: list of strings
+        :param id: ObjectId
+        '''
+        self.id = id
+        self.name = name
+        self.date = date
+        self.regions = regions
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and \
+                self.id == other.id and \
+                self.name == other.name and \
+                self.date == other.date and \
+                self.regions == other.regions
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        if self.id:
+            json_dict['_id'] = self.id
+
+        json_dict['name'] = self.name
+        json_dict['date'] = self.date
+        json_dict['regions'] = self.regions
+
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if json_dict == None:
+            return None
+
+        return cls(
+                json_dict['name'],
+                json_dict['date'],
+                json_dict['regions'],
+                id=json_dict['_id'] if '_id' in json_dict else None)
+
 class Ranking(object):
-    def __init__(self, region, time, tournaments, ranking, id=None):
+    def __init__(self, region, time, tournaments, ranking, id=None, start=None, end=None):
         '''
         :param region: string
         :param time: datetime
         :param tournaments: list of ObjectIds
         :param ranking: TODO
         :param id: TODO
+        :param start: datetime, for a season ranking the first day of the season
+        :param end: datetime, for a season ranking the day after the season
         '''
         self.region = region
         self.id = id
         self.time = time
         self.ranking = ranking
         self.tournaments = tournaments
+        self.start = start
+        self.end = end
 
     def get_json_dict(self):
         json_dict = {}
@@ -292,6 +354,12 @@ class Ranking(object):
         json_dict['tournaments'] = self.tournaments
         json_dict['ranking'] = [r.get_json_dict() for r in self.ranking]
 
+        if self.start:
+            json_dict['start'] = self.start
+
+        if self.end:
+            json_dict['end'] = self.end
+
         return json_dict
 
     @classmethod
@@ -304,10 +372,14 @@ class Ranking(object):
                 json_dict['time'], 
                 json_dict['tournaments'], 
                 [RankingEntry.from_json(r) for r in json_dict['ranking']],
-                id=json_dict['_id'] if '_id' in json_dict else None)
+                id=json_dict['_id'] if '_id' in json_dict else None,
+                start=json_dict.get('start'),
+                end=json_dict.get('end'))
 
 # TODO be explicit about this being a player_id
 class RankingEntry(object):
+    __slots__ = ('rank', 'player', 'rating')
+
     def __init__(self, rank, player, rating):
         '''
         :param rank: TODO
@@ -346,19 +418,256 @@ class RankingEntry(object):
                 json_dict['player'],
                 json_dict['rating'])
 
+class PlayerRating(object):
+    __slots__ = ('player', 'rating')
+
+    def __init__(self, player, rating):
+        '''
+        :param player: ObjectId
+        :param rating: TrueskillRating
+        '''
+        self.player = player
+        self.rating = rating
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and \
+                self.player == other.player and \
+                self.rating == other.rating
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get_json_dict(self):
+        json_dict = self.rating.get_json_dict()
+
+        json_dict['player'] = self.player
+
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if json_dict == None:
+            return None
+
+        return cls(json_dict['player'], TrueskillRating.from_json(json_dict))
+
+class RatingDelta(object):
+    def __init__(self, region, tournament, date, ratings, id=None):
+        '''
+        :param region: string
+        :param tournament: ObjectId
+        :param date: datetime, the date of the tournament
+        :param ratings: list of PlayerRatings, the rating of every player whose rating changed in the tournament
+        :param id: ObjectId, autogenerated by mongo during insert
+        '''
+        self.id = id
+        self.region = region
+        self.tournament = tournament
+        self.date = date
+        self.ratings = ratings
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        if self.id:
+            json_dict['_id'] = self.id
+
+        json_dict['region'] = self.region
+        json_dict['tournament'] = self.tournament
+        json_dict['date'] = self.date
+        json_dict['ratings'] = [r.get_json_dict() for r in self.ratings]
+
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if json_dict == None:
+            return None
+
+        return cls(
+                json_dict['region'],
+                json_dict['tournament'],
+                json_dict['date'],
+                [PlayerRating.from_json(r) for r in json_dict['ratings']],
+                id=json_dict['_id'] if '_id' in json_dict else None)
+
+class RatingHistoryEntry(object):
+    __slots__ = ('tournament', 'date', 'rating')
+
+    def __init__(self, tournament, date, rating):
+        '''
+        :param tournament: ObjectId
+        :param date: datetime, the date of the tournament
+        :param rating: TrueskillRating, the player's rating after the tournament
+        '''
+        self.tournament = tournament
+        self.date = date
+        self.rating = rating
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and \
+                self.tournament == other.tournament and \
+                self.date == other.date and \
+                self.rating == other.rating
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get_json_dict(self):
+        json_dict = self.rating.get_json_dict()
+
+        json_dict['tournament'] = self.tournament
+        json_dict['date'] = self.date
+
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if json_dict == None:
+            return None
+
+        return cls(json_dict['tournament'], json_dict['date'], TrueskillRating.from_json(json_dict))
+
+class RatingHistory(object):
+    def __init__(self, region, player, history, id=None):
+        '''
+        :param region: string
+        :param player: ObjectId
+        :param history: list of RatingHistoryEntries in date order
+        :param id: ObjectId, autogenerated by mongo during insert
+        '''
+        self.id = id
+        self.region = region
+        self.player = player
+        self.history = history
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        if self.id:
+            json_dict['_id'] = self.id
+
+        json_dict['region'] = self.region
+        json_dict['player'] = self.player
+        json_dict['history'] = [h.get_json_dict() for h in self.history]
+
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if json_dict == None:
+            return None
+
+        return cls(
+                json_dict['region'],
+                json_dict['player'],
+                [RatingHistoryEntry.from_json(h) for h in json_dict['history']],
+                id=json_dict['_id'] if '_id' in json_dict else None)
+
+class RatingCheckpoint(object):
+    def __init__(self, region, tournament, date, index, ratings, id=None):
+        '''
+        :param region: string
+        :param tournament: ObjectId, the last tournament applied before the checkpoint
+        :param date: datetime, the date of that tournament
+        :param index: int, the number of tournaments applied before the checkpoint
+        :param ratings: list of PlayerRatings, the rating of every player rated so far
+        :param id: ObjectId, autogenerated by mongo during insert
+        '''
+        self.id = id
+        self.region = region
+        self.tournament = tournament
+        self.date = date
+        self.index = index
+        self.ratings = ratings
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        if self.id:
+            json_dict['_id'] = self.id
+
+        json_dict['region'] = self.region
+        json_dict['tournament'] = self.tournament
+        json_dict['date'] = self.date
+        json_dict['index'] = self.index
+        json_dict['ratings'] = [r.get_json_dict() for r in self.ratings]
+
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if json_dict == None:
+            return None
+
+        return cls(
+                json_dict['region'],
+                json_dict['tournament'],
+                json_dict['date'],
+                json_dict['index'],
+                [PlayerRating.from_json(r) for r in json_dict['ratings']],
+                id=json_dict['_id'] if '_id' in json_dict else None)
+
+class DirtyRegion(object):
+    def __init__(self, region, updated, since=None):
+        '''
+        :param region: string, the region id
+        :param updated: datetime, when the region's data last changed
+        :param since: datetime, the earliest tournament date whose ratings are stale. None if only the
+                      ranking list is stale, e.g. after a player's regions changed
+        '''
+        self.region = region
+        self.updated = updated
+        self.since = since
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and \
+                self.region == other.region and \
+                self.updated == other.updated and \
+                self.since == other.since
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        json_dict['_id'] = self.region
+        json_dict['updated'] = self.updated
+
+        if self.since:
+            json_dict['since'] = self.since
+
+        return json_dict
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if json_dict == None:
+            return None
+
+        return cls(
+                json_dict['_id'],
+                json_dict['updated'],
+                since=json_dict['since'] if 'since' in json_dict else None)
+
 class Region(object):
-    def __init__(self, id, display_name):
+    __slots__ = ('id', 'display_name', 'members')
+
+    def __init__(self, id, display_name, members=None):
         '''
         :param id: TODO
         :param display_name: TODO
+        :param members: list of region ids, if given this is a composite region ranked from the members' tournaments
         '''
         self.id = id
         self.display_name = display_name
+        self.members = members
 
     def __eq__(self, other):
         return isinstance(other, self.__class__) and \
                 self.id == other.id and \
-                self.display_name == other.display_name
+                self.display_name == other.display_name and \
+                self.members == other.members
 
     def __ne__(self, other):
         return not self == other
@@ -369,6 +678,9 @@ class Region(object):
         json_dict['_id'] = self.id
         json_dict['display_name'] = self.display_name
 
+        if self.members:
+            json_dict['members'] = self.members
+
         return json_dict
 
     @classmethod
@@ -378,7 +690,8 @@ class Region(object):
 
         return cls(
                 json_dict['_id'],
-                json_dict['display_name'])
+                json_dict['display_name'],
+                members=json_dict.get('members'))
 
 class User(object):
     def __init__(self, id, admin_regions, full_name=""):
@@ -1,59 +1,353 @@
+from array import array
+from dao import Dao, DATABASE_NAME
 from datetime import datetime, timedelta
 from model import *
+from replay import ColumnarReplay
 import rating_calculators
+import time
 import trueskill
 
 DEFAULT_RATING = TrueskillRating()
 
-def generate_ranking(dao, now=datetime.now()):
-    player_date_map = {}
-    player_id_to_player_map = {}
-
-    tournaments = dao.get_all_tournaments(regions=[dao.region_id])
-    for tournament in tournaments:
-        print 'Processing:', tournament.name
-
-        for player_id in tournament.players:
-            player_date_map[player_id] = tournament.date
-
-        # TODO add a default rating entry when we add it to the map
-        for match in tournament.matches:
-            if not match.winner in player_id_to_player_map:
-                db_player = dao.get_player_by_id(match.winner)
-                db_player.ratings[dao.region_id] = DEFAULT_RATING
-                player_id_to_player_map[match.winner] = db_player
-
-            if not match.loser in player_id_to_player_map:
-                db_player = dao.get_player_by_id(match.loser)
-                db_player.ratings[dao.region_id] = DEFAULT_RATING
-                player_id_to_player_map[match.loser] = db_player
-
-            winner = player_id_to_player_map[match.winner]
-            loser = player_id_to_player_map[match.loser]
-            
-            rating_calculators.update_trueskill_ratings(dao.region_id, winner=winner, loser=loser)
-
-    print 'Checking for player inactivity...'
-    i = 1
-    players = player_id_to_player_map.values()
+# save the ratings every this many tournaments, so a recompute after an edit only replays from the
+# checkpoint before the edit
+CHECKPOINT_INTERVAL = 50
+
+class RankingProgress(object):
+    '''Receives progress and phase timings from generate_ranking. The base class only records the
+    phases and reports nothing, subclass it and override the on_* methods to report progress.'''
+    def __init__(self):
+        self.phases = []
+        self.current_phase = None
+        self.current_phase_start = None
+
+    def start_phase(self, name):
+        self.current_phase = name
+        self.current_phase_start = time.time()
+        self.on_phase_start(name)
+
+    def end_phase(self, count=0):
+        phase = RankingPhase(self.current_phase, time.time() - self.current_phase_start, count)
+        self.phases.append(phase)
+        self.current_phase = None
+        self.on_phase_end(phase)
+
+    def on_phase_start(self, name):
+        pass
+
+    def on_phase_end(self, phase):
+        pass
+
+    def on_tournament(self, i, num_tournaments, tournament_name):
+        pass
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        json_dict['phases'] = [p.get_json_dict() for p in self.phases]
+        json_dict['wall_time'] = sum(p.wall_time for p in self.phases)
+
+        return json_dict
+
+class PrintingRankingProgress(RankingProgress):
+    '''Prints each phase and tournament as it goes, for the command line scripts.'''
+    def on_phase_start(self, name):
+        print 'Starting %s...' % name
+
+    def on_phase_end(self, phase):
+        print 'Finished %s: %d in %.3fs (%.1f/s)' % (phase.name, phase.count, phase.wall_time, phase.get_throughput())
+
+    def on_tournament(self, i, num_tournaments, tournament_name):
+        print 'Processing %d of %d: %s' % (i, num_tournaments, tournament_name)
+
+class RankingPhase(object):
+    def __init__(self, name, wall_time, count):
+        '''
+        :param name: string
+        :param wall_time: float, seconds
+        :param count: int, number of things (tournaments, players, ...) handled in the phase
+        '''
+        self.name = name
+        self.wall_time = wall_time
+        self.count = count
+
+    def get_throughput(self):
+        return self.count / self.wall_time if self.wall_time > 0 else 0.0
+
+    def get_json_dict(self):
+        json_dict = {}
+
+        json_dict['name'] = self.name
+        json_dict['wall_time'] = self.wall_time
+        json_dict['count'] = self.count
+        json_dict['throughput'] = self.get_throughput()
+
+        return json_dict
+
+def generate_ranking(dao, now=None, progress=None, since=None):
+    '''Replays the region's tournaments and inserts a new ranking. Pass a RankingProgress to
+    get phase timings and progress reports, by default nothing is reported.
+
+    Every CHECKPOINT_INTERVAL tournaments the ratings are saved as a RatingCheckpoint. since is the
+    earliest date of any tournament that changed since the last ranking, if given the replay resumes
+    from the latest checkpoint before it and only the tournaments after that checkpoint are replayed.
+    Otherwise everything is replayed from default ratings.'''
+    if now is None:
+        now = datetime.now()
+
+    if progress is None:
+        progress = RankingProgress()
+
+    progress.start_phase('load checkpoint')
+    checkpoint = dao.get_latest_rating_checkpoint(before=since) if since else None
+    progress.end_phase(checkpoint.index if checkpoint else 0)
+
+    progress.start_phase('load tournaments')
+    replay = dao.get_columnar_replay(starting_after=(checkpoint.date, checkpoint.tournament) if checkpoint else None)
+    progress.end_phase(replay.get_num_tournaments())
+
+    generate_ranking_from_replay(dao, replay, now=now, progress=progress, checkpoint=checkpoint)
+
+def generate_all_rankings(mongo_client, now=None, progress=None, database_name=DATABASE_NAME):
+    '''Replays every region from scratch and inserts their new rankings. The tournaments collection is
+    scanned once and each tournament is routed to the replay of every region it belongs to, so
+    tournaments in several regions are only read once.'''
+    if now is None:
+        now = datetime.now()
+
+    if progress is None:
+        progress = RankingProgress()
+
+    regions = Dao.get_all_regions(mongo_client, database_name=database_name)
+
+    progress.start_phase('load tournaments')
+    region_id_to_replay_map = Dao.get_columnar_replays(
+            mongo_client, [r.id for r in regions if not r.members], database_name=database_name)
+    progress.end_phase(sum(r.get_num_tournaments() for r in region_id_to_replay_map.itervalues()))
+
+    # composite regions merge their members' replays rather than loading anything again
+    for region in regions:
+        if region.members:
+            replay = ColumnarReplay.merge(
+                    [region_id_to_replay_map[m] for m in region.members if m in region_id_to_replay_map])
+        else:
+            replay = region_id_to_replay_map[region.id]
+
+        dao = Dao(region.id, mongo_client, database_name=database_name)
+        generate_ranking_from_replay(dao, replay, now=now, progress=progress)
+
+def generate_season_ranking(dao, start, end, now=None, progress=None):
+    '''Ranks the region on only its tournaments on or after start and before end, rated from default
+    ratings, and inserts the result as a season Ranking. Only the season's tournaments are read, so the
+    cost depends on the length of the season rather than of the whole history.
+
+    To be ranked a player needs to have entered as many of the season's tournaments as the region's
+    inactivity limit asks for. Players' ratings and the region's rating history are left alone.'''
+    if now is None:
+        now = datetime.now()
+
+    if progress is None:
+        progress = RankingProgress()
+
+    progress.start_phase('load tournaments')
+    replay = dao.get_columnar_replay(start=start, end=end)
+    progress.end_phase(replay.get_num_tournaments())
+
+    progress.start_phase('load players')
+    rated_player_indexes = replay.get_rated_player_indexes()
+    players = dao.get_players_by_ids([replay.player_ids[i] for i in rated_player_indexes])
+    progress.end_phase(len(players))
+
+    # the season's tournaments are contiguous in the replay, so all its matches are rated in one go
+    progress.start_phase('rate')
+    mus = array('d', [DEFAULT_RATING.trueskill_rating.mu]) * replay.get_num_players()
+    sigmas = array('d', [DEFAULT_RATING.trueskill_rating.sigma]) * replay.get_num_players()
+    rating_calculators.update_trueskill_ratings_from_arrays(
+            mus, sigmas, replay.winners, replay.losers, 0, replay.get_num_matches())
+    progress.end_phase(replay.get_num_matches())
+
+    progress.start_phase('inactivity')
+    day_limit, num_tourneys = dao.get_inactivity_limits()
+    num_tournaments_entered = [0] * replay.get_num_players()
+    for i in replay.players:
+        num_tournaments_entered[i] += 1
+
+    region_ids = set(dao.region_ids)
+    ratings = []
+    for player in players:
+        i = replay.player_indexes[player.id]
+        if num_tournaments_entered[i] >= num_tourneys and not region_ids.isdisjoint(player.regions):
+            ratings.append((trueskill.expose(trueskill.Rating(mus[i], sigmas[i])), player.id))
+    ratings.sort(key=lambda r: r[0], reverse=True)
+    ranking = [RankingEntry(i, player_id, rating) for i, (rating, player_id) in enumerate(ratings, start=1)]
+    progress.end_phase(len(players))
+
+    progress.start_phase('insert ranking')
+    dao.insert_ranking(Ranking(dao.region_id, now, replay.tournament_ids, ranking, start=start, end=end))
+    progress.end_phase(len(ranking))
+
+def generate_ranking_from_replay(dao, replay, now=None, progress=None, checkpoint=None):
+    '''Rates the tournaments in replay and writes the region's ratings, rating history and a new ranking.
+    replay holds the region's tournaments after checkpoint in (date, id) order, or all of them if
+    checkpoint is None.'''
+    if now is None:
+        now = datetime.now()
+
+    if progress is None:
+        progress = RankingProgress()
+
+    if checkpoint:
+        first_index = checkpoint.index
+        starting_after = (checkpoint.date, checkpoint.tournament)
+        player_id_to_rating_map = dict((r.player, r.rating.trueskill_rating) for r in checkpoint.ratings)
+    else:
+        first_index = 0
+        starting_after = None
+        player_id_to_rating_map = {}
+
+    # everything below indexes players by their dense index in the replay rather than by ObjectId
+    num_tournaments = replay.get_num_tournaments()
+
+    # players rated before the checkpoint keep their ratings even if they don't play again
+    rated_player_indexes = replay.get_rated_player_indexes()
+    rated_player_indexes.update(replay.get_player_index(player_id) for player_id in player_id_to_rating_map)
+
+    # fetch everyone who played in one query instead of one lookup per player
+    progress.start_phase('load players')
+    players = dao.get_players_by_ids([replay.player_ids[i] for i in rated_player_indexes])
+    progress.end_phase(len(players))
+
+    progress.start_phase('rate')
+    # ratings are kept as flat mu and sigma arrays so the rating kernel never touches model objects
+    mus = array('d', [DEFAULT_RATING.trueskill_rating.mu]) * replay.get_num_players()
+    sigmas = array('d', [DEFAULT_RATING.trueskill_rating.sigma]) * replay.get_num_players()
+    for player_id, rating in player_id_to_rating_map.iteritems():
+        mus[replay.player_indexes[player_id]] = rating.mu
+        sigmas[replay.player_indexes[player_id]] = rating.sigma
+
+    def get_rating(i):
+        return TrueskillRating(trueskill.Rating(mus[i], sigmas[i]))
+
+    checkpoint_player_indexes = set(replay.player_indexes[player_id] for player_id in player_id_to_rating_map)
+    rating_deltas = []
+    rating_checkpoints = []
+    player_index_to_rating_history_map = {}
+
+    for t in xrange(num_tournaments):
+        tournament_id = replay.tournament_ids[t]
+        tournament_date = replay.tournament_dates[t]
+        progress.on_tournament(first_index + t + 1, first_index + num_tournaments, replay.tournament_names[t])
+
+        start, end = replay.get_match_range(t)
+        rating_calculators.update_trueskill_ratings_from_arrays(mus, sigmas, replay.winners, replay.losers, start, end)
+
+        # record every rating this tournament changed so historical rankings and rating charts don't need a replay
+        tournament_player_indexes = set(replay.winners[start:end])
+        tournament_player_indexes.update(replay.losers[start:end])
+        checkpoint_player_indexes.update(tournament_player_indexes)
+
+        rating_deltas.append(RatingDelta(
+            dao.region_id,
+            tournament_id,
+            tournament_date,
+            [PlayerRating(replay.player_ids[i], get_rating(i)) for i in tournament_player_indexes]))
+
+        for i in tournament_player_indexes:
+            player_index_to_rating_history_map.setdefault(i, []).append(RatingHistoryEntry(
+                tournament_id,
+                tournament_date,
+                get_rating(i)))
+
+        if (first_index + t + 1) % CHECKPOINT_INTERVAL == 0:
+            rating_checkpoints.append(RatingCheckpoint(
+                dao.region_id,
+                tournament_id,
+                tournament_date,
+                first_index + t + 1,
+                [PlayerRating(replay.player_ids[i], get_rating(i)) for i in checkpoint_player_indexes]))
+    progress.end_phase(replay.get_num_matches())
+
+    progress.start_phase('inactivity')
+    for player in players:
+        player.ratings[dao.region_id] = get_rating(replay.player_indexes[player.id])
+
+    # a player is active if they entered enough tournaments in the last day_limit days. a resumed replay only
+    # holds the tournaments after the checkpoint, so if the window reaches back past it the window is loaded
+    day_limit, num_tourneys = dao.get_inactivity_limits()
+    active_since = now - timedelta(days=day_limit)
+    if checkpoint and checkpoint.date >= active_since:
+        active_replay = dao.get_columnar_replay(start=active_since)
+    else:
+        active_replay = replay
+    player_id_to_tournament_count_map = active_replay.get_tournament_counts(start=active_since)
+
+    region_ids = set(dao.region_ids)
     sorted_players = sorted(
             players, 
             key=lambda player: trueskill.expose(player.ratings[dao.region_id].trueskill_rating), reverse=True)
     ranking = []
+    rank = 1
     for player in sorted_players:
-        player_last_active_date = player_date_map.get(player.id)
-        if player_last_active_date == None or dao.is_inactive(player, now) or not dao.region_id in player.regions:
+        if player_id_to_tournament_count_map.get(player.id, 0) < num_tourneys or region_ids.isdisjoint(player.regions):
             pass # do nothing, skip this player
         else:
-            ranking.append(RankingEntry(i, player.id, trueskill.expose(player.ratings[dao.region_id].trueskill_rating)))
-            i += 1
+            ranking.append(RankingEntry(rank, player.id, trueskill.expose(player.ratings[dao.region_id].trueskill_rating)))
+            rank += 1
+    progress.end_phase(len(players))
+
+    progress.start_phase('write players')
+    dao.update_players(players)
+    progress.end_phase(len(players))
+
+    # everything recorded after the checkpoint came from the old history, replace it with the replayed tail
+    progress.start_phase('write rating history')
+    dao.delete_rating_checkpoints(after_index=first_index)
+    dao.insert_rating_checkpoints(rating_checkpoints)
+    dao.delete_rating_deltas(after=starting_after)
+    dao.insert_rating_deltas(rating_deltas)
+
+    dao.delete_rating_histories(after=starting_after)
+    dao.insert_rating_histories([RatingHistory(dao.region_id, replay.player_ids[i], history)
+                                 for i, history in player_index_to_rating_history_map.iteritems()])
+    progress.end_phase(len(rating_deltas))
+
+    progress.start_phase('insert ranking')
+    tournament_ids = dao.get_all_tournament_ids(regions=dao.region_ids) if checkpoint else replay.tournament_ids
+    dao.insert_ranking(Ranking(dao.region_id, now, tournament_ids, ranking))
+    progress.end_phase(len(ranking))
+
+def get_ranking_as_of(dao, as_of):
+    '''Rebuilds the ranking as it was at the end of the as_of date by applying the rating deltas recorded by
+    generate_ranking, instead of replaying every match. Tournaments dated any time on as_of count, since
+    challonge dates carry the time the bracket was created. Inactivity is judged relative to the end of as_of.'''
+    day_limit, num_tourneys = dao.get_inactivity_limits()
+    end = datetime(as_of.year, as_of.month, as_of.day) + timedelta(days=1)
+    active_since = end - timedelta(days=day_limit)
+
+    player_id_to_rating_map = {}
+    player_id_to_active_tournament_count_map = {}
+    tournament_ids = []
+
+    for rating_delta in dao.get_rating_deltas(end=end):
+        tournament_ids.append(rating_delta.tournament)
+
+        for player_rating in rating_delta.ratings:
+            player_id_to_rating_map[player_rating.player] = player_rating.rating
+
+            if rating_delta.date >= active_since:
+                player_id_to_active_tournament_count_map[player_rating.player] = \
+                        player_id_to_active_tournament_count_map.get(player_rating.player, 0) + 1
+
+    active_player_ids = [player_id for player_id, count in player_id_to_active_tournament_count_map.iteritems()
+                         if count >= num_tourneys]
+    region_ids = set(dao.region_ids)
+    region_player_ids = set(p.id for p in dao.get_players_by_ids(active_player_ids)
+                            if not region_ids.isdisjoint(p.regions))
 
-    print 'Updating players...'
-    for i, p in enumerate(players, start=1):
-        dao.update_player(p)
-        print 'Updated player %d of %d' % (i, len(players))
+    ratings = [(trueskill.expose(player_id_to_rating_map[player_id].trueskill_rating), player_id)
+               for player_id in region_player_ids]
+    ratings.sort(key=lambda r: r[0], reverse=True)
 
-    print 'Inserting new ranking...'
-    dao.insert_ranking(Ranking(dao.region_id, now, [t.id for t in tournaments], ranking))
+    ranking = [RankingEntry(i, player_id, rating) for i, (rating, player_id) in enumerate(ratings, start=1)]
 
-    print 'Done!'
+    return Ranking(dao.region_id, as_of, tournament_ids, ranking)
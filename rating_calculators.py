@@ -1,6 +1,12 @@
+import math
 import trueskill
 from model import TrueskillRating
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 def update_trueskill_ratings(region_id, winner=None, loser=None):
     winner_ratings_dict = winner.ratings
     loser_ratings_dict = loser.ratings
@@ -12,3 +18,72 @@ def update_trueskill_ratings(region_id, winner=None, loser=None):
 
     winner_ratings_dict[region_id] = TrueskillRating(trueskill_rating=new_winner_rating)
     loser_ratings_dict[region_id] = TrueskillRating(trueskill_rating=new_loser_rating)
+
+def _erfc(x):
+    '''The complementary error function approximation trueskill uses when it has no backend, copied so the
+    kernel can be compiled and still agree with trueskill.rate_1vs1.'''
+    z = abs(x)
+    t = 1. / (1. + z / 2.)
+    r = t * math.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (
+                     0.37409196 + t * (0.09678418 + t * (
+                     -0.18628806 + t * (0.27886807 + t * (
+                     -1.13520398 + t * (1.48851587 + t * (
+                     -0.82215223 + t * 0.17087277)))))))))
+    return 2. - r if x < 0 else r
+
+def _rate_from_arrays(mus, sigmas, winners, losers, start, end, beta, tau, draw_margin):
+    '''The closed form of trueskill.rate_1vs1 for a win, applied to winners[start:end] and losers[start:end]
+    strictly in order. mus and sigmas are updated in place.'''
+    two_beta_squared = 2. * beta * beta
+    tau_squared = tau * tau
+    sqrt_2 = math.sqrt(2.)
+    inv_sqrt_2_pi = 1. / math.sqrt(2. * math.pi)
+
+    for i in range(start, end):
+        winner = winners[i]
+        loser = losers[i]
+
+        winner_variance = sigmas[winner] * sigmas[winner] + tau_squared
+        loser_variance = sigmas[loser] * sigmas[loser] + tau_squared
+        c_squared = two_beta_squared + winner_variance + loser_variance
+        c = math.sqrt(c_squared)
+
+        x = (mus[winner] - mus[loser]) / c - draw_margin / c
+        denom = 0.5 * _erfc(-x / sqrt_2)
+        if denom:
+            v = inv_sqrt_2_pi * math.exp(-(x * x) / 2.) / denom
+        else:
+            v = -x
+        w = v * (v + x)
+        if not 0. < w < 1.:
+            raise FloatingPointError('w is out of range')
+
+        mus[winner] += winner_variance / c * v
+        mus[loser] -= loser_variance / c * v
+        sigmas[winner] = math.sqrt(winner_variance * (1. - winner_variance / c_squared * w))
+        sigmas[loser] = math.sqrt(loser_variance * (1. - loser_variance / c_squared * w))
+
+if numba is not None:
+    _erfc = numba.njit(_erfc)
+    _rate_from_arrays = numba.njit(_rate_from_arrays)
+
+def update_trueskill_ratings_from_arrays(mus, sigmas, winners, losers, start, end):
+    '''Rates winners[start:end] against losers[start:end] in order. mus and sigmas are arrays of floats
+    indexed by the same dense player indexes as winners and losers, and are updated in place.
+
+    Runs the kernel above (compiled if numba is installed) with the global trueskill environment. It
+    only reproduces trueskill's own math, so if the environment uses another backend every match goes
+    through trueskill.rate_1vs1 instead.'''
+    env = trueskill.global_env()
+    if env.backend is None:
+        draw_margin = trueskill.calc_draw_margin(env.draw_probability, 2, env=env)
+        _rate_from_arrays(mus, sigmas, winners, losers, start, end, env.beta, env.tau, draw_margin)
+        return
+
+    for i in xrange(start, end):
+        winner = winners[i]
+        loser = losers[i]
+        new_winner_rating, new_loser_rating = trueskill.rate_1vs1(
+                trueskill.Rating(mus[winner], sigmas[winner]), trueskill.Rating(mus[loser], sigmas[loser]), env=env)
+        mus[winner], sigmas[winner] = new_winner_rating.mu, new_winner_rating.sigma
+        mus[loser], sigmas[loser] = new_loser_rating.mu, new_loser_rating.sigma
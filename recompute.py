@@ -0,0 +1,60 @@
+from dao import Dao, RegionNotFoundException, DATABASE_NAME, DIRTY_REGIONS_COLLECTION_NAME
+from datetime import datetime, timedelta
+import logging
+import rankings
+import time
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+
+# wait this long after a region's last edit before recomputing it, so a burst of edits costs one replay
+DEFAULT_DEBOUNCE_SECONDS = 60
+DEFAULT_POLL_SECONDS = 10
+
+class RecomputeScheduler(object):
+    '''Regenerates the rankings of regions that were marked dirty by edits (see Dao.mark_regions_dirty),
+    once they've gone debounce_seconds without another edit.'''
+    def __init__(self, mongo_client, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS, database_name=DATABASE_NAME,
+                 progress=None):
+        self.mongo_client = mongo_client
+        self.debounce_seconds = debounce_seconds
+        self.database_name = database_name
+        self.progress = progress
+
+    def get_due_regions(self, now):
+        '''Returns the DirtyRegions that haven't been edited in the last debounce_seconds.'''
+        quiet_since = now - timedelta(seconds=self.debounce_seconds)
+        return [d for d in Dao.get_dirty_regions(self.mongo_client, database_name=self.database_name)
+                if d.updated <= quiet_since]
+
+    def recompute(self, dirty_region, now):
+        dao = Dao(dirty_region.region, self.mongo_client, database_name=self.database_name)
+        # only the history from the earliest edit on is replayed, see generate_ranking. without a since date
+        # the ratings are unaffected and replaying from the latest checkpoint is enough
+        since = dirty_region.since if dirty_region.since else datetime.max
+        rankings.generate_ranking(dao, now=now, progress=self.progress, since=since)
+        dao.clear_dirty(dirty_region)
+
+    def run_once(self, now=None):
+        '''Recomputes every due region, returns their ids.'''
+        if now is None:
+            now = datetime.now()
+
+        recomputed = []
+        for dirty_region in self.get_due_regions(now):
+            try:
+                self.recompute(dirty_region, now)
+                recomputed.append(dirty_region.region)
+            except RegionNotFoundException:
+                # the region was deleted since it was marked, nothing left to recompute
+                self.mongo_client[self.database_name][DIRTY_REGIONS_COLLECTION_NAME].remove({'_id': dirty_region.region})
+            except Exception:
+                # the dirty mark stays so the region is retried on the next run, the other regions go ahead
+                logger.exception('recomputing %s failed' % dirty_region.region)
+
+        return recomputed
+
+    def run_forever(self, poll_seconds=DEFAULT_POLL_SECONDS):
+        while True:
+            self.run_once()
+            time.sleep(poll_seconds)
@@ -0,0 +1,130 @@
+from array import array
+from bisect import bisect_left
+import heapq
+
+class ColumnarReplay(object):
+    '''A region's match history as flat int arrays, so ratings can be replayed without hydrating every
+    Tournament and MatchResult. Players are numbered densely in the order they first appear.
+
+    The matches of tournament t are winners[match_offsets[t]:match_offsets[t + 1]] (and the same slice of
+    losers), its entrants are players[player_offsets[t]:player_offsets[t + 1]].'''
+    def __init__(self):
+        self.player_ids = []
+        self.player_indexes = {}
+
+        self.tournament_ids = []
+        self.tournament_names = []
+        self.tournament_dates = []
+
+        self.match_offsets = array('i', [0])
+        self.winners = array('i')
+        self.losers = array('i')
+
+        self.player_offsets = array('i', [0])
+        self.players = array('i')
+
+    def get_player_index(self, player_id):
+        '''Returns the dense index of player_id, numbering it if it hasn't been seen yet.'''
+        index = self.player_indexes.get(player_id)
+        if index is None:
+            index = len(self.player_ids)
+            self.player_indexes[player_id] = index
+            self.player_ids.append(player_id)
+
+        return index
+
+    def add_tournament(self, json_dict):
+        '''json_dict is a tournament document, only _id, name, date, players and matches are read.'''
+        self.tournament_ids.append(json_dict['_id'])
+        self.tournament_names.append(json_dict.get('name'))
+        self.tournament_dates.append(json_dict['date'])
+
+        for match in json_dict['matches']:
+            self.winners.append(self.get_player_index(match['winner']))
+            self.losers.append(self.get_player_index(match['loser']))
+        self.match_offsets.append(len(self.winners))
+
+        for player_id in json_dict['players']:
+            self.players.append(self.get_player_index(player_id))
+        self.player_offsets.append(len(self.players))
+
+    def add_replay_tournament(self, replay, tournament_index):
+        '''Copies tournament tournament_index of another replay, renumbering its players.'''
+        self.tournament_ids.append(replay.tournament_ids[tournament_index])
+        self.tournament_names.append(replay.tournament_names[tournament_index])
+        self.tournament_dates.append(replay.tournament_dates[tournament_index])
+
+        start, end = replay.get_match_range(tournament_index)
+        for i in xrange(start, end):
+            self.winners.append(self.get_player_index(replay.player_ids[replay.winners[i]]))
+            self.losers.append(self.get_player_index(replay.player_ids[replay.losers[i]]))
+        self.match_offsets.append(len(self.winners))
+
+        for i in replay.get_tournament_players(tournament_index):
+            self.players.append(self.get_player_index(replay.player_ids[i]))
+        self.player_offsets.append(len(self.players))
+
+    def get_num_tournaments(self):
+        return len(self.tournament_ids)
+
+    def get_num_players(self):
+        return len(self.player_ids)
+
+    def get_num_matches(self):
+        return len(self.winners)
+
+    def get_match_range(self, tournament_index):
+        '''Returns (start, end) such that winners[start:end] and losers[start:end] are the tournament's matches.'''
+        return self.match_offsets[tournament_index], self.match_offsets[tournament_index + 1]
+
+    def get_tournament_players(self, tournament_index):
+        return self.players[self.player_offsets[tournament_index]:self.player_offsets[tournament_index + 1]]
+
+    def get_rated_player_indexes(self):
+        '''Indexes of every player that played at least one match.'''
+        rated_player_indexes = set(self.winners)
+        rated_player_indexes.update(self.losers)
+
+        return rated_player_indexes
+
+    def get_tournament_counts(self, start=None):
+        '''Returns a map from player id to the number of tournaments they entered, only counting tournaments
+        on or after start if it's given.'''
+        first = bisect_left(self.tournament_dates, start) if start else 0
+
+        player_id_to_count_map = {}
+        for i in self.players[self.player_offsets[first]:]:
+            player_id = self.player_ids[i]
+            player_id_to_count_map[player_id] = player_id_to_count_map.get(player_id, 0) + 1
+
+        return player_id_to_count_map
+
+    def iter_tournament_keys(self, tag=None):
+        '''Yields (date, id, tag, index) for each tournament in replay order, tag tells streams apart when merging.'''
+        for t in xrange(self.get_num_tournaments()):
+            yield self.tournament_dates[t], self.tournament_ids[t], tag, t
+
+    @classmethod
+    def merge(cls, replays):
+        '''Merges replays that are each in (date, id) order into one replay in (date, id) order. A tournament
+        in several of the replays is only added once.'''
+        merged = cls()
+        streams = [replay.iter_tournament_keys(r) for r, replay in enumerate(replays)]
+
+        last_id = None
+        for date, id, r, t in heapq.merge(*streams):
+            # copies of a tournament have the same (date, id) so they come out next to each other
+            if id != last_id:
+                merged.add_replay_tournament(replays[r], t)
+                last_id = id
+
+        return merged
+
+    @classmethod
+    def from_tournaments(cls, json_dicts):
+        '''json_dicts is an iterable of tournament documents in date order.'''
+        replay = cls()
+        for json_dict in json_dicts:
+            replay.add_tournament(json_dict)
+
+        return replay
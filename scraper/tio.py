@@ -1,6 +1,8 @@
 from bs4 import BeautifulSoup
+from collections import OrderedDict
 from model import MatchResult
 from dateutil import parser
+import copy
 
 class TioScraper(object):
     def __init__(self, filepath, bracket_name):
@@ -10,12 +12,41 @@ class TioScraper(object):
         self.date = None
         self.matches = None
         self.players = None
+        self.player_map = None
 
         with open(filepath) as f:
             self.text = f.read()
 
         self.soup = BeautifulSoup(self.text, 'xml')
 
+    def for_bracket(self, bracket_name):
+        '''Returns a scraper for another bracket in the same file. The returned scraper shares this scraper's
+        parsed document, so the file is only read and parsed once.'''
+        # build the player map before copying so every bracket scraper shares it
+        self._get_player_map()
+
+        scraper = copy.copy(self)
+        scraper.bracket_name = bracket_name
+        scraper.matches = None
+        scraper.players = None
+
+        return scraper
+
+    def get_scrapers_for_brackets(self, bracket_names=None):
+        '''Returns a scraper for each bracket in bracket_names (defaults to every bracket in the file), in file order.
+        The file's brackets are walked once and each scraper is handed its bracket's matches.'''
+        matches_by_bracket = self.get_matches_by_bracket(bracket_names=bracket_names)
+        if bracket_names is None:
+            bracket_names = matches_by_bracket.keys()
+
+        scrapers = []
+        for bracket_name in bracket_names:
+            scraper = self.for_bracket(bracket_name)
+            scraper.matches = matches_by_bracket[bracket_name]
+            scrapers.append(scraper)
+
+        return scrapers
+
     def get_raw(self):
         return self.text
 
@@ -25,8 +56,12 @@ class TioScraper(object):
     def get_date(self):
         return parser.parse(self.soup.Event.StartDate.text)
 
+    def get_bracket_names(self):
+        return [b.Name.text for b in self.soup.find_all('Game')]
+
     def get_matches(self):
-        player_map = dict((p.ID.text, p.Nickname.text.strip()) for p in self.soup.find_all('Player'))
+        if self.matches is not None:
+            return self.matches
 
         bracket = None
         for b in self.soup.find_all('Game'):
@@ -37,6 +72,46 @@ class TioScraper(object):
         if bracket is None:
             raise ValueError('Bracket name %s not found!' % self.bracket_name)
 
+        self.matches = self._get_matches_from_bracket(bracket)
+        return self.matches
+
+    def get_matches_by_bracket(self, bracket_names=None):
+        '''Walks the file's brackets once and returns a map from bracket name -> list of MatchResults, in file
+        order. If bracket_names is given, only those brackets are included.'''
+        matches_by_bracket = OrderedDict()
+        for bracket in self.soup.find_all('Game'):
+            bracket_name = bracket.Name.text
+            if bracket_names is None or bracket_name in bracket_names:
+                matches_by_bracket[bracket_name] = self._get_matches_from_bracket(bracket)
+
+        if bracket_names is not None:
+            for bracket_name in bracket_names:
+                if not bracket_name in matches_by_bracket:
+                    raise ValueError('Bracket name %s not found!' % bracket_name)
+
+        return matches_by_bracket
+
+    def get_players(self):
+        if not self.players:
+            self.players = set()
+            matches = self.get_matches()
+            for match in matches:
+                self.players.add(match.winner)
+                self.players.add(match.loser)
+            
+            self.players = list(self.players)
+
+        return self.players
+
+    def _get_player_map(self):
+        if self.player_map is None:
+            self.player_map = dict((p.ID.text, p.Nickname.text.strip()) for p in self.soup.find_all('Player'))
+
+        return self.player_map
+
+    def _get_matches_from_bracket(self, bracket):
+        player_map = self._get_player_map()
+
         matches = []
         grand_finals_first_set = None
         grand_finals_second_set = None
@@ -67,15 +142,3 @@ class TioScraper(object):
             matches.append(grand_finals_second_set)
 
         return matches
-
-    def get_players(self):
-        if not self.players:
-            self.players = set()
-            matches = self.get_matches()
-            for match in matches:
-                self.players.add(match.winner)
-                self.players.add(match.loser)
-            
-            self.players = list(self.players)
-
-        return self.players
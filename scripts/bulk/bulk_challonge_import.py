@@ -36,7 +36,7 @@ def bulk_import(path, region):
                 import_players(scraper, dao)
                 import_tournament(scraper, dao)
 
-    rankings.generate_ranking(dao)
+    rankings.generate_ranking(dao, progress=rankings.PrintingRankingProgress())
 
 def import_players(scraper, dao):
     for player in scraper.get_players():
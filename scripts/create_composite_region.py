@@ -0,0 +1,31 @@
+import click
+from pymongo import MongoClient
+from config.config import Config
+from dao import Dao
+from model import Region
+import rankings
+
+@click.command()
+@click.option('--display-name', '-n', help='Region display name', prompt=True)
+@click.argument('region')
+@click.argument('members', nargs=-1, required=True)
+def create_composite_region(region, display_name, members):
+    config = Config()
+    mongo_client = MongoClient(host=config.get_mongo_url())
+
+    region_ids = [r.id for r in Dao.get_all_regions(mongo_client)]
+    if region in region_ids:
+        raise click.UsageError('%s already exists' % region)
+    for member in members:
+        if not member in region_ids:
+            raise click.UsageError('%s is not a valid region id' % member)
+
+    Dao.insert_region(Region(region, display_name, members=list(members)), mongo_client)
+
+    click.echo("Generating ranking...")
+    rankings.generate_ranking(Dao(region, mongo_client), progress=rankings.PrintingRankingProgress())
+
+    click.echo("Done!")
+
+if __name__ == '__main__':
+    create_composite_region()
@@ -13,39 +13,64 @@ DEFAULT_RATING = {}
 
 @click.command()
 @click.option('--type', '-t', help='tio or challonge', type=click.Choice(['challonge', 'tio']), prompt=True)
-@click.option('--bracket', '-b', help='Bracket name (for tio)')
+@click.option('--bracket', '-b', help='Bracket name (for tio). Can be given multiple times.', multiple=True)
+@click.option('--all-brackets', '-a', help='Import every bracket in the file (for tio)', is_flag=True)
 @click.option('--region', '-r', help='Region name', prompt=True)
 @click.option('--name', '-n', help='Tournament name (override)')
 @click.argument('path')
-def import_tournament(type, path, bracket, region, name):
+def import_tournament(type, path, bracket, all_brackets, region, name):
     config = Config()
     mongo_client = MongoClient(host=config.get_mongo_url())
 
     if type == 'tio':
-        scraper = TioScraper(path, bracket)
+        if not bracket and not all_brackets:
+            raise click.UsageError('--bracket or --all-brackets is required for tio')
+
+        # the file is only parsed once, every bracket scraper shares the parsed document
+        tio_scraper = TioScraper(path, bracket[0] if bracket else None)
+        if all_brackets:
+            scrapers = tio_scraper.get_scrapers_for_brackets()
+        else:
+            scrapers = tio_scraper.get_scrapers_for_brackets(bracket_names=list(bracket))
     elif type =='challonge':
-        scraper = ChallongeScraper(path)
+        scrapers = [ChallongeScraper(path)]
     else:
         click.echo("Illegal type")
 
     dao = Dao(region, mongo_client=mongo_client)
 
-    player_map = get_player_alias_to_id_map(scraper, dao)
+    # resolve the aliases of every bracket in a single round
+    player_map = get_player_alias_to_id_map(scrapers, dao)
 
-    # TODO pass in a map of overrides for specific players
-    tournament = Tournament.from_scraper(type, scraper, player_map, region)
-    if name:
-        tournament.name = name
+    earliest_date = None
+    for scraper in scrapers:
+        # TODO pass in a map of overrides for specific players
+        tournament = Tournament.from_scraper(type, scraper, player_map, region)
+        if name:
+            tournament.name = name
 
-    dao.insert_tournament(tournament)
+        # brackets from the same file share a name, so tell them apart
+        if len(scrapers) > 1:
+            tournament.name = '%s (%s)' % (tournament.name, scraper.bracket_name)
 
+        click.echo("Inserting %s..." % tournament.name)
+        dao.insert_tournament(tournament)
+
+        if earliest_date is None or tournament.date < earliest_date:
+            earliest_date = tournament.date
+
+    # only the history from the new brackets on needs to be replayed
     click.echo("Generating new ranking...")
-    rankings.generate_ranking(dao)
+    rankings.generate_ranking(dao, progress=rankings.PrintingRankingProgress(), since=earliest_date)
 
     click.echo("Done!")
 
-def get_player_alias_to_id_map(scraper, dao):
-    player_map = dao.get_player_id_map_from_player_aliases(scraper.get_players())
+def get_player_alias_to_id_map(scrapers, dao):
+    aliases = set()
+    for scraper in scrapers:
+        aliases.update(scraper.get_players())
+
+    player_map = dao.get_player_id_map_from_player_aliases(list(aliases))
 
     for alias, id in player_map.iteritems():
         print ''
@@ -70,8 +95,9 @@ def get_player_alias_to_id_map(scraper, dao):
 
                 db_player = dao.get_player_by_alias(name)
                 if db_player:
-                    click.echo("%s already exists, adding %s as an alias." % (name, player))
-                    dao.add_alias_to_player(db_player, player)
+                    click.echo("%s already exists, adding %s as an alias." % (name, alias))
+                    dao.add_alias_to_player(db_player, alias)
+                    player_map[alias] = db_player.id
                     continue
 
                 regions = []
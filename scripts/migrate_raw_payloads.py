@@ -0,0 +1,9 @@
+from dao import Dao
+from pymongo import MongoClient
+from config.config import Config
+
+# moves the raw tio/challonge payloads out of the tournaments collection into the compressed raw_files collection
+config = Config()
+mongo_client = MongoClient(config.get_mongo_url())
+count = Dao.offload_raw_payloads(mongo_client)
+print 'Migrated raw payloads for %d tournaments' % count
@@ -0,0 +1,24 @@
+import click
+from pymongo import MongoClient
+from config.config import Config
+from recompute import RecomputeScheduler, DEFAULT_DEBOUNCE_SECONDS, DEFAULT_POLL_SECONDS
+import rankings
+
+@click.command()
+@click.option('--debounce', '-d', help='Seconds a region must go without edits before it is recomputed', 
+              default=DEFAULT_DEBOUNCE_SECONDS)
+@click.option('--poll', '-p', help='Seconds between checks for dirty regions', default=DEFAULT_POLL_SECONDS)
+@click.option('--once', help='Recompute the regions that are due and exit', is_flag=True)
+def recompute_rankings(debounce, poll, once):
+    config = Config()
+    mongo_client = MongoClient(host=config.get_mongo_url())
+    scheduler = RecomputeScheduler(mongo_client, debounce_seconds=debounce, progress=rankings.PrintingRankingProgress())
+
+    if once:
+        for region in scheduler.run_once():
+            click.echo('Recomputed %s' % region)
+    else:
+        scheduler.run_forever(poll_seconds=poll)
+
+if __name__ == '__main__':
+    recompute_rankings()
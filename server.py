@@ -1,8 +1,8 @@
-from flask import Flask, request
+from flask import Flask, request, g, make_response
 from flask.ext import restful
 from flask.ext.restful import reqparse
 from flask.ext.cors import CORS
-from dao import Dao
+from dao import Dao, DaoSession, LazyMongoClient
 from bson.json_util import dumps
 from bson.objectid import ObjectId
 import sys
@@ -15,26 +15,222 @@ import facebook
 from datetime import datetime
 from model import MatchResult
 import re
+import trueskill
+import time
+import logging
+import base64
+import json
+import gzip
+import simplejson
+from cStringIO import StringIO
+from bson.errors import InvalidId
+from instrumentation import InstrumentedMongoClient, ThreadLocalQueryStats, RequestMetrics
+from snapshot import SnapshotDao, SnapshotStore
+from cache import RegionVersions, RegionCache
 
 DEBUG_TOKEN_URL = 'https://graph.facebook.com/debug_token?input_token=%s&access_token=%s'
 TYPEAHEAD_PLAYER_LIMIT = 20
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# responses smaller than this aren't worth compressing
+GZIP_MIN_BYTES = 1024
+GZIP_COMPRESSION_LEVEL = 6
+
+# most responses each process keeps in the response cache
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+
+# requests slower than this or making more queries than this get logged
+SLOW_REQUEST_SECONDS = 1.0
+QUERY_STORM_THRESHOLD = 100
 
 # parse config file
 config_full_path = os.path.join(os.path.dirname(__file__), 'config/config.ini')
 config = Config(config_file_path=config_full_path)
 
-mongo_client = MongoClient(host=config.get_mongo_url())
+# counts the queries made while handling the current request. bytes are only counted in debug mode, see
+# start_request_timer
+request_stats = ThreadLocalQueryStats(count_bytes=False)
+request_metrics = RequestMetrics()
+
+# config option -> MongoClient keyword
+MONGO_TIMEOUT_OPTIONS = {
+    'connect_timeout_ms': 'connectTimeoutMS',
+    'socket_timeout_ms': 'socketTimeoutMS',
+    'wait_queue_timeout_ms': 'waitQueueTimeoutMS'
+}
+
+def create_mongo_client():
+    kwargs = dict((MONGO_TIMEOUT_OPTIONS[option], timeout) for option, timeout in config.get_db_timeouts_ms().iteritems())
+    return MongoClient(host=config.get_mongo_url(), max_pool_size=config.get_db_max_pool_size(), **kwargs)
+
+# connects on first use in each worker, see LazyMongoClient
+mongo_client = InstrumentedMongoClient(LazyMongoClient(create_mongo_client), stats=request_stats)
+
+# every cache in this process checks the region versions through this, see cache.py
+region_versions = RegionVersions(config.get_cache_check_seconds())
+
+# in snapshot mode GET requests are answered from in-memory region snapshots, see snapshot.py
+snapshot_store = SnapshotStore(region_versions) if config.get_snapshots_enabled() else None
+
+response_cache = RegionCache(region_versions, max_entries=RESPONSE_CACHE_MAX_ENTRIES) \
+        if config.get_response_cache_enabled() else None
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
 
 app = Flask(__name__)
 cors = CORS(app, origins='*', headers=['Authorization', 'Content-Type'])
 api = restful.Api(app)
 
+@app.before_request
+def start_request_timer():
+    request_stats.reset()
+    request_stats.count_bytes = app.debug
+    g.request_start_time = time.time()
+
+@app.before_request
+def start_dao_session():
+    # every Dao made while handling the request shares one identity map and batches its player writes
+    g.dao_session = DaoSession(mongo_client)
+
+@app.before_request
+def expire_region_versions():
+    # a write request reads its own writes, e.g. the ranking returned after generating one
+    if request.method != 'GET':
+        region_versions.expire()
+
+@app.after_request
+def record_request_metrics(response):
+    wall_time = time.time() - g.request_start_time
+    endpoint = '%s %s' % (request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+    request_metrics.record(endpoint, wall_time, request_stats)
+
+    if wall_time >= SLOW_REQUEST_SECONDS or request_stats.queries >= QUERY_STORM_THRESHOLD:
+        logger.warning('%s %s took %.3fs with %d queries returning %d documents' % (
+            request.method, request.path, wall_time, request_stats.queries, request_stats.documents))
+
+    if app.debug:
+        response.headers['X-Request-Time'] = '%.6f' % wall_time
+        response.headers['X-Query-Count'] = str(request_stats.queries)
+        response.headers['X-Query-Documents'] = str(request_stats.documents)
+        response.headers['X-Query-Bytes'] = str(request_stats.bytes)
+
+    return response
+
+class EncodedJson(str):
+    '''A response body that is already serialized json, returned as is instead of being encoded again.
+    Lets cached responses skip serialization entirely.'''
+    pass
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    if isinstance(data, EncodedJson):
+        dumped = data
+    elif app.debug:
+        dumped = simplejson.dumps(data, indent=4, sort_keys=True) + '\n'
+    else:
+        # simplejson uses its C speedups for encoding, the stdlib json module in python 2 doesn't
+        dumped = simplejson.dumps(data)
+
+    response = make_response(dumped, code)
+    response.headers.extend(headers or {})
+    return response
+
+def gzip_bytes(data):
+    buf = StringIO()
+    with gzip.GzipFile(mode='wb', fileobj=buf, compresslevel=GZIP_COMPRESSION_LEVEL) as f:
+        f.write(data)
+
+    return buf.getvalue()
+
+@app.after_request
+def compress_response(response):
+    if response.direct_passthrough or \
+            response.status_code < 200 or response.status_code >= 300 or \
+            'Content-Encoding' in response.headers or \
+            not 'gzip' in request.headers.get('Accept-Encoding', '').lower():
+        return response
+
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+
+    response.set_data(gzip_bytes(data))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+
+    return response
+
+# registered last so it runs first, before the request's queries are counted
+@app.after_request
+def flush_dao_session(response):
+    g.dao_session.flush()
+    return response
+
+def get_read_dao(region):
+    '''Returns what GET resources read the region through, a Dao or in snapshot mode a SnapshotDao.'''
+    if snapshot_store is None:
+        return Dao(region, mongo_client=mongo_client, session=g.dao_session)
+
+    # the snapshot is loaded from mongo, so this request's pending writes have to land first
+    g.dao_session.flush()
+    snapshot = snapshot_store.get_snapshot(mongo_client, region)
+    return SnapshotDao(snapshot, lambda: Dao(region, mongo_client=mongo_client, session=g.dao_session))
+
+def get_cached_response(region, get_response):
+    '''Returns get_response(), from the response cache if it's on. Only responses built from the region's own
+    data can go through here, since only writes to that data move the region's version.'''
+    if response_cache is None:
+        return get_response()
+
+    def encode_response():
+        response = get_response()
+        # error responses are cached as they are, they don't change until the data does either
+        return EncodedJson(simplejson.dumps(response)) if isinstance(response, dict) else response
+
+    # this request's pending writes have to land first, like in get_read_dao
+    g.dao_session.flush()
+    return response_cache.get(mongo_client, region, request.full_path, encode_response)
+
+def warm_up():
+    '''Connects to mongo and reads every region and its latest ranking (or in snapshot mode loads every
+    region's snapshot), so a worker's first requests don't wait on a cold connection pool or a cold working
+    set. Failures are logged, the worker still starts.'''
+    try:
+        for region in Dao.get_all_regions(mongo_client):
+            if snapshot_store is not None:
+                snapshot_store.get_snapshot(mongo_client, region.id)
+                continue
+
+            dao = Dao(region.id, mongo_client=mongo_client)
+            try:
+                dao.get_latest_ranking()
+            except IndexError:
+                # the region hasn't been ranked yet
+                pass
+    except Exception:
+        logger.exception('warm up failed')
+
 player_list_get_parser = reqparse.RequestParser()
 player_list_get_parser.add_argument('alias', type=str)
 player_list_get_parser.add_argument('query', type=str)
+player_list_get_parser.add_argument('limit', type=int)
+player_list_get_parser.add_argument('cursor', type=str)
+
+rankings_get_parser = reqparse.RequestParser()
+rankings_get_parser.add_argument('as_of', type=str)
+rankings_get_parser.add_argument('start', type=str)
+rankings_get_parser.add_argument('end', type=str)
+
+tournament_list_get_parser = reqparse.RequestParser()
+tournament_list_get_parser.add_argument('limit', type=int)
+tournament_list_get_parser.add_argument('before', type=str)
+tournament_list_get_parser.add_argument('cursor', type=str)
 
 matches_get_parser = reqparse.RequestParser()
 matches_get_parser.add_argument('opponent', type=str)
+matches_get_parser.add_argument('limit', type=int)
+matches_get_parser.add_argument('cursor', type=str)
 
 player_put_parser = reqparse.RequestParser()
 player_put_parser.add_argument('name', type=str)
@@ -59,6 +255,32 @@ def convert_object_id_list(json_dict_list):
     for j in json_dict_list:
         convert_object_id(j)
 
+class InvalidCursor(Exception):
+    pass
+
+def encode_cursor(values):
+    '''Cursors are opaque to clients, they're the keyset of the last item on a page as an url safe json list.'''
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+def decode_cursor(cursor, num_values):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor))
+    except (TypeError, ValueError):
+        raise InvalidCursor()
+
+    if not isinstance(values, list) or len(values) != num_values:
+        raise InvalidCursor()
+
+    return values
+
+def decode_date_and_id_cursor(cursor):
+    '''Returns (date, id) for cursors made from a tournament's date and id.'''
+    values = decode_cursor(cursor, 2)
+    try:
+        return datetime.strptime(values[0], CURSOR_DATE_FORMAT), ObjectId(values[1])
+    except (TypeError, ValueError, InvalidId):
+        raise InvalidCursor()
+
 def _get_user_id_from_facebook_access_token(access_token):
     '''Calls Facebook's debug_token endpoint to validate the token. Returns the user id if validation passes,
     otherwise throws an exception.'''
@@ -147,8 +369,15 @@ class PlayerListResource(restful.Resource):
         return matching_players
 
     def get(self, region):
+        # a search covers every region's players, so only the region's own lists can be cached
+        if request.args.get('query') is not None:
+            return self.get_uncached(region)
+
+        return get_cached_response(region, lambda: self.get_uncached(region))
+
+    def get_uncached(self, region):
         args = player_list_get_parser.parse_args()
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = get_read_dao(region)
         return_dict = {}
 
         # single player matching alias within region
@@ -161,6 +390,27 @@ class PlayerListResource(restful.Resource):
         elif args['query'] is not None:
             all_players = dao.get_all_players(all_regions=True)
             return_dict['players'] = [p.get_json_dict() for p in self._get_players_matching_query(all_players, args['query'])]
+        # one page of players within region
+        elif args['limit'] is not None:
+            if args['limit'] <= 0:
+                return "limit must be positive", 400
+
+            after = None
+            if args['cursor'] is not None:
+                try:
+                    name, id = decode_cursor(args['cursor'], 2)
+                    after = (name, ObjectId(id))
+                except (InvalidCursor, TypeError, InvalidId):
+                    return "Invalid cursor", 400
+
+            # fetch one extra player to know whether there's another page
+            players = dao.get_players_page(args['limit'] + 1, after=after)
+            return_dict['next_cursor'] = None
+            if len(players) > args['limit']:
+                players = players[:args['limit']]
+                return_dict['next_cursor'] = encode_cursor([players[-1].name, str(players[-1].id)])
+
+            return_dict['players'] = [p.get_json_dict() for p in players]
         # all players within region
         else:
             return_dict['players'] = [p.get_json_dict() for p in dao.get_all_players()]
@@ -177,7 +427,7 @@ class PlayerListResource(restful.Resource):
 
 class PlayerResource(restful.Resource):
     def get(self, region, id):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = get_read_dao(region)
         player = dao.get_player_by_id(ObjectId(id))
 
         return_dict = player.get_json_dict()
@@ -186,7 +436,7 @@ class PlayerResource(restful.Resource):
         return return_dict
 
     def put(self, region, id):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = Dao(region, mongo_client=mongo_client, session=g.dao_session)
         player = dao.get_player_by_id(ObjectId(id))
 
         if not player:
@@ -209,61 +459,118 @@ class PlayerResource(restful.Resource):
             if player.name.lower() not in new_aliases:
                 return "aliases must contain the players name!", 400
             player.aliases = new_aliases
+        dirty_regions = []
         if args['regions']:
             for a in args['regions']:
                 if not isinstance(a, unicode):
                     return "each region must be a string", 400
+            dirty_regions = player.regions + args['regions']
             player.regions = args['regions']
 
         dao.update_player(player)
 
+        # region membership only decides who shows up in the rankings, ratings are unaffected. the player is
+        # written first so the versions mark_regions_dirty bumps come after it
+        if dirty_regions:
+            g.dao_session.flush()
+            Dao.mark_regions_dirty(mongo_client, dirty_regions)
+
+class PlayerRatingHistoryResource(restful.Resource):
+    def get(self, region, id):
+        dao = get_read_dao(region)
+        player = dao.get_player_by_id(ObjectId(id))
+
+        if not player:
+            return "No player found with that region/id.", 400
+
+        return_dict = {}
+        return_dict['player'] = {'id': str(player.id), 'name': player.name}
+
+        rating_history = dao.get_rating_history(player.id)
+        history = rating_history.history if rating_history else []
+
+        return_dict['history'] = [{
+                'tournament_id': str(h.tournament),
+                'date': h.date.strftime("%x"),
+                'mu': h.rating.trueskill_rating.mu,
+                'sigma': h.rating.trueskill_rating.sigma,
+                'rating': trueskill.expose(h.rating.trueskill_rating)
+            } for h in history]
+
+        return return_dict
+
 class PlayerRegionResource(restful.Resource):
     def put(self, region, id, region_to_change):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = Dao(region, mongo_client=mongo_client, session=g.dao_session)
         user = get_user_from_access_token(request.headers, dao)
         if not is_user_admin_for_region(user, region_to_change):
             return 'Permission denied', 403
 
-        player = dao.get_player_by_id(ObjectId(id))
-        if not region_to_change in player.regions:
-            player.regions.append(region_to_change)
-            dao.update_player(player)
+        player, changed = dao.add_region_to_player(ObjectId(id), region_to_change)
+        if changed:
+            Dao.mark_regions_dirty(mongo_client, [region_to_change])
 
-        return_dict = dao.get_player_by_id(player.id).get_json_dict()
+        return_dict = player.get_json_dict()
         convert_object_id(return_dict)
         return return_dict
 
     def delete(self, region, id, region_to_change):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = Dao(region, mongo_client=mongo_client, session=g.dao_session)
         user = get_user_from_access_token(request.headers, dao)
         if not is_user_admin_for_region(user, region_to_change):
             return 'Permission denied', 403
 
-        player = dao.get_player_by_id(ObjectId(id))
-        if region_to_change in player.regions:
-            player.regions.remove(region_to_change)
-            dao.update_player(player)
+        player, changed = dao.remove_region_from_player(ObjectId(id), region_to_change)
+        if changed:
+            Dao.mark_regions_dirty(mongo_client, [region_to_change])
 
-        return_dict = dao.get_player_by_id(player.id).get_json_dict()
+        return_dict = player.get_json_dict()
         convert_object_id(return_dict)
         return return_dict
 
 class TournamentListResource(restful.Resource):
     def get(self, region):
-        dao = Dao(region, mongo_client=mongo_client)
+        return get_cached_response(region, lambda: self.get_uncached(region))
+
+    def get_uncached(self, region):
+        dao = get_read_dao(region)
+        args = tournament_list_get_parser.parse_args()
         return_dict = {}
-        return_dict['tournaments'] = [t.get_json_dict() for t in dao.get_all_tournaments(regions=[region])]
+
+        before = None
+        before_id = None
+        if args['cursor'] is not None:
+            try:
+                before, before_id = decode_date_and_id_cursor(args['cursor'])
+            except InvalidCursor:
+                return "Invalid cursor", 400
+        elif args['before'] is not None:
+            try:
+                before = datetime.strptime(args['before'], '%Y-%m-%d')
+            except ValueError:
+                return "before must be a date formatted as YYYY-MM-DD", 400
+
+        limit = args['limit']
+        if limit is not None:
+            if limit <= 0:
+                return "limit must be positive", 400
+
+            # pages go back in time from the latest tournament, fetch one extra to know whether there's another page
+            tournaments = dao.get_tournament_summaries(regions=dao.region_ids, limit=limit + 1, before=before, before_id=before_id)
+            return_dict['next_cursor'] = None
+            if len(tournaments) > limit:
+                tournaments = tournaments[1:]
+                return_dict['next_cursor'] = encode_cursor(
+                        [tournaments[0].date.strftime(CURSOR_DATE_FORMAT), str(tournaments[0].id)])
+        else:
+            tournaments = dao.get_tournament_summaries(regions=dao.region_ids, before=before, before_id=before_id)
+
+        return_dict['tournaments'] = [t.get_json_dict() for t in tournaments]
         convert_object_id_list(return_dict['tournaments'])
 
         for t in return_dict['tournaments']:
             t['date'] = t['date'].strftime("%x")
 
-            # remove extra fields
-            del t['raw']
-            del t['matches']
-            del t['players']
-            del t['type']
-
         return return_dict
 
 def convert_tournament_to_response(tournament, dao):
@@ -286,17 +593,18 @@ def convert_tournament_to_response(tournament, dao):
 
     # remove extra fields
     del return_dict['raw']
+    return_dict.pop('raw_id', None)
 
     return return_dict
 
 class TournamentResource(restful.Resource):
     def get(self, region, id):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = get_read_dao(region)
         tournament = dao.get_tournament_by_id(ObjectId(id))
         return convert_tournament_to_response(tournament, dao)
 
     def put(self, region, id):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = Dao(region, mongo_client=mongo_client, session=g.dao_session)
         tournament = dao.get_tournament_by_id(ObjectId(id))
         if not tournament:
             return "No tournament found with that id.", 400
@@ -308,6 +616,10 @@ class TournamentResource(restful.Resource):
 
         args = tournament_put_parser.parse_args()
 
+        # the regions the tournament counted towards before the edit need recomputing too
+        old_regions = list(tournament.regions)
+        old_date = tournament.date
+
         #TODO: should we do validation that matches and players are compatible here?
         if args['name']:
             tournament.name = args['name']
@@ -333,44 +645,92 @@ class TournamentResource(restful.Resource):
                     return "each region must be a string", 400
             tournament.regions = args['regions']
 
-        dao.update_tournament(tournament)
+        # only the edited fields are written, the raw payload stays where it is
+        edited_fields = [f for f in ('name', 'date', 'players', 'matches', 'regions') if args[f]]
+        if edited_fields:
+            dao.update_tournament_fields(tournament, edited_fields)
+
+        if args['date'] or args['players'] or args['matches'] or args['regions']:
+            Dao.mark_regions_dirty(mongo_client, old_regions + tournament.regions, since=min(old_date, tournament.date))
         
 class TournamentRegionResource(restful.Resource):
     def put(self, region, id, region_to_change):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = Dao(region, mongo_client=mongo_client, session=g.dao_session)
         user = get_user_from_access_token(request.headers, dao)
         if not is_user_admin_for_region(user, region_to_change):
             return 'Permission denied', 403
 
-        tournament = dao.get_tournament_by_id(ObjectId(id))
-        if not region_to_change in tournament.regions:
-            tournament.regions.append(region_to_change)
-            dao.update_tournament(tournament)
+        tournament, changed = dao.add_region_to_tournament(ObjectId(id), region_to_change)
+        if changed:
+            Dao.mark_regions_dirty(mongo_client, [region_to_change], since=tournament.date)
 
-        return convert_tournament_to_response(dao.get_tournament_by_id(tournament.id), dao)
+        return convert_tournament_to_response(tournament, dao)
 
     def delete(self, region, id, region_to_change):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = Dao(region, mongo_client=mongo_client, session=g.dao_session)
         user = get_user_from_access_token(request.headers, dao)
         if not is_user_admin_for_region(user, region_to_change):
             return 'Permission denied', 403
 
-        tournament = dao.get_tournament_by_id(ObjectId(id))
-        if region_to_change in tournament.regions:
-            tournament.regions.remove(region_to_change)
-            dao.update_tournament(tournament)
+        tournament, changed = dao.remove_region_from_tournament(ObjectId(id), region_to_change)
+        if changed:
+            Dao.mark_regions_dirty(mongo_client, [region_to_change], since=tournament.date)
+
+        return convert_tournament_to_response(tournament, dao)
+
+def parse_season(args):
+    '''Returns the (start, end) dates given in args, or None if neither was given. Raises ValueError if
+    only one was given or they aren't dates formatted as YYYY-MM-DD.'''
+    if args['start'] is None and args['end'] is None:
+        return None
 
-        return convert_tournament_to_response(dao.get_tournament_by_id(tournament.id), dao)
+    if args['start'] is None or args['end'] is None:
+        raise ValueError('both start and end are required')
+
+    start = datetime.strptime(args['start'], '%Y-%m-%d')
+    end = datetime.strptime(args['end'], '%Y-%m-%d')
+    if start >= end:
+        raise ValueError('start must be before end')
+
+    return start, end
 
 class RankingsResource(restful.Resource):
     def get(self, region):
-        dao = Dao(region, mongo_client=mongo_client)
+        return get_cached_response(region, lambda: self.get_uncached(region))
+
+    def get_uncached(self, region):
+        dao = get_read_dao(region)
+        args = rankings_get_parser.parse_args()
+
+        try:
+            season = parse_season(args)
+        except ValueError:
+            return "start and end must both be dates formatted as YYYY-MM-DD, with start first", 400
+
+        # rebuild a historical ranking from the recorded rating deltas
+        if args['as_of'] is not None:
+            try:
+                as_of = datetime.strptime(args['as_of'], '%Y-%m-%d')
+            except ValueError:
+                return "as_of must be a date formatted as YYYY-MM-DD", 400
+
+            ranking = rankings.get_ranking_as_of(dao, as_of)
+        elif season is not None:
+            ranking = dao.get_season_ranking(*season)
+            if ranking is None:
+                return "No ranking found for that season.", 400
+        else:
+            ranking = dao.get_latest_ranking()
 
-        return_dict = dao.get_latest_ranking().get_json_dict()
-        del return_dict['_id']
+        return_dict = ranking.get_json_dict()
+        return_dict.pop('_id', None)
         return_dict['time'] = str(return_dict['time'])
         return_dict['tournaments'] = [str(t) for t in return_dict['tournaments']]
 
+        if season is not None:
+            return_dict['start'] = str(return_dict['start'])
+            return_dict['end'] = str(return_dict['end'])
+
         ranking_list = []
         for r in return_dict['ranking']:
             player = dao.get_player_by_id(r['player'])
@@ -384,62 +744,150 @@ class RankingsResource(restful.Resource):
         return return_dict
 
     def post(self, region):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = Dao(region, mongo_client=mongo_client, session=g.dao_session)
 
         user = get_user_from_access_token(request.headers, dao)
         if not is_user_admin_for_region(user, region):
             return 'Permission denied', 403
 
+        args = rankings_get_parser.parse_args()
+        try:
+            season = parse_season(args)
+        except ValueError:
+            return "start and end must both be dates formatted as YYYY-MM-DD, with start first", 400
+
         # we pass in now so we can mock it out in tests
         now = datetime.now()
-        rankings.generate_ranking(dao, now=now)
+        if season is not None:
+            rankings.generate_season_ranking(dao, season[0], season[1], now=now)
+        else:
+            rankings.generate_ranking(dao, now=now)
 
         return self.get(region)
 
+class SeasonListResource(restful.Resource):
+    def get(self, region):
+        return get_cached_response(region, lambda: self.get_uncached(region))
+
+    def get_uncached(self, region):
+        dao = get_read_dao(region)
+        return {'seasons': [{'start': str(start), 'end': str(end)} for start, end in dao.get_seasons()]}
+
 class MatchesResource(restful.Resource):
     def get(self, region, id):
-        dao = Dao(region, mongo_client=mongo_client)
+        dao = get_read_dao(region)
         args = matches_get_parser.parse_args()
         return_dict = {}
 
         player = dao.get_player_by_id(ObjectId(id))
         return_dict['player'] = {'id': str(player.id), 'name': player.name}
-        player_list = [player]
 
         opponent_id = args['opponent']
         if opponent_id is not None:
             opponent = dao.get_player_by_id(ObjectId(args['opponent']))
             return_dict['opponent'] = {'id': str(opponent.id), 'name': opponent.name}
-            player_list.append(opponent)
+
+        limit = args['limit']
+        if limit is not None and limit <= 0:
+            return "limit must be positive", 400
+
+        # the cursor is the date and id of the tournament of the last match on the previous page, and the
+        # index of that match in the tournament
+        starting_at = None
+        last_match_index = None
+        if args['cursor'] is not None:
+            try:
+                date, tournament_id, last_match_index = decode_cursor(args['cursor'], 3)
+                starting_at = (datetime.strptime(date, CURSOR_DATE_FORMAT), ObjectId(tournament_id))
+                if not isinstance(last_match_index, int):
+                    raise InvalidCursor()
+            except (InvalidCursor, TypeError, ValueError, InvalidId):
+                return "Invalid cursor", 400
 
         match_list = []
         return_dict['matches'] = match_list
         return_dict['wins'] = 0
         return_dict['losses'] = 0
+        if limit is not None:
+            return_dict['next_cursor'] = None
 
-        tournaments = dao.get_all_tournaments(players=player_list)
-        for tournament in tournaments:
-            for match in tournament.matches:
-                if (opponent_id is not None and match.contains_players(player.id, opponent.id)) or \
-                        (opponent_id is None and match.contains_player(player.id)):
-                    match_dict = {}
-                    match_dict['tournament_id'] = str(tournament.id)
-                    match_dict['tournament_name'] = tournament.name
-                    match_dict['tournament_date'] = tournament.date.strftime("%x")
-                    match_dict['opponent_id'] = str(match.get_opposing_player_id(player.id))
-                    match_dict['opponent_name'] = dao.get_player_by_id(ObjectId(match_dict['opponent_id'])).name
-
-                    if match.did_player_win(player.id):
-                        match_dict['result'] = 'win'
-                        return_dict['wins'] += 1
-                    else:
-                        match_dict['result'] = 'lose'
-                        return_dict['losses'] += 1
-
-                    match_list.append(match_dict)
+        if opponent_id is not None:
+            iter_matches = lambda starting_at: self._iter_head_to_head_matches(dao, player, opponent, starting_at)
+        else:
+            iter_matches = lambda starting_at: self._iter_player_matches(dao, player, starting_at)
+        matches = iter_matches(starting_at)
+
+        last_position = None
+        for tournament, i, match in matches:
+            if starting_at is not None and tournament.id == starting_at[1] and i <= last_match_index:
+                continue
+
+            if limit is not None and len(match_list) == limit:
+                return_dict['next_cursor'] = encode_cursor(last_position)
+                break
+
+            match_dict = {}
+            match_dict['tournament_id'] = str(tournament.id)
+            match_dict['tournament_name'] = tournament.name
+            match_dict['tournament_date'] = tournament.date.strftime("%x")
+            match_dict['opponent_id'] = str(match.get_opposing_player_id(player.id))
+            match_dict['opponent_name'] = dao.get_player_by_id(ObjectId(match_dict['opponent_id'])).name
+
+            if match.did_player_win(player.id):
+                match_dict['result'] = 'win'
+                return_dict['wins'] += 1
+            else:
+                match_dict['result'] = 'lose'
+                return_dict['losses'] += 1
+
+            match_list.append(match_dict)
+            last_position = [tournament.date.strftime(CURSOR_DATE_FORMAT), str(tournament.id), i]
+
+        # a page only holds some of the matches, but wins and losses are always the whole record
+        if limit is not None or starting_at is not None:
+            return_dict['wins'] = 0
+            return_dict['losses'] = 0
+            for tournament, i, match in iter_matches(None):
+                if match.did_player_win(player.id):
+                    return_dict['wins'] += 1
+                else:
+                    return_dict['losses'] += 1
 
         return return_dict
 
+    def _iter_player_matches(self, dao, player, starting_at):
+        '''Yields (tournament, index of the match in the tournament, match) for the player's matches in date order.'''
+        for tournament in dao.iter_all_tournaments(players=[player], starting_at=starting_at):
+            for i, match in enumerate(tournament.matches):
+                if match.contains_player(player.id):
+                    yield tournament, i, match
+
+    def _iter_head_to_head_matches(self, dao, player, opponent, starting_at):
+        '''Yields (tournament summary, index of the set among the pair's sets in the tournament, match) for every
+        set between player and opponent in date order.'''
+        i = 0
+        previous_tournament_id = None
+        for tournament, match in dao.get_head_to_head_matches(player, opponent, starting_at=starting_at):
+            i = i + 1 if tournament.id == previous_tournament_id else 0
+            previous_tournament_id = tournament.id
+
+            yield tournament, i, match
+
+class MetricsResource(restful.Resource):
+    def get(self):
+        # like the debug headers, timings and query counts are only shown when debugging or to admins
+        if not app.debug:
+            if not 'Authorization' in request.headers:
+                return 'Permission denied', 403
+
+            # TODO region doesn't matter, remove hardcode
+            dao = Dao('norcal', mongo_client=mongo_client)
+            user = get_user_from_access_token(request.headers, dao)
+            if not user.admin_regions:
+                return 'Permission denied', 403
+
+        return {'endpoints': request_metrics.get_json_dict()}
+
 class CurrentUserResource(restful.Resource):
     def get(self):
         # TODO region doesn't matter, remove hardcode
@@ -456,6 +904,7 @@ api.add_resource(RegionListResource, '/regions')
 
 api.add_resource(PlayerListResource, '/<string:region>/players')
 api.add_resource(PlayerResource, '/<string:region>/players/<string:id>')
+api.add_resource(PlayerRatingHistoryResource, '/<string:region>/players/<string:id>/history')
 api.add_resource(PlayerRegionResource, '/<string:region>/players/<string:id>/region/<string:region_to_change>')
 
 api.add_resource(MatchesResource, '/<string:region>/matches/<string:id>')
@@ -465,9 +914,12 @@ api.add_resource(TournamentResource, '/<string:region>/tournaments/<string:id>')
 api.add_resource(TournamentRegionResource, '/<string:region>/tournaments/<string:id>/region/<string:region_to_change>')
 
 api.add_resource(RankingsResource, '/<string:region>/rankings')
+api.add_resource(SeasonListResource, '/<string:region>/rankings/seasons')
 
 api.add_resource(CurrentUserResource, '/users/me')
 
+api.add_resource(MetricsResource, '/metrics')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(sys.argv[1]), debug=(sys.argv[2] == 'True'))
 
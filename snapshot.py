@@ -0,0 +1,226 @@
+from bisect import bisect_right
+from cache import RegionCache
+from dao import Dao, DATABASE_NAME
+from model import MatchResult, Tournament, TournamentSummary
+from replay import ColumnarReplay
+
+class RegionSnapshot(object):
+    '''A read-only in-memory image of a region: its players, its tournaments as flat match arrays (see
+    ColumnarReplay) and its latest ranking.
+
+    Besides the region's own tournaments, every tournament one of its players played in is loaded, so the
+    snapshot has the whole match history of each of its players.'''
+    def __init__(self, region_id, region_ids):
+        self.region_id = region_id
+        self.region_ids = region_ids
+
+        self.players = {}
+        self.alias_to_player = {}
+
+        # the players listed under region_id (or its members), sorted by (name, id) like a page of players
+        self.region_players = []
+        self.region_player_keys = []
+
+        self.replay = ColumnarReplay()
+        self.tournament_indexes = {}
+        self.tournament_types = []
+        self.tournament_regions = []
+
+        # player index in the replay -> indexes of the tournaments they entered
+        self.player_tournaments = {}
+
+        self.ranking = None
+
+    @classmethod
+    def load(cls, dao):
+        snapshot = cls(dao.region_id, dao.region_ids)
+
+        region_ids = set(dao.region_ids)
+        for player in dao.get_players_in_regions(list(region_ids)):
+            snapshot.players[player.id] = player
+
+            if not region_ids.isdisjoint(player.regions):
+                snapshot.region_players.append(player)
+                for alias in player.aliases:
+                    snapshot.alias_to_player.setdefault(alias, player)
+
+        snapshot.region_players.sort(key=lambda p: (p.name, p.id))
+        snapshot.region_player_keys = [(p.name, p.id) for p in snapshot.region_players]
+
+        for json_dict in dao.iter_snapshot_tournaments(snapshot.players.keys()):
+            snapshot.add_tournament(json_dict)
+
+        try:
+            snapshot.ranking = dao.get_latest_ranking()
+        except IndexError:
+            # the region hasn't been ranked yet
+            pass
+
+        return snapshot
+
+    def add_tournament(self, json_dict):
+        t = self.replay.get_num_tournaments()
+        self.replay.add_tournament(json_dict)
+        self.tournament_indexes[json_dict['_id']] = t
+        self.tournament_types.append(json_dict['type'])
+        self.tournament_regions.append(json_dict['regions'])
+
+        for i in self.replay.get_tournament_players(t):
+            self.player_tournaments.setdefault(i, []).append(t)
+
+    def get_player_tournament_indexes(self, player_id):
+        '''Indexes of the tournaments player_id entered, in (date, id) order.'''
+        i = self.replay.player_indexes.get(player_id)
+        return self.player_tournaments.get(i, []) if i is not None else []
+
+    def get_tournament(self, t):
+        '''Builds tournament t, without its raw payload.'''
+        player_ids = self.replay.player_ids
+
+        start, end = self.replay.get_match_range(t)
+        matches = [MatchResult(winner=player_ids[self.replay.winners[i]], loser=player_ids[self.replay.losers[i]])
+                   for i in xrange(start, end)]
+
+        return Tournament(
+                self.tournament_types[t],
+                '',
+                self.replay.tournament_dates[t],
+                self.replay.tournament_names[t],
+                [player_ids[i] for i in self.replay.get_tournament_players(t)],
+                matches,
+                list(self.tournament_regions[t]),
+                id=self.replay.tournament_ids[t])
+
+    def get_tournament_summary(self, t):
+        return TournamentSummary(
+                self.replay.tournament_names[t],
+                self.replay.tournament_dates[t],
+                list(self.tournament_regions[t]),
+                id=self.replay.tournament_ids[t])
+
+    def get_tournament_key(self, t):
+        return self.replay.tournament_dates[t], self.replay.tournament_ids[t]
+
+class SnapshotDao(object):
+    '''Answers the reads the GET resources make of a Dao from a RegionSnapshot. Anything the snapshot can't
+    answer exactly (other regions' players, rating histories, seasons...) goes to a Dao made by dao_factory,
+    which is only called the first time one is needed.'''
+    def __init__(self, snapshot, dao_factory):
+        self.snapshot = snapshot
+        self.dao_factory = dao_factory
+        self.dao = None
+
+        self.region_id = snapshot.region_id
+        self.region_ids = snapshot.region_ids
+
+    def get_dao(self):
+        if self.dao is None:
+            self.dao = self.dao_factory()
+
+        return self.dao
+
+    def __getattr__(self, name):
+        return getattr(self.get_dao(), name)
+
+    def get_player_by_id(self, id):
+        player = self.snapshot.players.get(id)
+        return player if player is not None else self.get_dao().get_player_by_id(id)
+
+    def get_players_by_ids(self, ids):
+        players = [self.snapshot.players[id] for id in ids if id in self.snapshot.players]
+        missing_ids = [id for id in ids if not id in self.snapshot.players]
+        if missing_ids:
+            players.extend(self.get_dao().get_players_by_ids(missing_ids))
+
+        return players
+
+    def get_player_by_alias(self, alias):
+        return self.snapshot.alias_to_player.get(alias.lower())
+
+    def get_all_players(self, all_regions=False):
+        if all_regions:
+            return self.get_dao().get_all_players(all_regions=True)
+
+        return list(self.snapshot.region_players)
+
+    def get_players_page(self, limit, after=None):
+        start = bisect_right(self.snapshot.region_player_keys, after) if after else 0
+        return self.snapshot.region_players[start:start + limit]
+
+    def get_tournament_by_id(self, id):
+        t = self.snapshot.tournament_indexes.get(id)
+        return self.snapshot.get_tournament(t) if t is not None else self.get_dao().get_tournament_by_id(id)
+
+    def get_tournament_summaries(self, regions=None, limit=None, before=None, before_id=None):
+        # only the tournaments of the snapshot's own regions are known to be complete
+        if not regions or not set(regions).issubset(self.region_ids):
+            return self.get_dao().get_tournament_summaries(regions=regions, limit=limit, before=before, before_id=before_id)
+
+        summaries = []
+        for t in xrange(self.snapshot.replay.get_num_tournaments()):
+            if set(regions).isdisjoint(self.snapshot.tournament_regions[t]):
+                continue
+
+            date, id = self.snapshot.get_tournament_key(t)
+            if before and before_id and (date, id) >= (before, before_id):
+                continue
+            elif before and not before_id and date >= before:
+                continue
+
+            summaries.append(self.snapshot.get_tournament_summary(t))
+
+        return summaries[-limit:] if limit else summaries
+
+    def _get_tournament_indexes(self, player_ids, starting_at):
+        '''Indexes of the tournaments every one of player_ids entered, in (date, id) order and from starting_at
+        on, or None if they aren't all in the snapshot.'''
+        if not all(id in self.snapshot.players for id in player_ids):
+            return None
+
+        indexes = set(self.snapshot.get_player_tournament_indexes(player_ids[0]))
+        for id in player_ids[1:]:
+            indexes.intersection_update(self.snapshot.get_player_tournament_indexes(id))
+
+        return [t for t in sorted(indexes) if not starting_at or self.snapshot.get_tournament_key(t) >= starting_at]
+
+    def iter_all_tournaments(self, players=None, regions=None, starting_at=None, **kwargs):
+        # only a player's tournaments are known to be complete
+        indexes = self._get_tournament_indexes([p.id for p in players], starting_at) if players else None
+        if indexes is None:
+            return self.get_dao().iter_all_tournaments(players=players, regions=regions, starting_at=starting_at, **kwargs)
+
+        return (self.snapshot.get_tournament(t) for t in indexes
+                if not regions or not set(regions).isdisjoint(self.snapshot.tournament_regions[t]))
+
+    def get_head_to_head_matches(self, player, opponent, starting_at=None):
+        # every set between them is in a tournament of whichever of them is in the snapshot
+        player_ids = [id for id in (player.id, opponent.id) if id in self.snapshot.players][:1]
+        if not player_ids:
+            return self.get_dao().get_head_to_head_matches(player, opponent, starting_at=starting_at)
+
+        head_to_head_matches = []
+        for t in self._get_tournament_indexes(player_ids, starting_at):
+            tournament = self.snapshot.get_tournament(t)
+            summary = self.snapshot.get_tournament_summary(t)
+            for match in tournament.matches:
+                if match.contains_players(player.id, opponent.id):
+                    head_to_head_matches.append((summary, match))
+
+        return head_to_head_matches
+
+    def get_latest_ranking(self):
+        if self.snapshot.ranking is None:
+            return self.get_dao().get_latest_ranking()
+
+        return self.snapshot.ranking
+
+class SnapshotStore(object):
+    '''Holds a process's snapshot of each region it has served. A snapshot is loaded again once its region's
+    version has moved, see RegionVersions.'''
+    def __init__(self, region_versions, database_name=DATABASE_NAME):
+        self.database_name = database_name
+        self.cache = RegionCache(region_versions)
+
+    def get_snapshot(self, mongo_client, region_id, now=None):
+        return self.cache.get(mongo_client, region_id, 'snapshot', lambda: RegionSnapshot.load(
+            Dao(region_id, mongo_client, database_name=self.database_name)), now=now)
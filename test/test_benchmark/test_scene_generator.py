@@ -0,0 +1,74 @@
+import unittest
+import mongomock
+from benchmark.scene_generator import SceneGenerator, SyntheticScraper
+from datetime import datetime
+from model import MatchResult
+
+REGION_NAME = 'bench'
+
+class TestSceneGenerator(unittest.TestCase):
+    def setUp(self):
+        self.mongo_client = mongomock.MongoClient()
+        self.scene_generator = SceneGenerator(num_players=20, tournaments_per_week=2, bracket_size=8, years=0.25, seed=1)
+
+    def test_get_num_tournaments(self):
+        self.assertEquals(self.scene_generator.get_num_tournaments(), 26)
+
+    def test_generate_matches(self):
+        entrants = self.scene_generator.aliases[:8]
+        matches = self.scene_generator.generate_matches(entrants)
+
+        # winners bracket, losers bracket and grand finals
+        self.assertEquals(len(matches), 7 + 6 + 1)
+
+        for match in matches:
+            self.assertTrue(match.winner in entrants)
+            self.assertTrue(match.loser in entrants)
+            self.assertNotEquals(match.winner, match.loser)
+
+    def test_generate_matches_odd_entrants(self):
+        entrants = self.scene_generator.aliases[:7]
+        matches = self.scene_generator.generate_matches(entrants)
+
+        players = set()
+        for match in matches:
+            players.add(match.winner)
+            players.add(match.loser)
+
+        self.assertEquals(players, set(entrants))
+
+    def test_generate_is_deterministic(self):
+        other_scene_generator = SceneGenerator(num_players=20, tournaments_per_week=2, bracket_size=8, years=0.25, seed=1)
+
+        date = datetime(2014, 1, 1)
+        self.assertEquals(self.scene_generator.generate_scraper(date).get_matches(), 
+                          other_scene_generator.generate_scraper(date).get_matches())
+
+    def test_generate(self):
+        dao = self.scene_generator.generate(self.mongo_client, REGION_NAME)
+
+        self.assertEquals(dao.region_id, REGION_NAME)
+        self.assertEquals(len(dao.get_all_players()), 20)
+
+        tournaments = dao.get_all_tournaments(regions=[REGION_NAME])
+        self.assertEquals(len(tournaments), 26)
+        self.assertEquals(tournaments[0].date, self.scene_generator.start_date)
+
+        for tournament in tournaments:
+            self.assertEquals(len(tournament.players), 8)
+            self.assertEquals(len(tournament.matches), 14)
+
+class TestSyntheticScraper(unittest.TestCase):
+    def setUp(self):
+        self.matches = [MatchResult(winner='a', loser='b'), MatchResult(winner='a', loser='c')]
+        self.scraper = SyntheticScraper('name', datetime(2014, 1, 1), self.matches)
+
+    def test_get_players(self):
+        self.assertEquals(set(self.scraper.get_players()), set(['a', 'b', 'c']))
+
+    def test_get_matches_returns_copies(self):
+        matches = self.scraper.get_matches()
+        self.assertEquals(matches, self.matches)
+
+        matches[0].winner = 'd'
+        self.assertEquals(self.scraper.get_matches(), self.matches)
@@ -0,0 +1,76 @@
+import unittest
+import mongomock
+from dao import Dao
+from model import *
+from cache import RegionVersions, RegionCache
+
+class TestRegionVersions(unittest.TestCase):
+    def setUp(self):
+        self.mongo_client = mongomock.MongoClient()
+        Dao.insert_region(Region('norcal', 'Norcal'), self.mongo_client)
+        self.region_versions = RegionVersions(5)
+
+    def test_get_version(self):
+        version = self.region_versions.get_version(self.mongo_client, 'norcal', now=0)
+        Dao.bump_region_versions(self.mongo_client, ['norcal'])
+
+        # not checked again yet
+        self.assertEquals(self.region_versions.get_version(self.mongo_client, 'norcal', now=4), version)
+        self.assertEquals(self.region_versions.get_version(self.mongo_client, 'norcal', now=5), version + 1)
+
+    def test_get_version_unknown_region(self):
+        self.assertEquals(self.region_versions.get_version(self.mongo_client, 'texas', now=0), 0)
+
+    def test_expire(self):
+        version = self.region_versions.get_version(self.mongo_client, 'norcal', now=0)
+        Dao.bump_region_versions(self.mongo_client, ['norcal'])
+        self.region_versions.expire()
+
+        self.assertEquals(self.region_versions.get_version(self.mongo_client, 'norcal', now=1), version + 1)
+
+class TestRegionCache(unittest.TestCase):
+    def setUp(self):
+        self.mongo_client = mongomock.MongoClient()
+        Dao.insert_region(Region('norcal', 'Norcal'), self.mongo_client)
+        Dao.insert_region(Region('texas', 'Texas'), self.mongo_client)
+        self.region_versions = RegionVersions(5)
+        self.builds = []
+
+    def build(self, value):
+        def build():
+            self.builds.append(value)
+            return value
+
+        return build
+
+    def test_get(self):
+        cache = RegionCache(self.region_versions)
+
+        self.assertEquals(cache.get(self.mongo_client, 'norcal', 'a', self.build(1), now=0), 1)
+        self.assertEquals(cache.get(self.mongo_client, 'norcal', 'a', self.build(2), now=1), 1)
+        self.assertEquals(cache.get(self.mongo_client, 'norcal', 'b', self.build(3), now=1), 3)
+        self.assertEquals(cache.get(self.mongo_client, 'texas', 'a', self.build(4), now=1), 4)
+        self.assertEquals(self.builds, [1, 3, 4])
+
+    def test_get_rebuilds_after_bump(self):
+        cache = RegionCache(self.region_versions)
+        cache.get(self.mongo_client, 'norcal', 'a', self.build(1), now=0)
+        cache.get(self.mongo_client, 'texas', 'a', self.build(2), now=0)
+        Dao.bump_region_versions(self.mongo_client, ['norcal'])
+
+        self.assertEquals(cache.get(self.mongo_client, 'norcal', 'a', self.build(3), now=5), 3)
+        self.assertEquals(cache.get(self.mongo_client, 'texas', 'a', self.build(4), now=5), 2)
+        self.assertEquals(self.builds, [1, 2, 3])
+
+    def test_max_entries(self):
+        cache = RegionCache(self.region_versions, max_entries=2)
+        cache.get(self.mongo_client, 'norcal', 'a', self.build(1), now=0)
+        cache.get(self.mongo_client, 'norcal', 'b', self.build(2), now=0)
+
+        # a is now the most recently used, so b goes
+        cache.get(self.mongo_client, 'norcal', 'a', self.build(3), now=0)
+        cache.get(self.mongo_client, 'norcal', 'c', self.build(4), now=0)
+
+        self.assertEquals(cache.get(self.mongo_client, 'norcal', 'a', self.build(5), now=0), 1)
+        self.assertEquals(cache.get(self.mongo_client, 'norcal', 'b', self.build(6), now=0), 6)
+        self.assertEquals(self.builds, [1, 2, 4, 6])
@@ -1,5 +1,5 @@
 import unittest
-from config.config import Config
+from config.config import Config, DEFAULT_MAX_POOL_SIZE, DEFAULT_CACHE_CHECK_SECONDS
 
 TEMPLATE_CONFIG_FILE = 'config/config.ini.template'
 
@@ -22,6 +22,34 @@ class TestConfig(unittest.TestCase):
     def test_get_db_password(self):
         self.assertEquals(self.config.get_db_password(), 'PASSWORD')
 
+    def test_get_db_max_pool_size(self):
+        self.assertEquals(self.config.get_db_max_pool_size(), 20)
+
+    def test_get_db_max_pool_size_default(self):
+        self.assertEquals(Config('does/not/exist.ini').get_db_max_pool_size(), DEFAULT_MAX_POOL_SIZE)
+
+    def test_get_db_timeouts_ms(self):
+        self.assertEquals(self.config.get_db_timeouts_ms(), {
+            'connect_timeout_ms': 5000,
+            'socket_timeout_ms': 30000,
+            'wait_queue_timeout_ms': 1000
+        })
+
+    def test_get_db_timeouts_ms_default(self):
+        self.assertEquals(Config('does/not/exist.ini').get_db_timeouts_ms(), {})
+
+    def test_get_snapshots_enabled(self):
+        self.assertFalse(self.config.get_snapshots_enabled())
+
+    def test_get_cache_check_seconds(self):
+        self.assertEquals(self.config.get_cache_check_seconds(), 5)
+
+    def test_get_cache_check_seconds_default(self):
+        self.assertEquals(Config('does/not/exist.ini').get_cache_check_seconds(), DEFAULT_CACHE_CHECK_SECONDS)
+
+    def test_get_response_cache_enabled(self):
+        self.assertFalse(self.config.get_response_cache_enabled())
+
     def test_challonge_api_key(self):
         self.assertEquals(self.config.get_challonge_api_key(), 'API_KEY')
 
@@ -1,10 +1,13 @@
 import unittest
-from dao import Dao, RegionNotFoundException, DuplicateAliasException, InvalidNameException, UpdateTournamentException
+from dao import Dao, DaoSession, LazyMongoClient, RegionNotFoundException, DuplicateAliasException, InvalidNameException, UpdateTournamentException
+from dao import compress_raw, decompress_raw
 from bson.objectid import ObjectId
 from model import *
 from ming import mim
 import trueskill
-from datetime import datetime
+import types
+from mock import patch, Mock
+from datetime import datetime, timedelta
 from pymongo.errors import DuplicateKeyError
 from pymongo import MongoClient
 
@@ -170,6 +173,13 @@ class TestDAO(unittest.TestCase):
         self.assertEquals(self.norcal_dao.get_player_by_id(self.player_3_id), self.player_3)
         self.assertIsNone(self.norcal_dao.get_player_by_id(ObjectId()))
 
+    def test_get_players_by_ids(self):
+        players = self.norcal_dao.get_players_by_ids([self.player_1_id, self.player_3_id, ObjectId()])
+        self.assertEquals(len(players), 2)
+        self.assertEquals(set(p.id for p in players), set([self.player_1_id, self.player_3_id]))
+
+        self.assertEquals(self.norcal_dao.get_players_by_ids([]), [])
+
     def test_get_player_by_alias(self):
         self.assertEquals(self.norcal_dao.get_player_by_alias('gar'), self.player_1)
         self.assertEquals(self.norcal_dao.get_player_by_alias('GAR'), self.player_1)
@@ -209,6 +219,18 @@ class TestDAO(unittest.TestCase):
     def test_get_all_players_all_regions(self):
         self.assertEquals(self.norcal_dao.get_all_players(all_regions=True), [self.player_1, self.player_3, self.player_2])
 
+    def test_get_players_page(self):
+        players = self.norcal_dao.get_all_players()
+
+        page = self.norcal_dao.get_players_page(2)
+        self.assertEquals(page, players[:2])
+
+        page = self.norcal_dao.get_players_page(2, after=(page[-1].name, page[-1].id))
+        self.assertEquals(page, players[2:4])
+
+        page = self.norcal_dao.get_players_page(10, after=(players[-1].name, players[-1].id))
+        self.assertEquals(page, [])
+
     def test_add_player_duplicate(self):
         with self.assertRaises(DuplicateKeyError):
             self.norcal_dao.insert_player(self.player_1)
@@ -256,6 +278,91 @@ class TestDAO(unittest.TestCase):
         self.assertEquals(self.norcal_dao.get_player_by_id(self.player_3_id), self.player_3)
         self.assertEquals(self.norcal_dao.get_player_by_id(self.player_1_id), player_1_clone)
 
+    def test_update_players(self):
+        player_1_clone = Player.from_json(self.player_1.get_json_dict())
+        player_2_clone = Player.from_json(self.player_2.get_json_dict())
+        player_1_clone.name = 'gaRRR'
+        player_2_clone.aliases.append('sluggo')
+
+        self.norcal_dao.update_players([player_1_clone, player_2_clone])
+
+        self.assertEquals(self.norcal_dao.get_player_by_id(self.player_1_id), player_1_clone)
+        self.assertEquals(self.norcal_dao.get_player_by_id(self.player_2_id), player_2_clone)
+        self.assertEquals(self.norcal_dao.get_player_by_id(self.player_3_id), self.player_3)
+
+    def test_lazy_mongo_client(self):
+        factory = Mock(return_value=self.mongo_client)
+        lazy_mongo_client = LazyMongoClient(factory)
+        self.assertFalse(factory.called)
+
+        self.assertEquals(lazy_mongo_client[DATABASE_NAME].name, DATABASE_NAME)
+        self.assertEquals(lazy_mongo_client[DATABASE_NAME].name, DATABASE_NAME)
+        self.assertEquals(factory.call_count, 1)
+
+    @patch('dao.os.getpid')
+    def test_lazy_mongo_client_after_fork(self, mock_getpid):
+        factory = Mock(return_value=self.mongo_client)
+        lazy_mongo_client = LazyMongoClient(factory)
+
+        mock_getpid.return_value = 1
+        lazy_mongo_client[DATABASE_NAME]
+        mock_getpid.return_value = 2
+        lazy_mongo_client[DATABASE_NAME]
+        lazy_mongo_client[DATABASE_NAME]
+
+        self.assertEquals(factory.call_count, 2)
+
+    def test_session_returns_same_player(self):
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=DaoSession(self.mongo_client, database_name=DATABASE_NAME))
+
+        player = dao.get_player_by_id(self.player_1_id)
+        self.assertIs(dao.get_player_by_id(self.player_1_id), player)
+        self.assertIs(dao.get_players_by_ids([self.player_1_id, self.player_2_id])[0], player)
+        self.assertIs(dao.get_player_by_alias('gar'), player)
+
+    def test_session_holds_updates_until_flush(self):
+        session = DaoSession(self.mongo_client, database_name=DATABASE_NAME)
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=session)
+
+        player = dao.get_player_by_id(self.player_1_id)
+        player.name = 'gaRRR'
+        dao.update_player(player)
+
+        self.assertEquals(self.norcal_dao.get_player_by_id(self.player_1_id), self.player_1)
+        self.assertEquals(dao.get_player_by_id(self.player_1_id).name, 'gaRRR')
+
+        self.assertEquals(session.flush(), 1)
+        self.assertEquals(self.norcal_dao.get_player_by_id(self.player_1_id), player)
+        self.assertEquals(session.flush(), 0)
+
+    def test_session_flushes_before_alias_query(self):
+        session = DaoSession(self.mongo_client, database_name=DATABASE_NAME)
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=session)
+
+        player = dao.get_player_by_id(self.player_1_id)
+        player.aliases.append('garrr')
+        dao.update_player(player)
+
+        self.assertIs(dao.get_player_by_alias('garrr'), player)
+        self.assertFalse(session.pending_players)
+
+    def test_session_delete_player_drops_pending_update(self):
+        session = DaoSession(self.mongo_client, database_name=DATABASE_NAME)
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=session)
+
+        player = dao.get_player_by_id(self.player_1_id)
+        dao.update_player(player)
+        dao.delete_player(player)
+
+        self.assertEquals(session.flush(), 0)
+        self.assertIsNone(dao.get_player_by_id(self.player_1_id))
+
+    def test_session_returns_same_tournament(self):
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=DaoSession(self.mongo_client, database_name=DATABASE_NAME))
+
+        tournament = dao.get_tournament_by_id(self.tournament_id_1)
+        self.assertIs(dao.get_tournament_by_id(self.tournament_id_1), tournament)
+
     def test_add_alias_to_player(self):
         new_alias = 'gaRRR'
         lowercase_alias = 'garrr'
@@ -272,6 +379,40 @@ class TestDAO(unittest.TestCase):
         with self.assertRaises(DuplicateAliasException):
             self.norcal_dao.add_alias_to_player(self.player_1, 'garr')
 
+    def test_add_region_to_player(self):
+        player, changed = self.norcal_dao.add_region_to_player(self.player_1_id, 'nyc')
+        self.assertTrue(changed)
+        self.assertEquals(player.regions, self.player_1.regions + ['nyc'])
+        self.assertEquals(self.norcal_dao.get_player_by_id(self.player_1_id), player)
+
+        player, changed = self.norcal_dao.add_region_to_player(self.player_1_id, 'nyc')
+        self.assertFalse(changed)
+        self.assertEquals(player.regions, self.player_1.regions + ['nyc'])
+
+    def test_remove_region_from_player(self):
+        player, changed = self.norcal_dao.remove_region_from_player(self.player_1_id, 'norcal')
+        self.assertTrue(changed)
+        self.assertFalse('norcal' in player.regions)
+        self.assertEquals(self.norcal_dao.get_player_by_id(self.player_1_id), player)
+
+        player, changed = self.norcal_dao.remove_region_from_player(self.player_1_id, 'norcal')
+        self.assertFalse(changed)
+
+    def test_add_region_to_player_session(self):
+        session = DaoSession(self.mongo_client, database_name=DATABASE_NAME)
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=session)
+
+        # the pending update has to land before the region is added, or the flush would undo it
+        pending_player = dao.get_player_by_id(self.player_1_id)
+        pending_player.name = 'gaRR'
+        dao.update_player(pending_player)
+
+        player, changed = dao.add_region_to_player(self.player_1_id, 'nyc')
+        self.assertEquals(session.flush(), 0)
+        self.assertIs(dao.get_player_by_id(self.player_1_id), player)
+        self.assertEquals(player.name, 'gaRR')
+        self.assertTrue('nyc' in player.regions)
+
     def test_update_player_name(self):
         self.assertEquals(self.norcal_dao.get_player_by_id(self.player_1_id).name, 'gaR')
         self.assertEquals(self.player_1.name, 'gaR')
@@ -332,6 +473,46 @@ class TestDAO(unittest.TestCase):
         self.assertEquals(tournament_2.players, self.tournament_players_2)
         self.assertEquals(tournament_2.regions, self.tournament_regions_2)
 
+    def test_add_region_to_tournament(self):
+        tournament, changed = self.norcal_dao.add_region_to_tournament(self.tournament_id_1, 'texas')
+        self.assertTrue(changed)
+        self.assertEquals(tournament.regions, self.tournament_regions_1 + ['texas'])
+
+        tournament, changed = self.norcal_dao.add_region_to_tournament(self.tournament_id_1, 'texas')
+        self.assertFalse(changed)
+
+        tournament = self.norcal_dao.get_tournament_by_id(self.tournament_id_1)
+        self.assertEquals(tournament.regions, self.tournament_regions_1 + ['texas'])
+        self.assertEquals(tournament.raw, self.tournament_raw_1)
+
+    def test_remove_region_from_tournament(self):
+        tournament, changed = self.norcal_dao.remove_region_from_tournament(self.tournament_id_1, 'norcal')
+        self.assertTrue(changed)
+        self.assertEquals(tournament.regions, [])
+
+        tournament, changed = self.norcal_dao.remove_region_from_tournament(self.tournament_id_1, 'norcal')
+        self.assertFalse(changed)
+
+    def test_add_region_to_tournament_session(self):
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=DaoSession(self.mongo_client, database_name=DATABASE_NAME))
+        dao.get_tournament_by_id(self.tournament_id_1)
+
+        tournament, changed = dao.add_region_to_tournament(self.tournament_id_1, 'texas')
+        self.assertIs(dao.get_tournament_by_id(self.tournament_id_1), tournament)
+        self.assertEquals(tournament.raw, self.tournament_raw_1)
+
+    def test_update_tournament_fields(self):
+        tournament = self.norcal_dao.get_tournament_by_id(self.tournament_id_2)
+        tournament.name = 'new tournament 2 name'
+        tournament.raw = 'not written'
+
+        self.norcal_dao.update_tournament_fields(tournament, ['name'])
+
+        tournament = self.norcal_dao.get_tournament_by_id(self.tournament_id_2)
+        self.assertEquals(tournament.name, 'new tournament 2 name')
+        self.assertEquals(tournament.raw, self.tournament_raw_2)
+        self.assertEquals(tournament.date, self.tournament_date_2)
+
     def test_update_tournament_empty_raw(self):
         tournament_2 = self.norcal_dao.get_tournament_by_id(self.tournament_id_2)
         tournament_2.raw = ''
@@ -339,6 +520,67 @@ class TestDAO(unittest.TestCase):
         with self.assertRaises(UpdateTournamentException):
             self.norcal_dao.update_tournament(tournament_2)
 
+    def test_insert_tournament_stores_raw_separately(self):
+        tournament_doc = self.norcal_dao.tournaments_col.find_one({'_id': self.tournament_id_1})
+        self.assertFalse('raw' in tournament_doc)
+        self.assertTrue('raw_id' in tournament_doc)
+
+        raw_file = self.norcal_dao.raw_files_col.find_one({'_id': tournament_doc['raw_id']})
+        self.assertEquals(raw_file['format'], 'text')
+        self.assertEquals(raw_file['encoding'], 'zlib')
+        self.assertEquals(decompress_raw(raw_file), self.tournament_raw_1)
+
+        self.assertEquals(self.tournament_1.raw_id, tournament_doc['raw_id'])
+        self.assertEquals(self.norcal_dao.get_raw_by_id(tournament_doc['raw_id']), self.tournament_raw_1)
+
+    def test_insert_tournament_challonge_raw(self):
+        raw = {'tournament': {'name': 'tournament'}, 'matches': [{'match': {'id': 1}}], 'participants': []}
+        tournament = Tournament('challonge', raw, datetime(2014, 1, 1), 'challonge tournament',
+                                [self.player_1_id, self.player_2_id],
+                                [MatchResult(winner=self.player_1_id, loser=self.player_2_id)],
+                                ['norcal'])
+        tournament_id = self.norcal_dao.insert_tournament(tournament)
+
+        self.assertEquals(self.norcal_dao.get_tournament_by_id(tournament_id).raw, raw)
+
+    def test_insert_tournament_empty_raw(self):
+        tournament = Tournament('tio', '', datetime(2014, 1, 1), 'no raw', [self.player_1_id, self.player_2_id],
+                                [MatchResult(winner=self.player_1_id, loser=self.player_2_id)], ['norcal'])
+        tournament_id = self.norcal_dao.insert_tournament(tournament)
+
+        self.assertEquals(self.norcal_dao.get_tournament_by_id(tournament_id).raw, '')
+
+        # stored before the empty raw was kept inline
+        self.norcal_dao.tournaments_col.update({'_id': tournament_id}, {'$unset': {'raw': ''}})
+        self.assertEquals(self.norcal_dao.get_tournament_by_id(tournament_id).raw, '')
+
+    def test_compress_raw(self):
+        raw = 'a' * 10000
+        raw_file = compress_raw(raw)
+
+        self.assertTrue(len(raw_file['data']) < len(raw))
+        self.assertEquals(decompress_raw(raw_file), raw)
+
+    def test_get_raw_by_id_missing(self):
+        self.assertIsNone(self.norcal_dao.get_raw_by_id(ObjectId()))
+
+    def test_offload_raw_payloads(self):
+        # simulate a tournament stored before raw payloads were offloaded
+        legacy_tournament_id = ObjectId()
+        legacy_raw = 'legacy raw'
+        legacy_tournament = Tournament('tio', legacy_raw, datetime(2013, 1, 1), 'legacy', [], [], ['norcal'],
+                                       id=legacy_tournament_id)
+        self.norcal_dao.tournaments_col.insert(legacy_tournament.get_json_dict())
+
+        self.assertEquals(Dao.offload_raw_payloads(self.mongo_client, database_name=DATABASE_NAME), 1)
+
+        tournament_doc = self.norcal_dao.tournaments_col.find_one({'_id': legacy_tournament_id})
+        self.assertFalse('raw' in tournament_doc)
+        self.assertEquals(self.norcal_dao.get_tournament_by_id(legacy_tournament_id).raw, legacy_raw)
+
+        # running it again is a no-op
+        self.assertEquals(Dao.offload_raw_payloads(self.mongo_client, database_name=DATABASE_NAME), 0)
+
     def test_get_all_tournament_ids(self):
         tournament_ids = self.norcal_dao.get_all_tournament_ids()
 
@@ -372,6 +614,144 @@ class TestDAO(unittest.TestCase):
         self.assertEquals(tournament_2.players, self.tournament_players_2)
         self.assertEquals(tournament_2.regions, self.tournament_regions_2)
 
+    def test_get_tournament_summaries(self):
+        summaries = self.norcal_dao.get_tournament_summaries(regions=['norcal'])
+
+        self.assertEquals(summaries, [
+            TournamentSummary(self.tournament_name_2, self.tournament_date_2, self.tournament_regions_2, id=self.tournament_id_2),
+            TournamentSummary(self.tournament_name_1, self.tournament_date_1, self.tournament_regions_1, id=self.tournament_id_1)])
+
+        summaries = self.norcal_dao.get_tournament_summaries(regions=['texas'])
+        self.assertEquals([s.id for s in summaries], [self.tournament_id_2])
+
+    def test_get_tournament_summaries_limit_before(self):
+        summaries = self.norcal_dao.get_tournament_summaries(limit=1)
+        self.assertEquals([s.id for s in summaries], [self.tournament_id_1])
+
+        summaries = self.norcal_dao.get_tournament_summaries(limit=1, before=self.tournament_date_1)
+        self.assertEquals([s.id for s in summaries], [self.tournament_id_2])
+
+        summaries = self.norcal_dao.get_tournament_summaries(before=self.tournament_date_2)
+        self.assertEquals(summaries, [])
+
+        summaries = self.norcal_dao.get_tournament_summaries(limit=5)
+        self.assertEquals([s.id for s in summaries], [self.tournament_id_2, self.tournament_id_1])
+
+    def test_iter_all_tournaments(self):
+        tournaments = self.norcal_dao.iter_all_tournaments(regions=['norcal'], batch_size=1)
+
+        # nothing is fetched until the generator is consumed
+        self.assertTrue(isinstance(tournaments, types.GeneratorType))
+
+        tournament = next(tournaments)
+        self.assertEquals(tournament.id, self.tournament_id_2)
+        self.assertEquals(tournament.raw, '')
+        self.assertEquals(tournament.matches, self.tournament_matches_2)
+
+        self.assertEquals([t.id for t in tournaments], [self.tournament_id_1])
+
+    def test_iter_all_tournaments_for_players(self):
+        tournaments = self.norcal_dao.iter_all_tournaments(players=[self.player_1])
+        self.assertEquals([t.id for t in tournaments], [self.tournament_id_1])
+
+    def test_iter_all_tournaments_starting_at(self):
+        tournaments = self.norcal_dao.iter_all_tournaments(starting_at=(self.tournament_date_2, self.tournament_id_2))
+        self.assertEquals([t.id for t in tournaments], [self.tournament_id_2, self.tournament_id_1])
+
+        tournaments = self.norcal_dao.iter_all_tournaments(starting_at=(self.tournament_date_1, self.tournament_id_1))
+        self.assertEquals([t.id for t in tournaments], [self.tournament_id_1])
+
+    def test_get_tournament_summaries_before_id(self):
+        summaries = self.norcal_dao.get_tournament_summaries(before=self.tournament_date_1, before_id=self.tournament_id_1)
+        self.assertEquals([s.id for s in summaries], [self.tournament_id_2])
+
+    def test_get_head_to_head_matches(self):
+        head_to_head_matches = self.norcal_dao.get_head_to_head_matches(self.player_4, self.player_3)
+
+        self.assertEquals([t.id for t, m in head_to_head_matches], [self.tournament_id_2, self.tournament_id_1])
+        self.assertEquals([t.name for t, m in head_to_head_matches], [self.tournament_name_2, self.tournament_name_1])
+        self.assertEquals([m for t, m in head_to_head_matches],
+                          [MatchResult(winner=self.player_3_id, loser=self.player_4_id)] * 2)
+
+        head_to_head_matches = self.norcal_dao.get_head_to_head_matches(
+                self.player_3, self.player_4, starting_at=(self.tournament_date_1, self.tournament_id_1))
+        self.assertEquals([t.id for t, m in head_to_head_matches], [self.tournament_id_1])
+
+        self.assertEquals(self.norcal_dao.get_head_to_head_matches(self.player_1, self.player_5), [])
+
+    def test_get_head_to_head_matches_aggregation(self):
+        document = {
+            '_id': self.tournament_id_1,
+            'name': self.tournament_name_1,
+            'date': self.tournament_date_1,
+            'regions': self.tournament_regions_1,
+            'matches': {'winner': self.player_3_id, 'loser': self.player_4_id}
+        }
+
+        with patch.object(self.norcal_dao.tournaments_col, 'aggregate', return_value={'result': [document], 'ok': 1.0}) as aggregate:
+            head_to_head_matches = self.norcal_dao.get_head_to_head_matches(self.player_3, self.player_4)
+
+        pipeline = aggregate.call_args[0][0]
+        self.assertEquals([stage.keys()[0] for stage in pipeline], ['$match', '$sort', '$project', '$unwind', '$match'])
+        self.assertEquals(head_to_head_matches, [(
+            TournamentSummary(self.tournament_name_1, self.tournament_date_1, self.tournament_regions_1, id=self.tournament_id_1),
+            MatchResult(winner=self.player_3_id, loser=self.player_4_id))])
+
+    def test_get_columnar_replay(self):
+        replay = self.norcal_dao.get_columnar_replay()
+
+        # tournament 2 is first because it occurs earlier than tournament 1
+        self.assertEquals(replay.tournament_ids, [self.tournament_id_2, self.tournament_id_1])
+        self.assertEquals(replay.tournament_names, [self.tournament_name_2, self.tournament_name_1])
+        self.assertEquals(replay.tournament_dates, [self.tournament_date_2, self.tournament_date_1])
+        self.assertEquals(replay.get_num_matches(), 4)
+
+        for t, tournament_matches in enumerate([self.tournament_matches_2, self.tournament_matches_1]):
+            start, end = replay.get_match_range(t)
+            matches = [MatchResult(winner=replay.player_ids[replay.winners[i]], loser=replay.player_ids[replay.losers[i]])
+                       for i in xrange(start, end)]
+            self.assertEquals(matches, tournament_matches)
+
+        self.assertEquals([replay.player_ids[i] for i in replay.get_tournament_players(1)], self.tournament_players_1)
+
+    def test_get_columnar_replay_starting_after(self):
+        replay = self.norcal_dao.get_columnar_replay(starting_after=(self.tournament_date_2, self.tournament_id_2))
+
+        self.assertEquals(replay.tournament_ids, [self.tournament_id_1])
+        self.assertEquals(replay.get_num_matches(), 2)
+
+    def test_get_columnar_replays(self):
+        region_id_to_replay_map = Dao.get_columnar_replays(self.mongo_client, ['norcal', 'texas'], database_name=DATABASE_NAME)
+
+        self.assertEquals(set(region_id_to_replay_map.keys()), set(['norcal', 'texas']))
+        self.assertEquals(region_id_to_replay_map['norcal'].tournament_ids, [self.tournament_id_2, self.tournament_id_1])
+        self.assertEquals(region_id_to_replay_map['texas'].tournament_ids, [self.tournament_id_2])
+        self.assertEquals(region_id_to_replay_map['texas'].get_num_matches(), 2)
+
+    def test_get_columnar_replays_unknown_region(self):
+        region_id_to_replay_map = Dao.get_columnar_replays(self.mongo_client, ['nyc'], database_name=DATABASE_NAME)
+
+        self.assertEquals(region_id_to_replay_map['nyc'].get_num_tournaments(), 0)
+
+    def test_get_columnar_replay_composite_region(self):
+        Dao.insert_region(Region('west', 'West', members=['norcal', 'texas']), self.mongo_client, database_name=DATABASE_NAME)
+        west_dao = Dao('west', self.mongo_client, database_name=DATABASE_NAME)
+        self.assertEquals(west_dao.region_ids, ['norcal', 'texas'])
+
+        # tournament 2 is in both members but only replayed once
+        replay = west_dao.get_columnar_replay()
+        self.assertEquals(replay.tournament_ids, [self.tournament_id_2, self.tournament_id_1])
+        self.assertEquals(replay.get_num_matches(), 4)
+
+        replay = west_dao.get_columnar_replay(starting_after=(self.tournament_date_2, self.tournament_id_2))
+        self.assertEquals(replay.tournament_ids, [self.tournament_id_1])
+
+    def test_get_columnar_replay_other_region(self):
+        replay = Dao('texas', self.mongo_client, database_name=DATABASE_NAME).get_columnar_replay()
+
+        self.assertEquals(replay.tournament_ids, [self.tournament_id_2])
+        self.assertEquals(replay.get_num_matches(), 2)
+
     def test_get_all_tournaments_for_region(self):
         tournaments = self.norcal_dao.get_all_tournaments(regions=['norcal'])
 
@@ -503,6 +883,126 @@ class TestDAO(unittest.TestCase):
 
         self.assertIsNone(self.norcal_dao.get_player_by_id(self.player_5_id))
 
+    def test_merge_players_only_writes_source_tournaments(self):
+        with patch.object(self.norcal_dao, 'update_tournament') as update_tournament, \
+                patch.object(self.norcal_dao, 'update_tournament_fields', wraps=self.norcal_dao.update_tournament_fields) as update_tournament_fields:
+            self.norcal_dao.merge_players(source=self.player_5, target=self.player_1)
+
+        self.assertFalse(update_tournament.called)
+        self.assertEquals([c[0][0].id for c in update_tournament_fields.call_args_list], [self.tournament_id_2])
+
+    def test_merge_players_marks_regions_dirty(self):
+        self.norcal_dao.merge_players(source=self.player_5, target=self.player_1)
+
+        # player 5 only entered tournament 2
+        dirty_regions = sorted(Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME), key=lambda d: d.region)
+        self.assertEquals([d.region for d in dirty_regions], self.tournament_regions_2)
+        self.assertEquals([d.since for d in dirty_regions], [self.tournament_date_2] * 2)
+
+    def test_bump_region_versions(self):
+        Dao.insert_region(Region('west', 'West', members=['norcal', 'socal']), self.mongo_client, database_name=DATABASE_NAME)
+        norcal_version = Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME)
+        texas_version = Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME)
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'nowhere', database_name=DATABASE_NAME), 0)
+
+        # inserting a region bumps it
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'west', database_name=DATABASE_NAME), 1)
+
+        Dao.bump_region_versions(self.mongo_client, ['norcal'], database_name=DATABASE_NAME)
+
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME), norcal_version + 1)
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME), texas_version)
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'west', database_name=DATABASE_NAME), 2)
+
+    def test_writes_bump_region_versions(self):
+        texas_version = Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME)
+
+        # player 1 is in texas too
+        self.norcal_dao.update_player_name(self.player_1, 'gaRR')
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME), texas_version + 1)
+
+        self.norcal_dao.remove_region_from_tournament(self.tournament_id_1, 'norcal')
+        self.assertTrue(Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME) > texas_version + 1)
+
+    def test_session_flush_bumps_old_regions(self):
+        session = DaoSession(self.mongo_client, database_name=DATABASE_NAME)
+        dao = Dao('norcal', self.mongo_client, database_name=DATABASE_NAME, session=session)
+        norcal_version = Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME)
+        texas_version = Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME)
+
+        player = dao.get_player_by_id(self.player_2_id)
+        player.regions = ['texas']
+        dao.update_player(player)
+        session.flush()
+
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME), norcal_version + 1)
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME), texas_version + 1)
+
+    def test_get_region_versions(self):
+        Dao.bump_region_versions(self.mongo_client, ['norcal'], database_name=DATABASE_NAME)
+
+        region_versions = Dao.get_region_versions(self.mongo_client, database_name=DATABASE_NAME)
+        self.assertEquals(region_versions['norcal'], Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME))
+        self.assertEquals(region_versions['texas'], Dao.get_region_version(self.mongo_client, 'texas', database_name=DATABASE_NAME))
+        self.assertFalse('west' in region_versions)
+
+    def test_rating_writes_bump_region_versions(self):
+        norcal_version = Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME)
+
+        self.norcal_dao.insert_rating_deltas([RatingDelta('norcal', self.tournament_id_1, self.tournament_date_1, [])])
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME), norcal_version + 1)
+
+        self.norcal_dao.delete_rating_deltas()
+        self.assertEquals(Dao.get_region_version(self.mongo_client, 'norcal', database_name=DATABASE_NAME), norcal_version + 2)
+
+    def test_mark_regions_dirty(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], since=datetime(2014, 5, 1), database_name=DATABASE_NAME)
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal', 'texas'], since=datetime(2014, 3, 1), database_name=DATABASE_NAME)
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], since=datetime(2014, 4, 1), database_name=DATABASE_NAME)
+
+        # the earliest date wins
+        dirty_regions = sorted(Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME), key=lambda d: d.region)
+        self.assertEquals([d.region for d in dirty_regions], ['norcal', 'texas'])
+        self.assertEquals([d.since for d in dirty_regions], [datetime(2014, 3, 1), datetime(2014, 3, 1)])
+        self.assertTrue(dirty_regions[0].updated >= dirty_regions[1].updated)
+
+    def test_mark_regions_dirty_composite_region(self):
+        Dao.insert_region(Region('west', 'West', members=['norcal', 'socal']), self.mongo_client, database_name=DATABASE_NAME)
+
+        Dao.mark_regions_dirty(self.mongo_client, ['texas'], database_name=DATABASE_NAME)
+        self.assertEquals([d.region for d in Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME)], ['texas'])
+
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], since=datetime(2014, 3, 1), database_name=DATABASE_NAME)
+        dirty_regions = sorted(Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME), key=lambda d: d.region)
+        self.assertEquals([d.region for d in dirty_regions], ['norcal', 'texas', 'west'])
+        self.assertEquals(dirty_regions[2].since, datetime(2014, 3, 1))
+
+    def test_mark_regions_dirty_without_since(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], database_name=DATABASE_NAME)
+        self.assertIsNone(Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME)[0].since)
+
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], since=datetime(2014, 3, 1), database_name=DATABASE_NAME)
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], database_name=DATABASE_NAME)
+        self.assertEquals(Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME)[0].since, datetime(2014, 3, 1))
+
+    def test_clear_dirty(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal', 'texas'], database_name=DATABASE_NAME)
+        dirty_region = [d for d in Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME) if d.region == 'norcal'][0]
+
+        self.norcal_dao.clear_dirty(dirty_region)
+        self.assertEquals([d.region for d in Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME)], ['texas'])
+
+    def test_clear_dirty_marked_again(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], database_name=DATABASE_NAME)
+        dirty_region = Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME)[0]
+
+        # an edit that happens during the recompute keeps the region dirty
+        self.mongo_client[DATABASE_NAME]['dirty_regions'].update(
+                {'_id': 'norcal'}, {'$set': {'updated': dirty_region.updated + timedelta(seconds=1)}})
+
+        self.norcal_dao.clear_dirty(dirty_region)
+        self.assertEquals([d.region for d in Dao.get_dirty_regions(self.mongo_client, database_name=DATABASE_NAME)], ['norcal'])
+
     def test_merge_players_none(self):
         with self.assertRaises(TypeError):
             self.norcal_dao.merge_players()
@@ -534,6 +1034,149 @@ class TestDAO(unittest.TestCase):
         self.assertEquals(rankings[1], self.ranking_entry_2)
         self.assertEquals(rankings[2], self.ranking_entry_4)
 
+    def test_get_season_ranking(self):
+        self.assertIsNone(self.norcal_dao.get_season_ranking(datetime(2013, 10, 1), datetime(2013, 11, 1)))
+
+        season_ranking = Ranking('norcal', datetime(2013, 12, 1), [self.tournament_id_1], [self.ranking_entry_1],
+                                 start=datetime(2013, 10, 1), end=datetime(2013, 11, 1))
+        self.norcal_dao.insert_ranking(season_ranking)
+        self.norcal_dao.insert_ranking(Ranking('norcal', datetime(2013, 12, 2), [], [],
+                                               start=datetime(2013, 7, 1), end=datetime(2013, 10, 1)))
+
+        ranking = self.norcal_dao.get_season_ranking(datetime(2013, 10, 1), datetime(2013, 11, 1))
+        self.assertEquals(ranking.tournaments, [self.tournament_id_1])
+        self.assertEquals(ranking.ranking, [self.ranking_entry_1])
+
+        # season rankings aren't the latest all time ranking
+        self.assertEquals(self.norcal_dao.get_latest_ranking().time, self.ranking_time_2)
+
+        self.assertEquals(self.norcal_dao.get_seasons(), [(datetime(2013, 10, 1), datetime(2013, 11, 1)),
+                                                          (datetime(2013, 7, 1), datetime(2013, 10, 1))])
+
+    def test_get_columnar_replay_season(self):
+        replay = self.norcal_dao.get_columnar_replay(start=self.tournament_date_2, end=self.tournament_date_1)
+        self.assertEquals(replay.tournament_ids, [self.tournament_id_2])
+
+        replay = self.norcal_dao.get_columnar_replay(start=self.tournament_date_1)
+        self.assertEquals(replay.tournament_ids, [self.tournament_id_1])
+
+    def test_insert_and_get_rating_deltas(self):
+        rating_delta_1 = RatingDelta('norcal', self.tournament_id_2, self.tournament_date_2, 
+                                     [PlayerRating(self.player_2_id, TrueskillRating())])
+        rating_delta_2 = RatingDelta('norcal', self.tournament_id_1, self.tournament_date_1, 
+                                     [PlayerRating(self.player_1_id, TrueskillRating())])
+        texas_rating_delta = RatingDelta('texas', self.tournament_id_2, self.tournament_date_2, 
+                                         [PlayerRating(self.player_1_id, TrueskillRating())])
+
+        self.norcal_dao.insert_rating_deltas([rating_delta_1, rating_delta_2, texas_rating_delta])
+
+        rating_deltas = self.norcal_dao.get_rating_deltas()
+        self.assertEquals(len(rating_deltas), 2)
+        self.assertEquals(rating_deltas[0].tournament, self.tournament_id_2)
+        self.assertEquals(rating_deltas[0].ratings, rating_delta_1.ratings)
+        self.assertEquals(rating_deltas[1].tournament, self.tournament_id_1)
+
+        rating_deltas = self.norcal_dao.get_rating_deltas(end=datetime(2013, 10, 12))
+        self.assertEquals(len(rating_deltas), 1)
+        self.assertEquals(rating_deltas[0].tournament, self.tournament_id_2)
+
+    def test_delete_rating_deltas(self):
+        self.norcal_dao.insert_rating_deltas([
+            RatingDelta('norcal', self.tournament_id_1, self.tournament_date_1, []),
+            RatingDelta('texas', self.tournament_id_1, self.tournament_date_1, [])])
+
+        self.norcal_dao.delete_rating_deltas()
+
+        self.assertEquals(self.norcal_dao.get_rating_deltas(), [])
+        self.assertEquals(self.norcal_dao.rating_deltas_col.find({'region': 'texas'}).count(), 1)
+
+    def test_delete_rating_deltas_after(self):
+        self.norcal_dao.insert_rating_deltas([
+            RatingDelta('norcal', self.tournament_id_2, self.tournament_date_2, []),
+            RatingDelta('norcal', self.tournament_id_1, self.tournament_date_1, [])])
+
+        self.norcal_dao.delete_rating_deltas(after=(self.tournament_date_2, self.tournament_id_2))
+
+        rating_deltas = self.norcal_dao.get_rating_deltas()
+        self.assertEquals([d.tournament for d in rating_deltas], [self.tournament_id_2])
+
+    def test_insert_and_get_rating_history(self):
+        history = [RatingHistoryEntry(self.tournament_id_2, self.tournament_date_2, TrueskillRating()),
+                   RatingHistoryEntry(self.tournament_id_1, self.tournament_date_1, TrueskillRating())]
+        self.norcal_dao.insert_rating_histories([RatingHistory('norcal', self.player_1_id, history),
+                                                 RatingHistory('texas', self.player_1_id, history[:1])])
+
+        rating_history = self.norcal_dao.get_rating_history(self.player_1_id)
+        self.assertEquals(rating_history.region, 'norcal')
+        self.assertEquals(rating_history.player, self.player_1_id)
+        self.assertEquals(rating_history.history, history)
+
+        self.assertIsNone(self.norcal_dao.get_rating_history(self.player_2_id))
+
+    def test_delete_rating_histories(self):
+        history = [RatingHistoryEntry(self.tournament_id_1, self.tournament_date_1, TrueskillRating())]
+        self.norcal_dao.insert_rating_histories([RatingHistory('norcal', self.player_1_id, history),
+                                                 RatingHistory('texas', self.player_1_id, history)])
+
+        self.norcal_dao.delete_rating_histories()
+
+        self.assertIsNone(self.norcal_dao.get_rating_history(self.player_1_id))
+        self.assertEquals(self.norcal_dao.rating_histories_col.find({'region': 'texas'}).count(), 1)
+
+    def test_delete_rating_histories_after(self):
+        history = [RatingHistoryEntry(self.tournament_id_2, self.tournament_date_2, TrueskillRating()),
+                   RatingHistoryEntry(self.tournament_id_1, self.tournament_date_1, TrueskillRating())]
+        self.norcal_dao.insert_rating_histories([RatingHistory('norcal', self.player_1_id, history),
+                                                 RatingHistory('norcal', self.player_2_id, history[1:])])
+
+        self.norcal_dao.delete_rating_histories(after=(self.tournament_date_2, self.tournament_id_2))
+
+        self.assertEquals(self.norcal_dao.get_rating_history(self.player_1_id).history, history[:1])
+        self.assertIsNone(self.norcal_dao.get_rating_history(self.player_2_id))
+
+    def test_get_rating_histories(self):
+        history = [RatingHistoryEntry(self.tournament_id_1, self.tournament_date_1, TrueskillRating())]
+        self.norcal_dao.insert_rating_histories([RatingHistory('norcal', self.player_1_id, history),
+                                                 RatingHistory('norcal', self.player_2_id, history),
+                                                 RatingHistory('texas', self.player_1_id, history)])
+
+        rating_histories = self.norcal_dao.get_rating_histories()
+        self.assertEquals(set(h.player for h in rating_histories), set([self.player_1_id, self.player_2_id]))
+        self.assertTrue(all(h.region == 'norcal' for h in rating_histories))
+
+    def test_insert_and_get_rating_checkpoints(self):
+        self.assertIsNone(self.norcal_dao.get_latest_rating_checkpoint())
+
+        ratings = [PlayerRating(self.player_1_id, TrueskillRating())]
+        self.norcal_dao.insert_rating_checkpoints([
+            RatingCheckpoint('norcal', self.tournament_id_2, self.tournament_date_2, 1, ratings),
+            RatingCheckpoint('norcal', self.tournament_id_1, self.tournament_date_1, 2, ratings),
+            RatingCheckpoint('texas', self.tournament_id_1, self.tournament_date_1, 3, ratings)])
+
+        rating_checkpoint = self.norcal_dao.get_latest_rating_checkpoint()
+        self.assertEquals(rating_checkpoint.index, 2)
+        self.assertEquals(rating_checkpoint.tournament, self.tournament_id_1)
+        self.assertEquals(rating_checkpoint.ratings, ratings)
+
+        # checkpoints on the before date are excluded
+        rating_checkpoint = self.norcal_dao.get_latest_rating_checkpoint(before=self.tournament_date_1)
+        self.assertEquals(rating_checkpoint.index, 1)
+
+        self.assertIsNone(self.norcal_dao.get_latest_rating_checkpoint(before=self.tournament_date_2))
+
+    def test_delete_rating_checkpoints(self):
+        self.norcal_dao.insert_rating_checkpoints([
+            RatingCheckpoint('norcal', self.tournament_id_2, self.tournament_date_2, 1, []),
+            RatingCheckpoint('norcal', self.tournament_id_1, self.tournament_date_1, 2, []),
+            RatingCheckpoint('texas', self.tournament_id_1, self.tournament_date_1, 3, [])])
+
+        self.norcal_dao.delete_rating_checkpoints(after_index=1)
+        self.assertEquals(self.norcal_dao.get_latest_rating_checkpoint().index, 1)
+
+        self.norcal_dao.delete_rating_checkpoints()
+        self.assertIsNone(self.norcal_dao.get_latest_rating_checkpoint())
+        self.assertEquals(self.norcal_dao.rating_checkpoints_col.find({'region': 'texas'}).count(), 1)
+
     def test_get_or_create_user_by_id_new_user(self):
         users = self.norcal_dao.get_all_users()
         self.assertEquals(len(users), 2)
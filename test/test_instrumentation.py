@@ -0,0 +1,132 @@
+import unittest
+import mongomock
+import threading
+from dao import has_bulk_api, replace_documents
+from instrumentation import InstrumentedMongoClient, InstrumentedCollection, QueryStats, ThreadLocalQueryStats, RequestMetrics
+from mock import Mock
+
+class BulkCollection(object):
+    '''A collection with the bulk api, which mongomock doesn't have.'''
+    def __init__(self):
+        self.bulk = Mock()
+
+    def initialize_unordered_bulk_op(self):
+        return self.bulk
+
+class TestInstrumentedMongoClient(unittest.TestCase):
+    def setUp(self):
+        self.mongo_client = InstrumentedMongoClient(mongomock.MongoClient())
+        self.collection = self.mongo_client['garpr_test']['test']
+
+        for i in xrange(5):
+            self.collection.insert({'i': i})
+
+        self.mongo_client.stats.reset()
+
+    def test_find(self):
+        documents = [d for d in self.collection.find().sort([('i', 1)])]
+
+        self.assertEquals([d['i'] for d in documents], range(5))
+        self.assertEquals(self.mongo_client.stats.queries, 1)
+        self.assertEquals(self.mongo_client.stats.documents, 5)
+        self.assertEquals(self.mongo_client.stats.writes, 0)
+        self.assertTrue(self.mongo_client.stats.bytes > 0)
+
+    def test_find_without_bytes(self):
+        stats = QueryStats(count_bytes=False)
+        mongo_client = InstrumentedMongoClient(self.mongo_client.mongo_client, stats=stats)
+        list(mongo_client['garpr_test']['test'].find())
+
+        self.assertEquals(stats.documents, 5)
+        self.assertEquals(stats.bytes, 0)
+
+    def test_find_index(self):
+        self.assertEquals(self.collection.find({'i': 3})[0]['i'], 3)
+
+        self.assertEquals(self.mongo_client.stats.queries, 1)
+        self.assertEquals(self.mongo_client.stats.documents, 1)
+
+    def test_find_one(self):
+        self.assertEquals(self.collection.find_one({'i': 3})['i'], 3)
+        self.assertIsNone(self.collection.find_one({'i': 10}))
+
+        self.assertEquals(self.mongo_client.stats.queries, 2)
+        self.assertEquals(self.mongo_client.stats.documents, 1)
+
+    def test_writes(self):
+        self.collection.insert({'i': 5})
+        self.collection.update({'i': 5}, {'$set': {'i': 6}})
+        self.collection.remove({'i': 6})
+
+        self.assertEquals(self.mongo_client.stats.queries, 0)
+        self.assertEquals(self.mongo_client.stats.writes, 3)
+
+    def test_bulk_writes(self):
+        stats = QueryStats()
+        collection = InstrumentedCollection(BulkCollection(), stats)
+        self.assertTrue(has_bulk_api(collection))
+
+        replace_documents(collection, [{'_id': 1, 'i': 1}, {'_id': 2, 'i': 2}])
+
+        self.assertEquals(collection.collection.bulk.find.call_count, 2)
+        self.assertTrue(collection.collection.bulk.execute.called)
+        self.assertEquals(stats.writes, 1)
+
+    def test_no_bulk_api(self):
+        self.assertFalse(has_bulk_api(self.collection))
+
+        replace_documents(self.collection, [{'_id': d['_id'], 'i': d['i'] + 10} for d in self.collection.find()])
+
+        self.assertEquals(sorted(d['i'] for d in self.collection.find()), range(10, 15))
+        self.assertEquals(self.mongo_client.stats.writes, 5)
+
+    def test_shared_stats(self):
+        stats = QueryStats()
+        mongo_client = InstrumentedMongoClient(mongomock.MongoClient(), stats=stats)
+        mongo_client['garpr_test']['a'].find_one()
+        mongo_client['garpr_test']['b'].find_one()
+
+        self.assertEquals(stats.get_json_dict(), {'queries': 2, 'documents': 0, 'bytes': 0, 'writes': 0})
+
+class TestThreadLocalQueryStats(unittest.TestCase):
+    def test_separate_threads(self):
+        stats = ThreadLocalQueryStats()
+        stats.queries += 1
+
+        thread_queries = []
+        def count_queries():
+            stats.reset()
+            stats.queries += 5
+            thread_queries.append(stats.queries)
+
+        thread = threading.Thread(target=count_queries)
+        thread.start()
+        thread.join()
+
+        self.assertEquals(thread_queries, [5])
+        self.assertEquals(stats.queries, 1)
+
+class TestRequestMetrics(unittest.TestCase):
+    def test_record(self):
+        metrics = RequestMetrics()
+
+        stats = QueryStats()
+        stats.queries = 2
+        stats.documents = 10
+        stats.bytes = 100
+        metrics.record('GET /regions', 0.5, stats)
+
+        stats.queries = 4
+        metrics.record('GET /regions', 1.5, stats)
+
+        json_dict = metrics.get_json_dict()['GET /regions']
+        self.assertEquals(json_dict['requests'], 2)
+        self.assertEquals(json_dict['wall_time'], 2.0)
+        self.assertEquals(json_dict['max_wall_time'], 1.5)
+        self.assertEquals(json_dict['mean_wall_time'], 1.0)
+        self.assertEquals(json_dict['queries'], 6)
+        self.assertEquals(json_dict['max_queries'], 4)
+        self.assertEquals(json_dict['mean_queries'], 3.0)
+        self.assertEquals(json_dict['documents'], 20)
+        self.assertEquals(json_dict['bytes'], 200)
+        self.assertEquals(json_dict['writes'], 0)
@@ -49,6 +49,11 @@ class TestTrueskillRating(unittest.TestCase):
     def test_from_json_none(self):
         self.assertIsNone(TrueskillRating.from_json(None))
 
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.default_rating_a, '__dict__'))
+        with self.assertRaises(AttributeError):
+            self.default_rating_a.foo = 'bar'
+
 class TestMatchResult(unittest.TestCase):
     def setUp(self):
         self.winner = ObjectId()
@@ -99,6 +104,9 @@ class TestMatchResult(unittest.TestCase):
     def test_from_json_none(self):
         self.assertIsNone(MatchResult.from_json(None))
 
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(MatchResult(winner=ObjectId(), loser=ObjectId()), '__dict__'))
+
 class TestPlayer(unittest.TestCase):
     def setUp(self):
         self.player_1_id = ObjectId()
@@ -290,6 +298,21 @@ class TestTournament(unittest.TestCase):
 
         self.assertEquals(self.tournament.get_json_dict(), self.tournament_json_dict)
 
+    def test_get_json_dict_with_raw_id(self):
+        raw_id = ObjectId()
+        self.tournament.raw_id = raw_id
+        self.tournament_json_dict['raw_id'] = raw_id
+
+        self.assertEquals(self.tournament.get_json_dict(), self.tournament_json_dict)
+
+    def test_from_json_with_raw_id(self):
+        raw_id = ObjectId()
+        self.tournament_json_dict['raw_id'] = raw_id
+
+        tournament = Tournament.from_json(self.tournament_json_dict)
+        self.assertEquals(tournament.raw_id, raw_id)
+        self.assertIsNone(Tournament.from_json(self.tournament.get_json_dict()).raw_id)
+
     def test_from_json(self):
         tournament = Tournament.from_json(self.tournament_json_dict)
         self.assertEquals(tournament.id, self.id)
@@ -361,6 +384,43 @@ class TestTournament(unittest.TestCase):
 
         self.assertTrue('Alias gar has no ID in map' in str(e.exception))
         
+class TestTournamentSummary(unittest.TestCase):
+    def setUp(self):
+        self.id = ObjectId()
+        self.name = 'tournament'
+        self.date = datetime.now()
+        self.regions = ['norcal', 'texas']
+        self.summary = TournamentSummary(self.name, self.date, self.regions, id=self.id)
+        self.summary_json_dict = {
+                '_id': self.id,
+                'name': self.name,
+                'date': self.date,
+                'regions': self.regions
+        }
+
+    def test_equals(self):
+        self.assertTrue(TournamentSummary.from_json(self.summary_json_dict) == self.summary)
+        self.assertFalse(TournamentSummary.from_json(self.summary_json_dict) != self.summary)
+
+    def test_get_json_dict(self):
+        self.assertEquals(self.summary.get_json_dict(), self.summary_json_dict)
+
+    def test_get_json_dict_missing_id(self):
+        summary = TournamentSummary(self.name, self.date, self.regions)
+        del self.summary_json_dict['_id']
+
+        self.assertEquals(summary.get_json_dict(), self.summary_json_dict)
+
+    def test_from_json(self):
+        summary = TournamentSummary.from_json(self.summary_json_dict)
+        self.assertEquals(summary.id, self.id)
+        self.assertEquals(summary.name, self.name)
+        self.assertEquals(summary.date, self.date)
+        self.assertEquals(summary.regions, self.regions)
+
+    def test_from_json_none(self):
+        self.assertIsNone(TournamentSummary.from_json(None))
+
 class TestRanking(unittest.TestCase):
     def setUp(self):
         self.ranking_id = ObjectId()
@@ -397,6 +457,20 @@ class TestRanking(unittest.TestCase):
         self.assertEquals(ranking.tournaments, self.ranking.tournaments)
         self.assertEquals(ranking.ranking, self.ranking.ranking)
 
+    def test_season(self):
+        start = datetime(2015, 1, 1)
+        end = datetime(2015, 4, 1)
+        self.ranking = Ranking(self.region, self.time, self.tournaments, self.rankings, id=self.ranking_id,
+                               start=start, end=end)
+        self.ranking_json_dict['start'] = start
+        self.ranking_json_dict['end'] = end
+
+        self.assertEquals(self.ranking.get_json_dict(), self.ranking_json_dict)
+
+        ranking = Ranking.from_json(self.ranking_json_dict)
+        self.assertEquals(ranking.start, start)
+        self.assertEquals(ranking.end, end)
+
     def test_from_json_missing_id(self):
         self.ranking = Ranking(self.region, self.time, self.tournaments, self.rankings)
         del self.ranking_json_dict['_id']
@@ -442,6 +516,202 @@ class TestRankingEntry(unittest.TestCase):
     def test_from_json_none(self):
         self.assertIsNone(RankingEntry.from_json(None))
 
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.ranking_entry, '__dict__'))
+
+class TestPlayerRating(unittest.TestCase):
+    def setUp(self):
+        self.player_id = ObjectId()
+        self.rating = TrueskillRating(trueskill_rating=trueskill.Rating(mu=2, sigma=3))
+        self.player_rating = PlayerRating(self.player_id, self.rating)
+        self.player_rating_json_dict = {
+                'player': self.player_id,
+                'mu': 2,
+                'sigma': 3
+        }
+
+    def test_equals(self):
+        self.assertTrue(self.player_rating == PlayerRating(self.player_id, self.rating))
+        self.assertFalse(self.player_rating == PlayerRating(ObjectId(), self.rating))
+
+    def test_not_equals(self):
+        self.assertFalse(self.player_rating != PlayerRating(self.player_id, self.rating))
+        self.assertTrue(self.player_rating != PlayerRating(self.player_id, TrueskillRating()))
+
+    def test_get_json_dict(self):
+        self.assertEquals(self.player_rating.get_json_dict(), self.player_rating_json_dict)
+
+    def test_from_json(self):
+        self.assertEquals(PlayerRating.from_json(self.player_rating_json_dict), self.player_rating)
+
+    def test_from_json_none(self):
+        self.assertIsNone(PlayerRating.from_json(None))
+
+class TestRatingDelta(unittest.TestCase):
+    def setUp(self):
+        self.id = ObjectId()
+        self.region = 'norcal'
+        self.tournament = ObjectId()
+        self.date = datetime.now()
+        self.ratings = [PlayerRating(ObjectId(), TrueskillRating()), PlayerRating(ObjectId(), TrueskillRating())]
+        self.rating_delta = RatingDelta(self.region, self.tournament, self.date, self.ratings, id=self.id)
+
+        self.rating_delta_json_dict = {
+                '_id': self.id,
+                'region': self.region,
+                'tournament': self.tournament,
+                'date': self.date,
+                'ratings': [r.get_json_dict() for r in self.ratings]
+        }
+
+    def test_get_json_dict(self):
+        self.assertEquals(self.rating_delta.get_json_dict(), self.rating_delta_json_dict)
+
+    def test_get_json_dict_missing_id(self):
+        self.rating_delta = RatingDelta(self.region, self.tournament, self.date, self.ratings)
+        del self.rating_delta_json_dict['_id']
+
+        self.assertEquals(self.rating_delta.get_json_dict(), self.rating_delta_json_dict)
+
+    def test_from_json(self):
+        rating_delta = RatingDelta.from_json(self.rating_delta_json_dict)
+        self.assertEquals(rating_delta.id, self.id)
+        self.assertEquals(rating_delta.region, self.region)
+        self.assertEquals(rating_delta.tournament, self.tournament)
+        self.assertEquals(rating_delta.date, self.date)
+        self.assertEquals(rating_delta.ratings, self.ratings)
+
+    def test_from_json_none(self):
+        self.assertIsNone(RatingDelta.from_json(None))
+
+class TestRatingHistoryEntry(unittest.TestCase):
+    def setUp(self):
+        self.tournament = ObjectId()
+        self.date = datetime.now()
+        self.rating = TrueskillRating(trueskill_rating=trueskill.Rating(mu=2, sigma=3))
+        self.rating_history_entry = RatingHistoryEntry(self.tournament, self.date, self.rating)
+        self.rating_history_entry_json_dict = {
+                'tournament': self.tournament,
+                'date': self.date,
+                'mu': 2,
+                'sigma': 3
+        }
+
+    def test_equals(self):
+        self.assertTrue(self.rating_history_entry == RatingHistoryEntry(self.tournament, self.date, self.rating))
+        self.assertFalse(self.rating_history_entry == RatingHistoryEntry(ObjectId(), self.date, self.rating))
+
+    def test_get_json_dict(self):
+        self.assertEquals(self.rating_history_entry.get_json_dict(), self.rating_history_entry_json_dict)
+
+    def test_from_json(self):
+        self.assertEquals(RatingHistoryEntry.from_json(self.rating_history_entry_json_dict), self.rating_history_entry)
+
+    def test_from_json_none(self):
+        self.assertIsNone(RatingHistoryEntry.from_json(None))
+
+class TestRatingHistory(unittest.TestCase):
+    def setUp(self):
+        self.id = ObjectId()
+        self.region = 'norcal'
+        self.player = ObjectId()
+        self.history = [RatingHistoryEntry(ObjectId(), datetime(2014, 1, 1), TrueskillRating()),
+                        RatingHistoryEntry(ObjectId(), datetime(2014, 1, 8), TrueskillRating())]
+        self.rating_history = RatingHistory(self.region, self.player, self.history, id=self.id)
+        self.rating_history_json_dict = {
+                '_id': self.id,
+                'region': self.region,
+                'player': self.player,
+                'history': [h.get_json_dict() for h in self.history]
+        }
+
+    def test_get_json_dict(self):
+        self.assertEquals(self.rating_history.get_json_dict(), self.rating_history_json_dict)
+
+    def test_from_json(self):
+        rating_history = RatingHistory.from_json(self.rating_history_json_dict)
+        self.assertEquals(rating_history.id, self.id)
+        self.assertEquals(rating_history.region, self.region)
+        self.assertEquals(rating_history.player, self.player)
+        self.assertEquals(rating_history.history, self.history)
+
+    def test_from_json_none(self):
+        self.assertIsNone(RatingHistory.from_json(None))
+
+class TestRatingCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.id = ObjectId()
+        self.region = 'norcal'
+        self.tournament = ObjectId()
+        self.date = datetime.now()
+        self.ratings = [PlayerRating(ObjectId(), TrueskillRating()), PlayerRating(ObjectId(), TrueskillRating())]
+        self.rating_checkpoint = RatingCheckpoint(self.region, self.tournament, self.date, 50, self.ratings, id=self.id)
+
+        self.rating_checkpoint_json_dict = {
+                '_id': self.id,
+                'region': self.region,
+                'tournament': self.tournament,
+                'date': self.date,
+                'index': 50,
+                'ratings': [r.get_json_dict() for r in self.ratings]
+        }
+
+    def test_get_json_dict(self):
+        self.assertEquals(self.rating_checkpoint.get_json_dict(), self.rating_checkpoint_json_dict)
+
+    def test_get_json_dict_missing_id(self):
+        self.rating_checkpoint = RatingCheckpoint(self.region, self.tournament, self.date, 50, self.ratings)
+        del self.rating_checkpoint_json_dict['_id']
+
+        self.assertEquals(self.rating_checkpoint.get_json_dict(), self.rating_checkpoint_json_dict)
+
+    def test_from_json(self):
+        rating_checkpoint = RatingCheckpoint.from_json(self.rating_checkpoint_json_dict)
+        self.assertEquals(rating_checkpoint.id, self.id)
+        self.assertEquals(rating_checkpoint.region, self.region)
+        self.assertEquals(rating_checkpoint.tournament, self.tournament)
+        self.assertEquals(rating_checkpoint.date, self.date)
+        self.assertEquals(rating_checkpoint.index, 50)
+        self.assertEquals(rating_checkpoint.ratings, self.ratings)
+
+    def test_from_json_none(self):
+        self.assertIsNone(RatingCheckpoint.from_json(None))
+
+class TestDirtyRegion(unittest.TestCase):
+    def setUp(self):
+        self.updated = datetime(2014, 11, 2)
+        self.since = datetime(2014, 10, 1)
+        self.dirty_region = DirtyRegion('norcal', self.updated, since=self.since)
+        self.dirty_region_json_dict = {
+                '_id': 'norcal',
+                'updated': self.updated,
+                'since': self.since
+        }
+
+    def test_equals(self):
+        self.assertTrue(DirtyRegion.from_json(self.dirty_region_json_dict) == self.dirty_region)
+        self.assertFalse(DirtyRegion.from_json(self.dirty_region_json_dict) != self.dirty_region)
+
+    def test_get_json_dict(self):
+        self.assertEquals(self.dirty_region.get_json_dict(), self.dirty_region_json_dict)
+
+    def test_get_json_dict_missing_since(self):
+        del self.dirty_region_json_dict['since']
+        self.assertEquals(DirtyRegion('norcal', self.updated).get_json_dict(), self.dirty_region_json_dict)
+
+    def test_from_json(self):
+        dirty_region = DirtyRegion.from_json(self.dirty_region_json_dict)
+        self.assertEquals(dirty_region.region, 'norcal')
+        self.assertEquals(dirty_region.updated, self.updated)
+        self.assertEquals(dirty_region.since, self.since)
+
+    def test_from_json_missing_since(self):
+        del self.dirty_region_json_dict['since']
+        self.assertIsNone(DirtyRegion.from_json(self.dirty_region_json_dict).since)
+
+    def test_from_json_none(self):
+        self.assertIsNone(DirtyRegion.from_json(None))
+
 class TestRegion(unittest.TestCase):
     def setUp(self):
         self.id = 'norcal'
@@ -471,6 +741,15 @@ class TestRegion(unittest.TestCase):
     def test_from_json_none(self):
         self.assertIsNone(Region.from_json(None))
 
+    def test_members(self):
+        region = Region('west', 'West', members=['norcal', 'socal'])
+        self.assertEquals(region.get_json_dict(), {'_id': 'west', 'display_name': 'West', 'members': ['norcal', 'socal']})
+        self.assertEquals(Region.from_json(region.get_json_dict()), region)
+        self.assertIsNone(self.region.members)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.region, '__dict__'))
+
 class TestUser(unittest.TestCase):
     def setUp(self):
         self.id = '123abc'
@@ -5,7 +5,7 @@ from bson.objectid import ObjectId
 from model import *
 from datetime import datetime
 import rankings
-from mock import patch
+from mock import patch, Mock
 
 delta = .001
 
@@ -196,3 +196,273 @@ class TestRankings(unittest.TestCase):
         self.assertEquals(entry.player, self.player_2_id)
         self.assertAlmostEquals(entry.rating, -1.349, delta=delta)
 
+
+    def test_generate_rankings_records_rating_deltas(self):
+        now = datetime(2013, 10, 17)
+
+        rankings.generate_ranking(self.dao, now=now)
+
+        rating_deltas = self.dao.get_rating_deltas()
+        self.assertEquals(len(rating_deltas), 2)
+
+        # deltas are in replay order
+        self.assertEquals(rating_deltas[0].tournament, self.tournament_id_2)
+        self.assertEquals(rating_deltas[0].date, self.tournament_date_2)
+        self.assertEquals(rating_deltas[1].tournament, self.tournament_id_1)
+        self.assertEquals(rating_deltas[1].date, self.tournament_date_1)
+
+        self.assertEquals(set(r.player for r in rating_deltas[0].ratings), 
+                          set([self.player_2_id, self.player_3_id, self.player_4_id, self.player_5_id]))
+        self.assertEquals(set(r.player for r in rating_deltas[1].ratings), set(self.tournament_players_1))
+
+        # the last delta for each player matches their final rating
+        for player_rating in rating_deltas[1].ratings:
+            self.assertEquals(player_rating.rating, self.dao.get_player_by_id(player_rating.player).ratings['norcal'])
+
+        # regenerating replaces the old deltas
+        rankings.generate_ranking(self.dao, now=now)
+        self.assertEquals(len(self.dao.get_rating_deltas()), 2)
+
+    def test_get_ranking_as_of_latest(self):
+        now = datetime(2013, 10, 17)
+
+        rankings.generate_ranking(self.dao, now=now)
+        ranking = rankings.get_ranking_as_of(self.dao, now)
+        latest_ranking = self.dao.get_latest_ranking()
+
+        self.assertEquals(ranking.region, self.region_id)
+        self.assertEquals(ranking.time, now)
+        self.assertEquals(set(ranking.tournaments), set(self.tournament_ids))
+        self.assertEquals(len(ranking.ranking), len(latest_ranking.ranking))
+
+        for entry, latest_entry in zip(ranking.ranking, latest_ranking.ranking):
+            self.assertEquals(entry.rank, latest_entry.rank)
+            self.assertEquals(entry.player, latest_entry.player)
+            self.assertAlmostEquals(entry.rating, latest_entry.rating, delta=delta)
+
+    def test_get_ranking_as_of_before_latest_tournament(self):
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+
+        # only tournament 2 has happened
+        ranking = rankings.get_ranking_as_of(self.dao, datetime(2013, 10, 12))
+        self.assertEquals(ranking.tournaments, [self.tournament_id_2])
+
+        # player 1 hasn't played yet and player 3 isn't in the region
+        ranking_list = ranking.ranking
+        self.assertEquals(len(ranking_list), 3)
+        self.assertEquals([e.rank for e in ranking_list], [1, 2, 3])
+        self.assertEquals(ranking_list[0].player, self.player_5_id)
+        self.assertEquals(set(e.player for e in ranking_list[1:]), set([self.player_2_id, self.player_4_id]))
+
+    def test_get_ranking_as_of_counts_the_whole_day(self):
+        # a challonge bracket created in the evening of the as_of date
+        self.tournament_2.date = datetime(2013, 10, 10, 20, 39)
+        self.dao.update_tournament(self.tournament_2)
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+
+        ranking = rankings.get_ranking_as_of(self.dao, datetime(2013, 10, 10))
+        self.assertEquals(ranking.tournaments, [self.tournament_id_2])
+        self.assertEquals(len(ranking.ranking), 3)
+
+    def test_get_ranking_as_of_excluded_for_inactivity(self):
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+
+        ranking = rankings.get_ranking_as_of(self.dao, datetime(2013, 11, 25))
+        self.assertEquals([e.player for e in ranking.ranking], [self.player_1_id, self.player_4_id, self.player_2_id])
+
+    def test_get_ranking_as_of_before_history(self):
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+
+        ranking = rankings.get_ranking_as_of(self.dao, datetime(2012, 1, 1))
+        self.assertEquals(ranking.tournaments, [])
+        self.assertEquals(ranking.ranking, [])
+
+    def test_generate_rankings_records_rating_histories(self):
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+
+        # player 2 played in both tournaments
+        rating_history = self.dao.get_rating_history(self.player_2_id)
+        self.assertEquals([h.tournament for h in rating_history.history], [self.tournament_id_2, self.tournament_id_1])
+        self.assertEquals([h.date for h in rating_history.history], [self.tournament_date_2, self.tournament_date_1])
+        self.assertEquals(rating_history.history[-1].rating, self.dao.get_player_by_id(self.player_2_id).ratings['norcal'])
+
+        # player 1 only played in tournament 1
+        rating_history = self.dao.get_rating_history(self.player_1_id)
+        self.assertEquals([h.tournament for h in rating_history.history], [self.tournament_id_1])
+
+        # regenerating replaces the old histories
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+        self.assertEquals(len(self.dao.get_rating_history(self.player_2_id).history), 2)
+
+    def test_generate_rankings_reports_progress(self):
+        progress = rankings.RankingProgress()
+        progress.on_tournament = Mock()
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17), progress=progress)
+
+        self.assertEquals([p.name for p in progress.phases], [
+            'load checkpoint', 'load tournaments', 'load players', 'rate', 'inactivity',
+            'write players', 'write rating history', 'insert ranking'])
+        self.assertEquals([p.count for p in progress.phases], [0, 2, 5, 4, 5, 5, 2, 4])
+        self.assertTrue(all(p.wall_time >= 0 for p in progress.phases))
+
+        self.assertEquals(progress.on_tournament.call_count, 2)
+        progress.on_tournament.assert_called_with(2, 2, self.tournament_name_1)
+
+        json_dict = progress.get_json_dict()
+        self.assertEquals(len(json_dict['phases']), 8)
+        self.assertEquals(json_dict['wall_time'], sum(p.wall_time for p in progress.phases))
+
+    @patch('rankings.CHECKPOINT_INTERVAL', 1)
+    def test_generate_rankings_saves_checkpoints(self):
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+
+        checkpoint = self.dao.get_latest_rating_checkpoint()
+        self.assertEquals(checkpoint.index, 2)
+        self.assertEquals(checkpoint.tournament, self.tournament_id_1)
+        self.assertEquals(checkpoint.date, self.tournament_date_1)
+        self.assertEquals(set(r.player for r in checkpoint.ratings), set(p.id for p in self.players))
+
+        # the first checkpoint only has the players from tournament 2
+        checkpoint = self.dao.get_latest_rating_checkpoint(before=self.tournament_date_1)
+        self.assertEquals(checkpoint.index, 1)
+        self.assertEquals(checkpoint.tournament, self.tournament_id_2)
+        self.assertEquals(set(r.player for r in checkpoint.ratings), set(self.tournament_players_2))
+        for player_rating in checkpoint.ratings:
+            self.assertEquals(player_rating.rating, self.dao.get_rating_history(player_rating.player).history[0].rating)
+
+    @patch('rankings.CHECKPOINT_INTERVAL', 1)
+    def test_generate_rankings_resumes_from_checkpoint(self):
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 17))
+
+        # fix a result in tournament 1, only it needs to be replayed
+        self.tournament_1.matches[0] = MatchResult(winner=self.player_2_id, loser=self.player_1_id)
+        self.dao.update_tournament(self.tournament_1)
+
+        progress = rankings.RankingProgress()
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 18), progress=progress, since=self.tournament_date_1)
+        self.assertEquals([p.count for p in progress.phases[:2]], [1, 1])
+
+        resumed_players = [self.dao.get_player_by_id(p.id) for p in self.players]
+        resumed_ranking = self.dao.get_latest_ranking()
+        resumed_deltas = self.dao.get_rating_deltas()
+        resumed_histories = [self.dao.get_rating_history(p.id) for p in self.players]
+        self.assertEquals(self.dao.get_latest_rating_checkpoint().index, 2)
+
+        # a full replay ends up in the same place
+        rankings.generate_ranking(self.dao, now=datetime(2013, 10, 19))
+
+        self.assertEquals(resumed_players, [self.dao.get_player_by_id(p.id) for p in self.players])
+        self.assertEquals(set(resumed_ranking.tournaments), set(self.tournament_ids))
+        self.assertEquals([e.get_json_dict() for e in resumed_ranking.ranking],
+                          [e.get_json_dict() for e in self.dao.get_latest_ranking().ranking])
+        self.assertEquals(len(resumed_deltas), 2)
+        for resumed_delta, rating_delta in zip(resumed_deltas, self.dao.get_rating_deltas()):
+            self.assertEquals(resumed_delta.tournament, rating_delta.tournament)
+            self.assertEquals(dict((r.player, r.rating) for r in resumed_delta.ratings),
+                              dict((r.player, r.rating) for r in rating_delta.ratings))
+        self.assertEquals([h.history for h in resumed_histories],
+                          [self.dao.get_rating_history(p.id).history for p in self.players])
+
+    @patch('rankings.CHECKPOINT_INTERVAL', 1)
+    def test_generate_rankings_without_earlier_checkpoint(self):
+        now = datetime(2013, 10, 17)
+        rankings.generate_ranking(self.dao, now=now)
+
+        # nothing was checkpointed before tournament 2, so everything is replayed
+        progress = rankings.RankingProgress()
+        rankings.generate_ranking(self.dao, now=now, progress=progress, since=self.tournament_date_2)
+        self.assertEquals([p.count for p in progress.phases[:2]], [0, 2])
+        self.assertEquals(len(self.dao.get_rating_deltas()), 2)
+        self.assertEquals(self.dao.get_latest_rating_checkpoint().index, 2)
+
+    def test_generate_rankings_default_now(self):
+        # the default is the time of the call, not of the import
+        before = datetime.now()
+        rankings.generate_ranking(self.dao)
+        rankings.generate_all_rankings(self.mongo_client)
+
+        self.assertTrue(all(r['time'] >= before for r in self.dao.rankings_col.find()))
+
+    def test_generate_all_rankings(self):
+        now = datetime(2013, 10, 17)
+        Dao.insert_region(Region('texas', 'Texas'), self.mongo_client)
+        texas_dao = Dao('texas', mongo_client=self.mongo_client)
+
+        # one scan feeds both regions, nothing is loaded per region or per player
+        with patch.object(Dao, 'get_columnar_replay') as get_columnar_replay, \
+                patch.object(Dao, 'iter_all_tournaments') as iter_all_tournaments:
+            rankings.generate_all_rankings(self.mongo_client, now=now)
+            self.assertFalse(get_columnar_replay.called)
+            self.assertFalse(iter_all_tournaments.called)
+
+        norcal_ranking = self.dao.get_latest_ranking()
+        texas_ranking = texas_dao.get_latest_ranking()
+        self.assertEquals(norcal_ranking.tournaments, [self.tournament_id_2, self.tournament_id_1])
+        self.assertEquals(texas_ranking.tournaments, [self.tournament_id_2])
+        norcal_players = [self.dao.get_player_by_id(p.id) for p in self.players]
+
+        # the same as generating each region on its own
+        rankings.generate_ranking(self.dao, now=now)
+        rankings.generate_ranking(texas_dao, now=now)
+        self.assertEquals(norcal_players, [self.dao.get_player_by_id(p.id) for p in self.players])
+        self.assertEquals([e.get_json_dict() for e in norcal_ranking.ranking],
+                          [e.get_json_dict() for e in self.dao.get_latest_ranking().ranking])
+        self.assertEquals([e.get_json_dict() for e in texas_ranking.ranking],
+                          [e.get_json_dict() for e in texas_dao.get_latest_ranking().ranking])
+        self.assertTrue('texas' in self.dao.get_player_by_id(self.player_5_id).ratings)
+
+    def test_generate_rankings_composite_region(self):
+        now = datetime(2013, 10, 17)
+        Dao.insert_region(Region('texas', 'Texas'), self.mongo_client)
+        Dao.insert_region(Region('west', 'West', members=['norcal', 'texas']), self.mongo_client)
+        west_dao = Dao('west', mongo_client=self.mongo_client)
+
+        rankings.generate_ranking(west_dao, now=now)
+        west_ranking = west_dao.get_latest_ranking()
+
+        # tournament 2 is in both members but only counted once, so the ranking matches norcal's
+        rankings.generate_ranking(self.dao, now=now)
+        norcal_ranking = self.dao.get_latest_ranking()
+
+        self.assertEquals(west_ranking.region, 'west')
+        self.assertEquals(west_ranking.tournaments, [self.tournament_id_2, self.tournament_id_1])
+        self.assertEquals([e.get_json_dict() for e in west_ranking.ranking],
+                          [e.get_json_dict() for e in norcal_ranking.ranking])
+        self.assertEquals(self.dao.get_player_by_id(self.player_1_id).ratings['west'],
+                          self.dao.get_player_by_id(self.player_1_id).ratings['norcal'])
+
+        # generating everything at once merges the members' replays
+        rankings.generate_all_rankings(self.mongo_client, now=datetime(2013, 10, 18))
+        self.assertEquals([e.get_json_dict() for e in west_dao.get_latest_ranking().ranking],
+                          [e.get_json_dict() for e in west_ranking.ranking])
+
+    def test_generate_season_ranking(self):
+        now = datetime(2013, 12, 1)
+        start = datetime(2013, 10, 1)
+        end = datetime(2013, 10, 11)
+
+        with patch.object(self.dao, 'get_columnar_replay', wraps=self.dao.get_columnar_replay) as get_columnar_replay:
+            rankings.generate_season_ranking(self.dao, start, end, now=now)
+            get_columnar_replay.assert_called_once_with(start=start, end=end)
+
+        # only tournament 2 is in the season, player 3 isn't in the region
+        ranking = self.dao.get_season_ranking(start, end)
+        self.assertEquals(ranking.time, now)
+        self.assertEquals(ranking.tournaments, [self.tournament_id_2])
+        self.assertEquals([e.rank for e in ranking.ranking], [1, 2, 3])
+        self.assertEquals(ranking.ranking[0].player, self.player_5_id)
+        self.assertEquals(set(e.player for e in ranking.ranking[1:]), set([self.player_2_id, self.player_4_id]))
+
+        # players' ratings are left alone
+        self.assertEquals(self.dao.get_player_by_id(self.player_5_id).ratings['norcal'], TrueskillRating())
+        self.assertEquals(self.dao.get_seasons(), [(start, end)])
+
+    def test_generate_season_ranking_default_now(self):
+        before = datetime.now()
+        rankings.generate_season_ranking(self.dao, datetime(2013, 10, 1), datetime(2013, 10, 11))
+
+        self.assertTrue(self.dao.get_season_ranking(datetime(2013, 10, 1), datetime(2013, 10, 11)).time >= before)
+
+    def test_ranking_phase_throughput(self):
+        self.assertEquals(rankings.RankingPhase('rate', 2.0, 10).get_throughput(), 5.0)
+        self.assertEquals(rankings.RankingPhase('rate', 0.0, 10).get_throughput(), 0.0)
@@ -1,6 +1,10 @@
 import unittest
+import random
 import rating_calculators
+import trueskill
+from array import array
 from bson.objectid import ObjectId
+from mock import patch
 from model import Player, TrueskillRating
 
 class TestRatingCalculators(unittest.TestCase):
@@ -26,3 +30,56 @@ class TestRatingCalculators(unittest.TestCase):
 
         self.assertTrue(self.player_2.ratings[self.region_id].trueskill_rating.mu < 25)
         self.assertTrue(self.player_2.ratings['socal'].trueskill_rating.mu == 25)
+
+    def test_update_trueskill_ratings_from_arrays(self):
+        mus = array('d', [25.0] * 3)
+        sigmas = array('d', [25.0 / 3] * 3)
+        winners = array('i', [0, 2, 1])
+        losers = array('i', [1, 0, 2])
+
+        # only the first two matches are rated
+        rating_calculators.update_trueskill_ratings_from_arrays(mus, sigmas, winners, losers, 0, 2)
+
+        rating_calculators.update_trueskill_ratings(self.region_id, winner=self.player_1, loser=self.player_2)
+        player_3 = Player('mango', ['mango'], {'norcal': TrueskillRating()}, False)
+        rating_calculators.update_trueskill_ratings(self.region_id, winner=player_3, loser=self.player_1)
+
+        for i, player in enumerate([self.player_1, self.player_2, player_3]):
+            self.assertAlmostEquals(mus[i], player.ratings[self.region_id].trueskill_rating.mu, delta=1e-9)
+            self.assertAlmostEquals(sigmas[i], player.ratings[self.region_id].trueskill_rating.sigma, delta=1e-9)
+
+    def test_update_trueskill_ratings_from_arrays_matches_rate_1vs1(self):
+        random.seed(0)
+        num_players = 20
+        mus = array('d', [25.0] * num_players)
+        sigmas = array('d', [25.0 / 3] * num_players)
+        ratings = [trueskill.Rating()] * num_players
+        winners = array('i')
+        losers = array('i')
+        for i in xrange(2000):
+            winner, loser = random.sample(xrange(num_players), 2)
+            # favor one direction so ratings spread out and upsets get big
+            if random.random() < .7:
+                winner, loser = min(winner, loser), max(winner, loser)
+            winners.append(winner)
+            losers.append(loser)
+
+        rating_calculators.update_trueskill_ratings_from_arrays(mus, sigmas, winners, losers, 0, len(winners))
+        for winner, loser in zip(winners, losers):
+            ratings[winner], ratings[loser] = trueskill.rate_1vs1(ratings[winner], ratings[loser])
+
+        for i in xrange(num_players):
+            self.assertAlmostEquals(mus[i], ratings[i].mu, delta=1e-9)
+            self.assertAlmostEquals(sigmas[i], ratings[i].sigma, delta=1e-9)
+
+    def test_update_trueskill_ratings_from_arrays_other_backend(self):
+        mus = array('d', [25.0] * 2)
+        sigmas = array('d', [25.0 / 3] * 2)
+        cdf, pdf, ppf = trueskill.backends.choose_backend(None)
+        env = trueskill.TrueSkill(backend=(cdf, pdf, ppf))
+
+        with patch('trueskill.global_env', return_value=env), patch('trueskill.rate_1vs1', wraps=trueskill.rate_1vs1) as rate_1vs1:
+            rating_calculators.update_trueskill_ratings_from_arrays(mus, sigmas, array('i', [0]), array('i', [1]), 0, 1)
+            self.assertEquals(rate_1vs1.call_count, 1)
+
+        self.assertAlmostEquals(mus[0], trueskill.rate_1vs1(trueskill.Rating(), trueskill.Rating())[0].mu, delta=1e-9)
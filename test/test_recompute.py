@@ -0,0 +1,85 @@
+import unittest
+import mongomock
+from dao import Dao
+from bson.objectid import ObjectId
+from model import *
+from datetime import datetime, timedelta
+from recompute import RecomputeScheduler
+from mock import patch
+import rankings
+
+class TestRecomputeScheduler(unittest.TestCase):
+    def setUp(self):
+        self.mongo_client = mongomock.MongoClient()
+        Dao.insert_region(Region('norcal', 'Norcal'), self.mongo_client)
+        Dao.insert_region(Region('texas', 'Texas'), self.mongo_client)
+        self.dao = Dao('norcal', mongo_client=self.mongo_client)
+
+        self.player_1 = Player('gaR', ['gar'], {}, ['norcal'], id=ObjectId())
+        self.player_2 = Player('sfat', ['sfat'], {}, ['norcal'], id=ObjectId())
+        self.dao.insert_player(self.player_1)
+        self.dao.insert_player(self.player_2)
+
+        self.dao.insert_tournament(Tournament(
+            'tio', 'raw', datetime.now() - timedelta(days=1), 'tournament',
+            [self.player_1.id, self.player_2.id],
+            [MatchResult(winner=self.player_1.id, loser=self.player_2.id)],
+            ['norcal']))
+
+        self.scheduler = RecomputeScheduler(self.mongo_client, debounce_seconds=60)
+
+    def test_run_once(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'], since=datetime.now() - timedelta(days=1))
+        now = datetime.now() + timedelta(seconds=61)
+
+        self.assertEquals(self.scheduler.run_once(now=now), ['norcal'])
+
+        ranking = self.dao.get_latest_ranking()
+        self.assertEquals(ranking.time, now)
+        self.assertEquals([r.player for r in ranking.ranking], [self.player_1.id, self.player_2.id])
+        self.assertEquals(Dao.get_dirty_regions(self.mongo_client), [])
+
+    @patch('recompute.rankings.generate_ranking')
+    def test_run_once_without_since(self, mock_generate_ranking):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'])
+
+        self.assertEquals(self.scheduler.run_once(now=datetime.now() + timedelta(seconds=61)), ['norcal'])
+
+        # resumed from the latest checkpoint
+        self.assertEquals(mock_generate_ranking.call_args[1]['since'], datetime.max)
+
+    def test_run_once_debounced(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal'])
+
+        # edited too recently
+        self.assertEquals(self.scheduler.run_once(now=datetime.now() + timedelta(seconds=30)), [])
+        self.assertEquals(len(Dao.get_dirty_regions(self.mongo_client)), 1)
+
+    def test_run_once_only_dirty_regions(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['texas'])
+
+        self.assertEquals(self.scheduler.run_once(now=datetime.now() + timedelta(seconds=61)), ['texas'])
+        self.assertEquals(self.dao.rankings_col.find({'region': 'norcal'}).count(), 0)
+
+    @patch('recompute.logger')
+    def test_run_once_failed_region(self, mock_logger):
+        Dao.mark_regions_dirty(self.mongo_client, ['norcal', 'texas'])
+        generate_ranking = rankings.generate_ranking
+
+        def fail_for_norcal(dao, **kwargs):
+            if dao.region_id == 'norcal':
+                raise ValueError('bad tournament')
+            generate_ranking(dao, **kwargs)
+
+        with patch('recompute.rankings.generate_ranking', side_effect=fail_for_norcal):
+            self.assertEquals(self.scheduler.run_once(now=datetime.now() + timedelta(seconds=61)), ['texas'])
+
+        # norcal is left dirty to be retried
+        self.assertTrue(mock_logger.exception.called)
+        self.assertEquals([d.region for d in Dao.get_dirty_regions(self.mongo_client)], ['norcal'])
+
+    def test_run_once_deleted_region(self):
+        Dao.mark_regions_dirty(self.mongo_client, ['nyc'])
+
+        self.assertEquals(self.scheduler.run_once(now=datetime.now() + timedelta(seconds=61)), [])
+        self.assertEquals(Dao.get_dirty_regions(self.mongo_client), [])
@@ -0,0 +1,110 @@
+import unittest
+from bson.objectid import ObjectId
+from datetime import datetime
+from replay import ColumnarReplay
+
+class TestColumnarReplay(unittest.TestCase):
+    def setUp(self):
+        self.player_1_id = ObjectId()
+        self.player_2_id = ObjectId()
+        self.player_3_id = ObjectId()
+
+        self.tournament_1 = {
+            '_id': ObjectId(),
+            'name': 'tournament 1',
+            'date': datetime(2013, 10, 10),
+            'players': [self.player_1_id, self.player_2_id, self.player_3_id],
+            'matches': [
+                {'winner': self.player_1_id, 'loser': self.player_2_id},
+                {'winner': self.player_3_id, 'loser': self.player_1_id}
+            ]
+        }
+        self.tournament_2 = {
+            '_id': ObjectId(),
+            'name': 'tournament 2',
+            'date': datetime(2013, 10, 16),
+            'players': [self.player_2_id, self.player_3_id],
+            'matches': [
+                {'winner': self.player_2_id, 'loser': self.player_3_id}
+            ]
+        }
+
+        self.replay = ColumnarReplay.from_tournaments([self.tournament_1, self.tournament_2])
+
+    def test_player_indexes_are_dense(self):
+        self.assertEquals(self.replay.player_ids, [self.player_1_id, self.player_2_id, self.player_3_id])
+        self.assertEquals(self.replay.player_indexes,
+                          {self.player_1_id: 0, self.player_2_id: 1, self.player_3_id: 2})
+        self.assertEquals(self.replay.get_num_players(), 3)
+
+    def test_matches(self):
+        self.assertEquals(list(self.replay.winners), [0, 2, 1])
+        self.assertEquals(list(self.replay.losers), [1, 0, 2])
+        self.assertEquals(list(self.replay.match_offsets), [0, 2, 3])
+        self.assertEquals(self.replay.get_num_matches(), 3)
+
+    def test_get_match_range(self):
+        self.assertEquals(self.replay.get_match_range(0), (0, 2))
+        self.assertEquals(self.replay.get_match_range(1), (2, 3))
+
+    def test_get_tournament_players(self):
+        self.assertEquals(list(self.replay.get_tournament_players(0)), [0, 1, 2])
+        self.assertEquals(list(self.replay.get_tournament_players(1)), [1, 2])
+
+    def test_tournaments(self):
+        self.assertEquals(self.replay.tournament_ids, [self.tournament_1['_id'], self.tournament_2['_id']])
+        self.assertEquals(self.replay.tournament_names, ['tournament 1', 'tournament 2'])
+        self.assertEquals(self.replay.tournament_dates, [datetime(2013, 10, 10), datetime(2013, 10, 16)])
+        self.assertEquals(self.replay.get_num_tournaments(), 2)
+
+    def test_merge(self):
+        player_4_id = ObjectId()
+        tournament_3 = {
+            '_id': ObjectId(),
+            'name': 'tournament 3',
+            'date': datetime(2013, 10, 12),
+            'players': [player_4_id, self.player_3_id],
+            'matches': [
+                {'winner': player_4_id, 'loser': self.player_3_id}
+            ]
+        }
+        other_replay = ColumnarReplay.from_tournaments([tournament_3, self.tournament_2])
+
+        merged = ColumnarReplay.merge([self.replay, other_replay])
+
+        # tournament 2 is in both replays but only merged once
+        self.assertEquals(merged.tournament_ids, [self.tournament_1['_id'], tournament_3['_id'], self.tournament_2['_id']])
+        self.assertEquals(merged.tournament_names, ['tournament 1', 'tournament 3', 'tournament 2'])
+        self.assertEquals(merged.player_ids, [self.player_1_id, self.player_2_id, self.player_3_id, player_4_id])
+        self.assertEquals(list(merged.winners), [0, 2, 3, 1])
+        self.assertEquals(list(merged.losers), [1, 0, 2, 2])
+        self.assertEquals(list(merged.match_offsets), [0, 2, 3, 4])
+        self.assertEquals(list(merged.get_tournament_players(1)), [3, 2])
+
+    def test_merge_nothing(self):
+        self.assertEquals(ColumnarReplay.merge([]).get_num_tournaments(), 0)
+
+    def test_get_rated_player_indexes(self):
+        replay = ColumnarReplay.from_tournaments([{
+            '_id': ObjectId(),
+            'date': datetime(2013, 10, 10),
+            'players': [self.player_1_id, self.player_2_id, self.player_3_id],
+            'matches': [{'winner': self.player_1_id, 'loser': self.player_2_id}]
+        }])
+
+        # player 3 entered but never played a match
+        self.assertEquals(replay.get_rated_player_indexes(), set([0, 1]))
+
+    def test_get_tournament_counts(self):
+        self.assertEquals(self.replay.get_tournament_counts(),
+                          {self.player_1_id: 1, self.player_2_id: 2, self.player_3_id: 2})
+        self.assertEquals(self.replay.get_tournament_counts(start=datetime(2013, 10, 16)),
+                          {self.player_2_id: 1, self.player_3_id: 1})
+        self.assertEquals(self.replay.get_tournament_counts(start=datetime(2013, 10, 17)), {})
+
+    def test_empty(self):
+        replay = ColumnarReplay.from_tournaments([])
+
+        self.assertEquals(replay.get_num_tournaments(), 0)
+        self.assertEquals(replay.get_num_matches(), 0)
+        self.assertEquals(replay.get_rated_player_indexes(), set())
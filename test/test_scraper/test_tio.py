@@ -2,6 +2,7 @@ import unittest
 from scraper.tio import TioScraper
 from datetime import datetime
 from model import MatchResult
+from mock import patch
 
 # SFAT and Silentwolf have spaces before and after
 FILEPATH = "test/test_scraper/data/1.tio"
@@ -67,3 +68,58 @@ class TestTioScraper(unittest.TestCase):
         self.assertEquals(len(players), 59)
         self.assertTrue('MIOM|SFAT' in players)
         self.assertTrue('GC|silent wolf' in players)
+
+    def test_get_bracket_names(self):
+        self.assertEquals(self.scraper.get_bracket_names(), ['Doubles', 'Singles'])
+
+    def test_get_matches_by_bracket(self):
+        matches_by_bracket = self.scraper.get_matches_by_bracket()
+        self.assertEquals(set(matches_by_bracket.keys()), set(['Doubles', 'Singles']))
+        self.assertEquals(matches_by_bracket['Singles'], self.scraper.get_matches())
+        self.assertEquals(len(matches_by_bracket['Doubles']), 21)
+
+    def test_get_matches_by_bracket_subset(self):
+        matches_by_bracket = self.scraper.get_matches_by_bracket(bracket_names=['Singles'])
+        self.assertEquals(matches_by_bracket.keys(), ['Singles'])
+        self.assertEquals(len(matches_by_bracket['Singles']), 117)
+
+    def test_get_matches_by_bracket_invalid_bracket_name(self):
+        with self.assertRaises(ValueError):
+            self.scraper.get_matches_by_bracket(bracket_names=['invalid bracket name'])
+
+    def test_for_bracket(self):
+        doubles_scraper = self.scraper.for_bracket('Doubles')
+
+        # the parsed document is shared, not re-parsed
+        self.assertIs(doubles_scraper.soup, self.scraper.soup)
+        self.assertIs(doubles_scraper.player_map, self.scraper.player_map)
+
+        self.assertEquals(doubles_scraper.bracket_name, 'Doubles')
+        self.assertEquals(len(doubles_scraper.get_matches()), 21)
+        self.assertEquals(doubles_scraper.get_name(), self.scraper.get_name())
+        self.assertEquals(doubles_scraper.get_date(), self.scraper.get_date())
+
+        # the original scraper is unaffected
+        self.assertEquals(self.scraper.bracket_name, BRACKET_NAME)
+        self.assertEquals(len(self.scraper.get_matches()), 117)
+
+    def test_get_scrapers_for_brackets(self):
+        scrapers = self.scraper.get_scrapers_for_brackets()
+        self.assertEquals([s.bracket_name for s in scrapers], ['Doubles', 'Singles'])
+        self.assertEquals(len(scrapers[0].get_matches()), 21)
+        self.assertEquals(len(scrapers[1].get_matches()), 117)
+
+        scrapers = self.scraper.get_scrapers_for_brackets(bracket_names=['Singles'])
+        self.assertEquals([s.bracket_name for s in scrapers], ['Singles'])
+
+    def test_get_scrapers_for_brackets_walks_brackets_once(self):
+        with patch.object(self.scraper.soup, 'find_all', wraps=self.scraper.soup.find_all) as find_all:
+            scrapers = self.scraper.get_scrapers_for_brackets()
+            for scraper in scrapers:
+                scraper.get_players()
+
+        self.assertEquals([c[0][0] for c in find_all.call_args_list].count('Game'), 1)
+
+    def test_get_scrapers_for_brackets_invalid_bracket_name(self):
+        with self.assertRaises(ValueError):
+            self.scraper.get_scrapers_for_brackets(bracket_names=['Singles', 'invalid bracket name'])
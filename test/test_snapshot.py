@@ -0,0 +1,170 @@
+import unittest
+import mongomock
+from dao import Dao
+from bson.objectid import ObjectId
+from model import *
+from datetime import datetime
+from snapshot import RegionSnapshot, SnapshotDao, SnapshotStore
+from cache import RegionVersions
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.mongo_client = mongomock.MongoClient()
+        Dao.insert_region(Region('norcal', 'Norcal'), self.mongo_client)
+        Dao.insert_region(Region('texas', 'Texas'), self.mongo_client)
+        self.dao = Dao('norcal', mongo_client=self.mongo_client)
+
+        self.player_1 = Player('gaR', ['gar', 'garr'], {}, ['norcal'], id=ObjectId())
+        self.player_2 = Player('sfat', ['sfat'], {}, ['norcal'], id=ObjectId())
+        self.player_3 = Player('shroomed', ['shroomed'], {}, ['texas'], id=ObjectId())
+        self.player_4 = Player('pewpewu', ['pewpewu'], {}, ['texas'], id=ObjectId())
+        for player in (self.player_1, self.player_2, self.player_3, self.player_4):
+            self.dao.insert_player(player)
+
+        # player 1 travelled to texas for tournament 2, tournament 3 has no norcal players
+        self.tournament_1 = Tournament(
+            'tio', 'raw', datetime(2014, 9, 1), 'tournament 1', [self.player_1.id, self.player_2.id],
+            [MatchResult(winner=self.player_1.id, loser=self.player_2.id)], ['norcal'], id=ObjectId())
+        self.tournament_2 = Tournament(
+            'challonge', 'raw', datetime(2014, 10, 1), 'tournament 2', [self.player_1.id, self.player_3.id],
+            [MatchResult(winner=self.player_1.id, loser=self.player_3.id),
+             MatchResult(winner=self.player_3.id, loser=self.player_1.id)], ['texas'], id=ObjectId())
+        self.tournament_3 = Tournament(
+            'tio', 'raw', datetime(2014, 11, 1), 'tournament 3', [self.player_3.id, self.player_4.id],
+            [MatchResult(winner=self.player_3.id, loser=self.player_4.id)], ['texas'], id=ObjectId())
+        for tournament in (self.tournament_1, self.tournament_2, self.tournament_3):
+            self.dao.insert_tournament(tournament)
+
+        self.dao.insert_ranking(Ranking('norcal', datetime(2014, 11, 2), [self.tournament_1.id],
+                                        [RankingEntry(1, self.player_1.id, 30.0)]))
+
+        self.snapshot = RegionSnapshot.load(self.dao)
+        self.snapshot_dao = SnapshotDao(self.snapshot, lambda: self.dao)
+
+    def test_load(self):
+        self.assertEquals(set(self.snapshot.players.keys()), set([self.player_1.id, self.player_2.id]))
+        self.assertEquals(self.snapshot.replay.tournament_ids, [self.tournament_1.id, self.tournament_2.id])
+        self.assertEquals(self.snapshot.ranking.tournaments, [self.tournament_1.id])
+
+    def test_load_composite_region(self):
+        Dao.insert_region(Region('west', 'West', members=['norcal', 'texas']), self.mongo_client)
+        dao = Dao('west', mongo_client=self.mongo_client)
+        snapshot_dao = SnapshotDao(RegionSnapshot.load(dao), lambda: dao)
+
+        self.assertEquals(snapshot_dao.get_all_players(), dao.get_all_players())
+        self.assertEquals(len(snapshot_dao.get_all_players()), 4)
+        self.assertEquals(snapshot_dao.get_players_page(2), dao.get_players_page(2))
+        self.assertEquals(snapshot_dao.get_player_by_alias('shroomed'), self.player_3)
+
+    def test_get_player_by_id(self):
+        self.assertEquals(self.snapshot_dao.get_player_by_id(self.player_1.id), self.player_1)
+
+        # out of region players come from mongo
+        self.assertEquals(self.snapshot_dao.get_player_by_id(self.player_3.id), self.player_3)
+        self.assertIsNone(self.snapshot_dao.get_player_by_id(ObjectId()))
+
+    def test_get_players_by_ids(self):
+        players = self.snapshot_dao.get_players_by_ids([self.player_1.id, self.player_3.id])
+        self.assertEquals(set(p.id for p in players), set([self.player_1.id, self.player_3.id]))
+
+    def test_get_player_by_alias(self):
+        self.assertEquals(self.snapshot_dao.get_player_by_alias('gaRR'), self.dao.get_player_by_alias('gaRR'))
+        self.assertIsNone(self.snapshot_dao.get_player_by_alias('shroomed'))
+
+    def test_get_all_players(self):
+        self.assertEquals(self.snapshot_dao.get_all_players(), self.dao.get_all_players())
+        self.assertEquals(self.snapshot_dao.get_all_players(all_regions=True), self.dao.get_all_players(all_regions=True))
+
+    def test_get_players_page(self):
+        first_page = self.snapshot_dao.get_players_page(1)
+        self.assertEquals(first_page, self.dao.get_players_page(1))
+
+        after = (first_page[0].name, first_page[0].id)
+        self.assertEquals(self.snapshot_dao.get_players_page(1, after=after), self.dao.get_players_page(1, after=after))
+
+    def test_get_tournament_by_id(self):
+        tournament = self.snapshot_dao.get_tournament_by_id(self.tournament_2.id)
+        expected_json_dict = self.dao.get_tournament_by_id(self.tournament_2.id).get_json_dict()
+        del expected_json_dict['raw']
+        del expected_json_dict['raw_id']
+
+        json_dict = tournament.get_json_dict()
+        del json_dict['raw']
+        self.assertEquals(json_dict, expected_json_dict)
+
+        # not in the snapshot
+        self.assertEquals(self.snapshot_dao.get_tournament_by_id(self.tournament_3.id).name, 'tournament 3')
+
+    def test_get_tournament_summaries(self):
+        self.assertEquals(self.snapshot_dao.get_tournament_summaries(regions=['norcal']),
+                          self.dao.get_tournament_summaries(regions=['norcal']))
+        self.assertEquals(self.snapshot_dao.get_tournament_summaries(regions=['norcal'], limit=1),
+                          self.dao.get_tournament_summaries(regions=['norcal'], limit=1))
+        self.assertEquals(
+            self.snapshot_dao.get_tournament_summaries(regions=['norcal'], before=datetime(2014, 9, 1), before_id=self.tournament_1.id),
+            self.dao.get_tournament_summaries(regions=['norcal'], before=datetime(2014, 9, 1), before_id=self.tournament_1.id))
+
+        # texas' tournaments aren't all in the snapshot
+        self.assertEquals(self.snapshot_dao.get_tournament_summaries(regions=['texas']),
+                          self.dao.get_tournament_summaries(regions=['texas']))
+
+    def test_iter_all_tournaments(self):
+        self.assertEquals(
+            [t.id for t in self.snapshot_dao.iter_all_tournaments(players=[self.player_1])],
+            [t.id for t in self.dao.iter_all_tournaments(players=[self.player_1])])
+
+        starting_at = (self.tournament_2.date, self.tournament_2.id)
+        self.assertEquals(
+            [t.id for t in self.snapshot_dao.iter_all_tournaments(players=[self.player_1], starting_at=starting_at)],
+            [self.tournament_2.id])
+
+        # player 3's tournaments aren't all in the snapshot
+        self.assertEquals(
+            [t.id for t in self.snapshot_dao.iter_all_tournaments(players=[self.player_3])],
+            [self.tournament_2.id, self.tournament_3.id])
+
+    def test_get_head_to_head_matches(self):
+        matches = self.snapshot_dao.get_head_to_head_matches(self.player_3, self.player_1)
+        expected_matches = self.dao.get_head_to_head_matches(self.player_3, self.player_1)
+
+        self.assertEquals(matches, expected_matches)
+        self.assertEquals(len(matches), 2)
+
+    def test_get_latest_ranking(self):
+        self.assertEquals(self.snapshot_dao.get_latest_ranking().get_json_dict(),
+                          self.dao.get_latest_ranking().get_json_dict())
+
+    def test_fallback(self):
+        self.assertEquals(self.snapshot_dao.get_seasons(), [])
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.mongo_client = mongomock.MongoClient()
+        Dao.insert_region(Region('norcal', 'Norcal'), self.mongo_client)
+        self.dao = Dao('norcal', mongo_client=self.mongo_client)
+        self.dao.insert_player(Player('gaR', ['gar'], {}, ['norcal'], id=ObjectId()))
+
+        self.region_versions = RegionVersions(5)
+        self.store = SnapshotStore(self.region_versions)
+
+    def test_get_snapshot(self):
+        snapshot = self.store.get_snapshot(self.mongo_client, 'norcal', now=0)
+        self.assertEquals(len(snapshot.players), 1)
+        self.assertIs(self.store.get_snapshot(self.mongo_client, 'norcal', now=10), snapshot)
+
+    def test_get_snapshot_reloads_after_edit(self):
+        snapshot = self.store.get_snapshot(self.mongo_client, 'norcal', now=0)
+        self.dao.insert_player(Player('sfat', ['sfat'], {}, ['norcal'], id=ObjectId()))
+
+        # not checked again yet
+        self.assertIs(self.store.get_snapshot(self.mongo_client, 'norcal', now=4), snapshot)
+
+        new_snapshot = self.store.get_snapshot(self.mongo_client, 'norcal', now=5)
+        self.assertEquals(len(new_snapshot.players), 2)
+
+    def test_expire(self):
+        snapshot = self.store.get_snapshot(self.mongo_client, 'norcal', now=0)
+        self.dao.insert_player(Player('sfat', ['sfat'], {}, ['norcal'], id=ObjectId()))
+        self.region_versions.expire()
+
+        self.assertEquals(len(self.store.get_snapshot(self.mongo_client, 'norcal', now=1).players), 2)